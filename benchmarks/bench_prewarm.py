@@ -0,0 +1,46 @@
+"""
+对比连接预热前后，从发出请求到收到首字节的耗时
+
+用法（在项目根目录下）：
+    python -m benchmarks.bench_prewarm [次数] [地址]
+"""
+import statistics
+import sys
+import time
+
+import requests
+
+from utils.http_client import api_url
+
+
+def time_to_first_byte(session: requests.Session, url: str) -> float:
+    """
+    测量一次请求从发出到收到响应头的耗时（毫秒）
+    """
+    start = time.perf_counter()
+    with session.head(url, timeout=5, stream=True):
+        return (time.perf_counter() - start) * 1000
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    url = sys.argv[2] if len(sys.argv) > 2 else api_url("/")
+
+    cold, warm = [], []
+    for _ in range(rounds):
+        # 未预热：每次使用新的 Session，必须重新握手
+        with requests.Session() as session:
+            cold.append(time_to_first_byte(session, url))
+
+        # 预热：先建立连接，再测量第二次请求
+        with requests.Session() as session:
+            session.head(url, timeout=5)
+            warm.append(time_to_first_byte(session, url))
+
+    for name, samples in (("未预热", cold), ("已预热", warm)):
+        print(f"{name}: 中位数 {statistics.median(samples):.1f}ms, "
+              f"最小 {min(samples):.1f}ms, 最大 {max(samples):.1f}ms ({rounds} 次)")
+
+
+if __name__ == "__main__":
+    main()
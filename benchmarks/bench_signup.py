@@ -0,0 +1,203 @@
+"""
+端到端报名基准测试
+
+在独立的子进程中启动模拟服务器（避免与报名代码争抢 GIL），让 N 个用户 × M 个活动走完整的 UserDataManager.sign_up 流程，统计：
+- 触发偏差：每个（用户, 活动）的第一个报名请求到达服务器的时刻 - 报名开放时刻
+- 成功耗时：报名成功的请求到达服务器的时刻 - 报名开放时刻
+- 发出延迟：每个（用户, 活动）的第一个报名请求在客户端实际发出的时刻 - 预定时刻，不受模拟服务器处理能力影响
+- 每次成功消耗的报名请求数、峰值线程数、CPU 时间
+结果保存为 JSON，便于在不同提交之间对比。
+
+用法（在项目根目录下）：
+    python -m benchmarks.bench_signup --users 20 --activities 3 --seats 10
+结果默认写入 benchmarks/results/bench_result.json，可以用 --output 指定其他文件。
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from loguru import logger
+
+from utils.metrics import nearest_rank
+from utils.mock_server import MockPUServer, MockActivity, CODE_OK, CODE_ALREADY_JOINED
+
+# 基准测试结果的默认目录
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def summarize(values: List[float]) -> Dict:
+    """
+    :return: 以毫秒表示的 p50/p95/p99 与最大值
+    """
+    ms = sorted(v * 1000 for v in values)
+    return {"count": len(ms), "p50_ms": nearest_rank(ms, 50), "p95_ms": nearest_rank(ms, 95),
+            "p99_ms": nearest_rank(ms, 99), "max_ms": ms[-1] if ms else None}
+
+
+class ThreadSampler:
+    """
+    定时采样线程数，记录峰值
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def children_cpu_time() -> float:
+    """
+    :return: 已结束的子进程消耗的 CPU 时间（多进程报名时），不支持的平台返回 0
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _serve_mock(activities: int, seats: int, open_at: float, options: Dict, conn) -> None:
+    """
+    子进程：运行模拟服务器，把地址发回父进程，收到停止指令后发回全部报名记录
+    """
+    server = MockPUServer([MockActivity(id=i, join_start=open_at, seats=seats) for i in range(1, activities + 1)],
+                          **options).start()
+    conn.send(server.base_url)
+    conn.recv()
+    server.stop()
+    conn.send(server.joins)
+
+
+def run(users: int, activities: int, seats: int, open_in: float,
+        latency_ms: float, jitter_ms: float, error_rate: float, strategy: str | None = None,
+        processes: int | None = None, slow_rate: float = 0, slow_ms: float = 0) -> Dict:
+    # joinStartTime 只精确到秒，开放时刻取整秒
+    open_at = math.ceil(time.time() + open_in)
+    conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.get_context("spawn").Process(
+        target=_serve_mock, args=(activities, seats, open_at,
+                                  {"latency_ms": latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate,
+                                   "slow_rate": slow_rate, "slow_ms": slow_ms},
+                                  child_conn),
+        daemon=True)
+    server.start()
+
+    import config
+    import utils.http_client as http_client
+    http_client.API_BASE_URL = conn.recv()
+    if strategy:
+        config.BURST_STRATEGY = strategy
+    if processes:
+        config.SIGNUP_PROCESSES = processes
+    from utils.user_data_manager import UserDataManager
+    from utils.metrics import metrics, FIRE_DELAY
+
+    with tempfile.TemporaryDirectory() as tmp:
+        user_file = os.path.join(tmp, "user_data.json")
+        # 测试用户不写入真实的状态数据库
+        config.STATE_DB_FILE = os.path.join(tmp, "state.db")
+        with open(user_file, "w", encoding="utf-8") as f:
+            json.dump([{"userName": f"bench{u}", "password": "bench", "sid": 1,
+                        "activity_ids": list(range(1, activities + 1))} for u in range(users)], f)
+
+        manager = UserDataManager(user_file)
+        cpu_start = time.process_time() + children_cpu_time()
+        wall_start = time.perf_counter()
+        with ThreadSampler() as sampler:
+            manager.sign_up()
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() + children_cpu_time() - cpu_start
+    conn.send("stop")
+    joins = conn.recv()
+    server.join()
+
+    first_arrival: Dict[tuple, float] = {}
+    success_arrival: Dict[tuple, float] = {}
+    for record in joins:
+        key = (record.user, record.activity_id)
+        first_arrival[key] = min(first_arrival.get(key, record.arrival), record.arrival)
+        if record.code in (CODE_OK, CODE_ALREADY_JOINED) and key not in success_arrival:
+            success_arrival[key] = record.arrival
+
+    successes = sum(1 for record in joins if record.code == CODE_OK)
+    metrics_summary = metrics.summary()
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {"users": users, "activities": activities, "seats": seats, "latency_ms": latency_ms,
+                   "jitter_ms": jitter_ms, "error_rate": error_rate, "slow_rate": slow_rate, "slow_ms": slow_ms,
+                   "strategy": config.BURST_STRATEGY,
+                   "processes": config.SIGNUP_PROCESSES},
+        "fire_offset": summarize([t - open_at for t in first_arrival.values()]),
+        "send_delay": {k: v * 1000 if isinstance(v, float) else v
+                       for k, v in metrics_summary["histograms"].get(FIRE_DELAY, [{}])[0].items() if k != "labels"},
+        "time_to_success": summarize([t - open_at for t in success_arrival.values()]),
+        "join_requests": len(joins),
+        "successes": successes,
+        "requests_per_success": len(joins) / successes if successes else None,
+        "peak_threads": sampler.peak,
+        "cpu_seconds": cpu,
+        "wall_seconds": wall,
+        "metrics": metrics_summary,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端报名基准测试")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--activities", type=int, default=2)
+    parser.add_argument("--seats", type=int, default=5)
+    parser.add_argument("--open-in", type=float, default=20, help="多少秒后开放报名，需要大于时间同步耗时")
+    parser.add_argument("--latency", type=float, default=10, help="模拟服务器处理延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=5, help="延迟抖动（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--slow-rate", type=float, default=0, help="请求随机变慢的概率，模拟长尾延迟")
+    parser.add_argument("--slow", type=float, default=0, help="变慢的请求额外的延迟（毫秒）")
+    parser.add_argument("--strategy", help="报名节奏策略，默认取 config.BURST_STRATEGY")
+    parser.add_argument("--processes", type=int, help="报名进程数，默认取 config.SIGNUP_PROCESSES")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "bench_result.json"),
+                        help="结果 JSON 文件，默认写入 benchmarks/results/（不纳入版本管理）")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    result = run(args.users, args.activities, args.seats, args.open_in, args.latency, args.jitter, args.error_rate,
+                 args.strategy, args.processes, args.slow_rate, args.slow)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,4 +3,118 @@
 """
 
 # 是否开启邮件通知,默认为True
-ENABLE_EMAIL_NOTIFICATION = True # True or False
\ No newline at end of file
+ENABLE_EMAIL_NOTIFICATION = True # True or False
+
+# PU 接口地址，也可以用环境变量 PU_API_BASE_URL 覆盖（例如指向 python -m utils.mock_server 启动的本地模拟服务器）
+API_BASE_URL = "https://apis.pocketuni.net"
+
+# 进程内共享连接池的最大连接数
+HTTP_POOL_SIZE = 32
+
+# 是否在报名开始前预热连接，预热后首轮报名请求不需要再做 TCP+TLS 握手
+ENABLE_CONNECTION_PREWARM = True
+
+# 预热的连接数，建议不小于报名线程数
+PREWARM_CONNECTIONS = 8
+
+# 在报名开始前多少秒进行最后一次预热（服务器会关闭长时间空闲的连接，不宜过早）
+PREWARM_LEAD_SECONDS = 3
+
+# 报名引擎："thread" 为多线程引擎；"asyncio" 为协程引擎（需要先 pip install aiohttp），
+# 所有报名请求在同一个事件循环中发送，线程更少、节奏更精确
+SIGNUP_ENGINE = "thread"
+
+# 获取活动列表时的最大并发请求数
+DISCOVERY_MAX_WORKERS = 4
+
+# 获取活动列表时每页的活动数，调大可以减少翻页请求
+ACTIVITY_LIST_PAGE_SIZE = 20
+
+# 已见活动索引文件，记录每个活动上次获取的详细信息和筛选结果，再次获取活动列表时只请求新出现或有变化的活动，留空则不保存
+ACTIVITY_INDEX_FILE = "activity_index.json"
+
+# 索引中的活动详细信息超过多少秒后重新获取（即使活动列表中的条目没有变化）
+ACTIVITY_INDEX_REFRESH = 3600
+
+# 超过多少天没有在活动列表中出现的活动从索引中删除
+ACTIVITY_INDEX_RETENTION_DAYS = 7
+
+# 活动信息缓存有效期（秒），所有用户共享同一份缓存
+ACTIVITY_INFO_CACHE_TTL = 60
+
+# 活动信息缓存最多保存的活动数
+ACTIVITY_INFO_CACHE_SIZE = 1024
+
+# 在自动计算的提前量（单程网络延迟）之外额外提前发出报名请求的毫秒数，可以为负数
+FIRE_EXTRA_ADVANCE_MS = 0
+
+# 距离上次时间同步超过多少小时后重新同步（长时间运行时本机单调时钟与服务器时钟会逐渐漂移），在报名前检查 token 时和常驻模式下检查
+CLOCK_RESYNC_HOURS = 6
+
+# 调度器执行任务（确认开始时间、刷新token、报名）的线程数
+SCHEDULER_MAX_WORKERS = 32
+
+# 请求耗时等统计数据的导出目录，每次运行结束后写入 Prometheus 文本文件 pu_signup.prom 和本次运行的 JSON 汇总，留空则不导出
+METRICS_DIR = "metrics"
+
+# 报名节奏策略："adaptive" 根据服务器响应调整（未开始时加密请求，已满或已结束立即停止，被限流或服务器出错时退避）；
+# "fixed" 为原来的三段式固定节奏（5 个线程立即启动，15 个每 0.4 秒一个，45 个每 0.8 秒一个）
+BURST_STRATEGY = "adaptive"
+
+# 按活动指定报名策略，例如 {"123456": "fixed"}，未指定的活动使用 BURST_STRATEGY
+ACTIVITY_BURST_STRATEGIES = {}
+
+# 报名使用的进程数，大于 1 时把用户平均分到多个子进程中报名，每个进程有自己的连接池和调度器，适合用户很多的情况
+SIGNUP_PROCESSES = 1
+
+# 多进程报名时是否把每个子进程绑定到不同的 CPU 核心（仅 Linux 支持）
+SIGNUP_CPU_AFFINITY = False
+
+# 常驻模式：不再询问任何问题，一直运行并自动加载 user_data.json 的修改（新增或删除用户、活动），也可以用 python main.py --daemon 开启
+DAEMON_MODE = False
+
+# 常驻模式下检查 user_data.json 是否被修改的间隔（秒）
+DAEMON_POLL_SECONDS = 10
+
+# 常驻模式下自动发现新活动：按每个用户的筛选条件定期获取活动列表，把满足条件的新活动自动加入 user_data.json 中该用户的 activity_ids
+AUTO_DISCOVERY = False
+
+# 常驻模式下自动发现新活动的间隔（分钟）
+AUTO_DISCOVERY_INTERVAL_MINUTES = 30
+
+# 状态数据库（SQLite）文件：用户、要报名的活动、token、活动信息和每次报名的结果都保存在其中，写入只改动有变化的数据；
+# 第一次运行或 user_data.json 被修改后会自动合并导入 user_data.json。留空则仍然只使用 user_data.json
+STATE_DB_FILE = "pu_state.db"
+
+# 默认认为 token 的有效期（小时）。程序会记录 token 实际失效的时间，之后按观察到的有效期提前刷新
+TOKEN_DEFAULT_LIFETIME_HOURS = 6
+
+# token 距离过期不足多少秒时视为需要刷新
+TOKEN_REFRESH_MARGIN_SECONDS = 600
+
+# 启动时同时登录的用户数，用户很多时可以调大以加快启动
+STARTUP_LOGIN_WORKERS = 16
+
+# 全局限速：整个进程（所有用户、所有接口合计）每秒最多发送的请求数，服务器限流、出错或超时时自动降低，恢复正常后逐渐回升；0 表示不限速
+GOVERNOR_MAX_RATE = 200
+
+# 全局限速允许的瞬时请求数（令牌桶容量），报名开始的瞬间最多同时发出这么多请求
+GOVERNOR_BURST = 100
+
+# 各接口的限速 (每秒请求数, 瞬时请求数)：join 报名、info 活动信息、list 活动列表、login 登录；每秒请求数为 0 表示该接口不单独限速。
+# 全局限速不够用时报名请求优先，其次是登录，最后是获取活动信息和活动列表。
+# 获取活动列表的速度由 info、list 的预算决定，越大越快，同样封号或封ip的可能性也越大
+GOVERNOR_BUDGETS = {
+    "join": (200, 100),
+    "login": (50, 16),
+    "info": (10, 10),
+    "list": (5, 5),
+}
+
+# 报名请求对冲：一个报名请求超过最近报名耗时的该百分位数仍未返回时，用另一条连接再发一个相同的请求，取先返回的结果；0 表示不对冲
+JOIN_HEDGE_PERCENTILE = 90
+
+# 报名请求超时取最近报名耗时 p99 的多少倍，并限制在 [JOIN_TIMEOUT_MIN, JOIN_TIMEOUT_MAX] 秒之间；刚启动样本不足时使用 JOIN_TIMEOUT_MAX
+JOIN_TIMEOUT_FACTOR = 3
+JOIN_TIMEOUT_MIN = 1
+JOIN_TIMEOUT_MAX = 5
@@ -1,3 +1,4 @@
+import argparse
 import os
 import sys
 
@@ -26,10 +27,21 @@ logger.add(
 )
 
 def main():
+    parser = argparse.ArgumentParser(description="PU 口袋校园活动自动报名")
+    parser.add_argument("--daemon", action="store_true", help="常驻模式：不询问任何问题，持续运行并自动加载 user_data.json 的修改")
+    args = parser.parse_args()
+
     user_data_file = 'user_data.json'
-    user_manager = UserDataManager(user_data_file)
     os.makedirs("logs", exist_ok=True)
 
+    from config import DAEMON_MODE
+    if args.daemon or DAEMON_MODE:
+        from utils.daemon import SignupDaemon
+        SignupDaemon(user_data_file).run()
+        return
+
+    user_manager = UserDataManager(user_data_file)
+
     if not user_manager.user_datas:
         logger.warning("未找到用户数据文件或用户数据为空，将创建新的用户数据")
         user_manager.user_datas = []
@@ -45,6 +57,9 @@ def main():
         logger.info("新用户添加完成")
 
 
+    logger.info("正在登录所有用户")
+    user_manager.login_all()
+
     logger.info("开始处理用户数据")
     for user in user_manager.user_datas:
         logger.info(f"处理用户: {user['userName']}")
@@ -59,5 +74,10 @@ def main():
     user_manager.sign_up()
     logger.info("所有用户任务处理完成")
 
+    from utils.metrics import metrics
+    paths = metrics.export()
+    if paths:
+        logger.info(f"请求统计已导出: {', '.join(paths)}")
+
 if __name__ == "__main__":
     main()
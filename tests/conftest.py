@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+import config
+import utils.governor as governor
+import utils.http_client as http_client
+import utils.state_store as state_store
+import utils.tools as tools
+from utils.activity_cache import ActivityInfoCache
+from utils.mock_server import MockPUServer, MockActivity
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    """
+    每个测试使用独立的活动信息缓存和不限速的限速器，不读写状态数据库
+    """
+    monkeypatch.setattr(config, "STATE_DB_FILE", "")
+    monkeypatch.setattr(tools, "activity_info_cache", ActivityInfoCache())
+    monkeypatch.setattr(governor, "_governor", governor.Governor(0, 1, {}))
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """
+    使用临时目录中的状态数据库
+    """
+    monkeypatch.setattr(config, "STATE_DB_FILE", str(tmp_path / "state.db"))
+    monkeypatch.setattr(state_store, "_store", None)
+    yield state_store.get_state_store()
+    state_store._store.close()
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """
+    返回一个创建并启动模拟服务器的函数，接口地址指向该服务器，测试结束后自动关闭
+    """
+    servers = []
+
+    def start(count: int, **options) -> MockPUServer:
+        activities = [MockActivity(id=i, join_start=time.time() + 3600) for i in range(1, count + 1)]
+        server = MockPUServer(activities, **options).start()
+        servers.append(server)
+        monkeypatch.setattr(http_client, "API_BASE_URL", server.base_url)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
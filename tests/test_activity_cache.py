@@ -0,0 +1,97 @@
+"""
+活动信息缓存的在途请求共享：token 失效的错误不共享给其他用户，在途请求迟迟不返回时不一直等待
+"""
+import threading
+import time
+
+import pytest
+import requests
+
+from utils.activity_cache import ActivityInfoCache
+
+
+def http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"HTTP {status}", response=response)
+
+
+def run_with_waiter(cache, leader_fetch, waiter_fetch, wait=5):
+    """
+    先让 leader 的请求进入在途状态，再发起 waiter 的请求
+    :return: waiter 的结果或异常
+    """
+    started = threading.Event()
+
+    def leader():
+        def fetch():
+            started.set()
+            return leader_fetch()
+        try:
+            cache.get(1, fetch)
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    started.wait()
+    try:
+        return cache.get(1, waiter_fetch, wait=wait)
+    finally:
+        thread.join()
+
+
+def test_waiter_shares_leader_result():
+    cache = ActivityInfoCache()
+    calls = []
+
+    def slow_fetch():
+        time.sleep(0.2)
+        return {"id": 1}
+
+    assert run_with_waiter(cache, slow_fetch, lambda: calls.append(1) or {"id": 1}) == {"id": 1}
+    assert calls == []
+    assert cache.shared == 1
+
+
+def test_waiter_retries_with_own_token_after_leader_401():
+    cache = ActivityInfoCache()
+
+    def stale_token_fetch():
+        time.sleep(0.2)
+        raise http_error(401)
+
+    assert run_with_waiter(cache, stale_token_fetch, lambda: {"id": 1, "by": "waiter"}) == {"id": 1, "by": "waiter"}
+
+
+def test_waiter_shares_other_errors():
+    cache = ActivityInfoCache()
+
+    def server_error_fetch():
+        time.sleep(0.2)
+        raise http_error(500)
+
+    with pytest.raises(requests.HTTPError):
+        run_with_waiter(cache, server_error_fetch, lambda: {"id": 1})
+
+
+def test_waiter_stops_waiting_for_hung_leader():
+    cache = ActivityInfoCache()
+    release = threading.Event()
+    started = threading.Event()
+
+    def hung_fetch():
+        started.set()
+        release.wait(5)
+        return {"id": 1, "by": "leader"}
+
+    leader = threading.Thread(target=cache.get, args=(1, hung_fetch))
+    leader.start()
+    started.wait()
+    begin = time.monotonic()
+    try:
+        assert cache.get(1, lambda: {"id": 1, "by": "waiter"}, wait=0.2) == {"id": 1, "by": "waiter"}
+        assert time.monotonic() - begin < 1
+    finally:
+        release.set()
+        leader.join()
@@ -0,0 +1,37 @@
+"""
+按 (学校, 筛选条件) 分组的活动目录：筛选条件交给活动列表接口，每组只获取一次列表，结果与每个用户单独获取相同
+"""
+from utils.catalog import match_users
+from utils.tools import iter_allowed_activities
+
+LIST = "/apis/activity/list"
+INFO = "/apis/activity/info"
+
+
+def make_user(name, college="计算机学院", **filters):
+    return {"userName": name, "token": f"mock-{name}", "sid": 1, "college": college, **filters}
+
+
+def test_users_with_same_filters_share_one_list(mock_server):
+    server = mock_server(30)
+    for activity in server.activities.values():
+        activity.category = 1 if activity.id <= 20 else 2
+        if activity.id % 5 == 0:
+            activity.allow_college = ["外国语学院"]
+    users = [make_user("a"), make_user("b", college="外国语学院"),
+             make_user("c", categorys=[2]), make_user("d", categorys=[2])]
+
+    matches = match_users(users)
+
+    # 无筛选条件一组（30 个活动，两页）、categorys=[2] 一组（一页）
+    assert server.request_counts[LIST] == 3
+    # categorys=[2] 的活动已经在第一组中获取过详细信息
+    assert server.request_counts[INFO] == 30
+    assert len(matches["a"]) == 24
+    assert len(matches["b"]) == 30
+    assert {m["activity_id"] for m in matches["c"]} == set(range(21, 31)) - {25, 30}
+    assert matches["c"] == matches["d"]
+
+    for user in users:
+        expected = sorted(iter_allowed_activities(user), key=lambda m: m["activity_id"])
+        assert matches[user["userName"]] == expected
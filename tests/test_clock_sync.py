@@ -0,0 +1,31 @@
+"""
+长时间运行时按间隔重新同步服务器时间
+"""
+from functools import partial
+
+from utils.clock_sync import ServerClock
+
+
+def within_error(clock: ServerClock, offset: float) -> bool:
+    """
+    估计的偏差与实际偏差之差在同步给出的误差上界内
+    """
+    return abs(clock.offset - offset) <= clock.error + 0.02
+
+
+def test_resync_after_max_age(mock_server, monkeypatch):
+    server = mock_server(1, clock_offset=5)
+    clock = ServerClock()
+    # 少量采样即可区分两次同步的结果
+    monkeypatch.setattr(clock, "sync", partial(clock.sync, max_samples=4))
+    clock.ensure_synced()
+    assert within_error(clock, 5)
+
+    server.clock_offset = 7
+    clock.ensure_synced(max_age=3600)
+    assert within_error(clock, 5)
+
+    # 上次同步已经超过 max_age
+    clock._attempted_at -= 7200
+    clock.ensure_synced(max_age=3600)
+    assert within_error(clock, 7)
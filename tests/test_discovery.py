@@ -0,0 +1,94 @@
+"""
+活动发现发送的请求数：列表按页数请求、遇到不满一页的页面停止翻页、索引中没变的活动不再请求详细信息
+"""
+import time
+
+import pytest
+
+import utils.governor as governor
+import utils.tools as tools
+from utils.activity_cache import ActivityInfoCache
+from utils.activity_index import ActivityIndex
+from utils.tools import count_pages, iter_activity_infos
+
+LIST = "/apis/activity/list"
+INFO = "/apis/activity/info"
+USER = {"userName": "tester", "token": "mock-tester", "sid": 1}
+
+
+def discover(**kwargs):
+    return dict(iter_activity_infos(USER, **kwargs))
+
+
+def overstate_total(server, total=200):
+    # 让列表接口返回偏大的活动总数，只能靠不满一页的页面判断已经没有更多活动
+    list_page = server._list
+
+    def list_with_total(payload):
+        response = list_page(payload)
+        response["data"]["pageInfo"]["total"] = total
+        return response
+
+    server._list = list_with_total
+
+
+@pytest.mark.parametrize("total, page_size, pages", [(0, 20, 0), (1, 20, 1), (20, 20, 1), (21, 20, 2), (45, 20, 3)])
+def test_count_pages(total, page_size, pages):
+    assert count_pages(total, page_size) == pages
+
+
+def test_requests_one_list_call_per_page_and_one_info_call_per_activity(mock_server):
+    server = mock_server(45)
+
+    infos = discover(page_size=20)
+
+    assert sorted(int(activity_id) for activity_id in infos) == list(range(1, 46))
+    assert server.request_counts[LIST] == 3
+    assert server.request_counts[INFO] == 45
+
+
+def test_stops_on_short_page_when_total_is_overstated(mock_server):
+    server = mock_server(25)
+    # 按总数算出 10 页，但第 2 页只有 5 个活动，之后不应继续翻页
+    overstate_total(server)
+
+    infos = discover(page_size=20, max_workers=1)
+
+    assert len(infos) == 25
+    assert server.request_counts[LIST] == 2
+    assert server.request_counts[INFO] == 25
+
+
+def test_short_first_page_needs_no_more_list_calls(mock_server):
+    server = mock_server(5)
+    overstate_total(server)
+
+    infos = discover(page_size=20)
+
+    assert len(infos) == 5
+    assert server.request_counts[LIST] == 1
+
+
+def test_index_skips_info_calls_for_unchanged_activities(mock_server, tmp_path, monkeypatch):
+    server = mock_server(30)
+    index = ActivityIndex(str(tmp_path / "index.json"))
+
+    discover(page_size=20, index=index)
+    assert server.request_counts[INFO] == 30
+
+    # 换一个空的进程内缓存，确认第二次没有请求是因为索引而不是缓存
+    monkeypatch.setattr(tools, "activity_info_cache", ActivityInfoCache())
+    infos = discover(page_size=20, index=index)
+
+    assert len(infos) == 30
+    assert server.request_counts[LIST] == 4
+    assert server.request_counts[INFO] == 30
+
+
+def test_discovery_speed_is_set_by_the_governor_budgets(mock_server, monkeypatch):
+    mock_server(45)
+    # 列表接口每秒 5 个、不允许瞬时并发：3 页至少需要 0.4 秒
+    monkeypatch.setattr(governor, "_governor", governor.Governor(0, 1, {"list": (5, 1), "info": (0, 1)}))
+    started = time.perf_counter()
+    assert len(discover(page_size=20)) == 45
+    assert time.perf_counter() - started >= 0.35
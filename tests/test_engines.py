@@ -0,0 +1,120 @@
+"""
+多线程引擎与协程引擎对同一个报名响应的处理一致
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+import config
+import utils.governor as governor
+from utils import burst
+from utils.activity_bot import ActivityBot
+from utils.timing import server_now
+
+
+def send_thread(bot: ActivityBot, activity_id: str) -> str:
+    return bot._send_signup_request(activity_id)
+
+
+def send_async(bot: ActivityBot, activity_id: str) -> str:
+    async_engine = pytest.importorskip("utils.async_engine")
+    future = asyncio.run_coroutine_threadsafe(async_engine._send_signup_request(bot, activity_id),
+                                              async_engine._get_loop())
+    return future.result(10)
+
+
+ENGINES = [send_thread, send_async]
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """
+    记录限速器被要求降低速率的次数
+    """
+    calls = []
+    monkeypatch.setattr(governor._governor, "backoff", lambda: calls.append(1))
+    return calls
+
+
+@pytest.mark.parametrize("send", ENGINES)
+def test_throttled_response_backs_off(send, mock_server, backoffs):
+    mock_server(1, error_rate=1, error_status=429)
+    bot = ActivityBot({"userName": f"throttled-{send.__name__}", "password": "x", "sid": 1})
+    assert send(bot, "1") == burst.THROTTLED
+    assert backoffs == [1]
+
+
+@pytest.mark.parametrize("send", ENGINES)
+def test_unexpected_exception_is_an_error_outcome(send, mock_server, monkeypatch):
+    mock_server(1)
+    bot = ActivityBot({"userName": f"broken-{send.__name__}", "password": "x", "sid": 1})
+
+    def broken_headers():
+        raise ValueError("签名失败")
+
+    monkeypatch.setattr(bot, "_get_signup_headers", broken_headers)
+    assert send(bot, "1") == burst.ERROR
+
+
+def test_asyncio_engine_warms_its_own_pool(mock_server, monkeypatch):
+    async_engine = pytest.importorskip("utils.async_engine")
+    mock_server(1)
+    assert async_engine.warm_up(4) == 4
+
+    # 报名前预热的是协程引擎的连接池，同一个报名时刻只预热一次
+    warmed = []
+    monkeypatch.setattr(config, "SIGNUP_ENGINE", "asyncio")
+    monkeypatch.setattr(async_engine, "warm_up", lambda count, timeout: warmed.append(count) or count)
+    bot = ActivityBot({"userName": "prewarm", "password": "x", "sid": 1})
+    start_time = datetime.now() + timedelta(seconds=30)
+    bot._warm_up(start_time)
+    bot._warm_up(start_time)
+    assert warmed == [config.PREWARM_CONNECTIONS]
+
+
+@pytest.mark.parametrize("engine", ["thread", "asyncio"])
+def test_burst_state_is_cleared_after_fire(engine, mock_server, monkeypatch):
+    if engine == "asyncio":
+        pytest.importorskip("utils.async_engine")
+    monkeypatch.setattr(config, "SIGNUP_ENGINE", engine)
+    server = mock_server(1)
+    server.activities[1].join_start = time.time() - 1
+    bot = ActivityBot({"userName": f"state-{engine}", "password": "x", "sid": 1})
+    bot.fire("1", server_now())
+    assert bot.signup_flags.get("1")
+    # 常驻模式下报名结束后不留下按活动记录的状态
+    assert not (bot._burst_start or bot._fire_at or bot._first_response_logged or bot._cancellations)
+
+
+def test_401_is_its_own_outcome():
+    assert burst.classify(401, "") == burst.UNAUTHORIZED
+    strategy = burst.AdaptiveBurst()
+    strategy.record(burst.UNAUTHORIZED)
+    assert strategy.stopped == burst.UNAUTHORIZED
+
+
+@pytest.mark.parametrize("send", ENGINES)
+def test_expired_token_is_renewed_and_retried(send, mock_server):
+    server = mock_server(1)
+    server.activities[1].join_start = time.time() - 1
+    bot = ActivityBot({"userName": f"renew-{send.__name__}", "password": "x", "sid": 1})
+    assert bot.ensure_token()
+    server.expire_tokens()
+    assert send(bot, "1") == burst.SUCCESS
+    assert bot.cur_token.endswith("#1")
+    assert server.request_counts["/uc/user/login"] == 2
+
+
+def test_concurrent_401s_log_in_once(mock_server):
+    server = mock_server(1)
+    bot = ActivityBot({"userName": "renew-once", "password": "x", "sid": 1})
+    assert bot.ensure_token()
+    server.expire_tokens()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        outcomes = list(executor.map(lambda _: send_thread(bot, "1"), range(8)))
+    # 重新登录后的重发得到的是报名未开始，而不是继续 401
+    assert outcomes == [burst.NOT_OPEN] * 8
+    assert server.request_counts["/uc/user/login"] == 2
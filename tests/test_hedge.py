@@ -0,0 +1,29 @@
+"""
+对冲的耗时分布与统计使用同一种百分位数，导入模块时不创建线程池
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+from utils import hedge
+from utils.hedge import LatencyTracker
+from utils.metrics import Histogram
+
+
+@pytest.mark.parametrize("p", [50, 90, 95, 99])
+def test_latency_tracker_and_histogram_agree_on_percentiles(p):
+    tracker = LatencyTracker(90, 3, 1, 5)
+    histogram = Histogram()
+    for i in range(1, 41):
+        tracker.observe(i / 100)
+        histogram.observe(i / 100)
+    assert tracker.percentile(p) == histogram.percentile(p)
+
+
+def test_executor_is_created_on_first_use():
+    code = "import utils.hedge as hedge; assert hedge._executor is None"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(hedge.__file__)))
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=root)
+    assert hedge.executor() is hedge.executor()
@@ -0,0 +1,40 @@
+"""
+X-Sign 预计算池的后台补充线程
+"""
+import time
+
+from utils.pu_sign import XSignPool
+
+
+def wait_for(condition, timeout: float = 3) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_refill_survives_errors_and_idles_without_windows():
+    now = [1000]
+    failures = [RuntimeError("时钟异常")]
+
+    def clock():
+        if failures:
+            raise failures.pop()
+        return now[0]
+
+    pool = XSignPool(batch_size=2, lookahead=1, clock=clock)
+    pool.prepare(1000, before=0, after=10)
+    now[0] = 1005
+    # 第一次补充出错后线程仍然继续补充
+    assert wait_for(lambda: len(pool._buckets.get(1006, ())) == 2)
+    assert pool._thread.is_alive()
+
+    # 窗口结束后线程等待下一次 prepare，而不是一直轮询
+    now[0] = 1020
+    assert wait_for(lambda: not pool._wake.is_set())
+    pool.prepare(1030, before=0, after=10)
+    now[0] = 1032
+    assert wait_for(lambda: len(pool._buckets.get(1033, ())) == 2)
+    assert pool._thread.is_alive()
@@ -0,0 +1,58 @@
+"""
+调度器：同一时刻开始的报名任务数超过线程池大小时，所有任务仍然同时开始报名
+"""
+import threading
+import time
+from datetime import datetime
+
+from utils.scheduler import SignupScheduler
+from utils.timing import PU_TIMEZONE
+
+
+class FakeBot:
+    """
+    只记录 fire 被调用的时刻，报名过程用 sleep 模拟
+    """
+
+    def __init__(self, name: str, start_time: datetime, fired: list, burst_seconds: float):
+        self.user_data = {"userName": name}
+        self.signup_flags = {}
+        self._start_time = start_time
+        self._fired = fired
+        self._burst_seconds = burst_seconds
+
+    def ensure_token(self, valid_until=None) -> bool:
+        return True
+
+    def get_join_start_time(self, activity_id):
+        return self._start_time
+
+    def _next_monitor_minutes(self, activity_id, start_time, buffer_seconds):
+        return None
+
+    def fire(self, activity_id, start_time):
+        self._fired.append(time.monotonic())
+        time.sleep(self._burst_seconds)
+        self.signup_flags[activity_id] = True
+
+    def cancel_signup(self, activity_id):
+        pass
+
+
+def test_fire_jobs_are_not_limited_by_pool_size():
+    # 开始时间在 1 秒后，调度器会立即把报名交出去
+    start_time = datetime.fromtimestamp(time.time() + 1, PU_TIMEZONE).replace(tzinfo=None)
+    fired = []
+    scheduler = SignupScheduler(max_workers=4)
+    for i in range(40):
+        scheduler.add_job(FakeBot(f"user{i}", start_time, fired, burst_seconds=1), "1")
+
+    runner = threading.Thread(target=scheduler.run)
+    runner.start()
+    runner.join(10)
+
+    assert not runner.is_alive()
+    assert len(fired) == 40
+    # 线程池只有 4 个线程，如果报名占用线程池，后面的任务要等前面的报名结束（每批 1 秒）才能开始
+    assert max(fired) - min(fired) < 0.5
+    assert all(job.success for job in scheduler.jobs)
@@ -0,0 +1,110 @@
+"""
+token 管理：导入的 token 不当作刚获取的使用，个别提前失效的 token 不会让有效期一直缩短
+"""
+import itertools
+import json
+
+import pytest
+
+import utils.state_store as state_store
+import utils.token_manager as token_manager
+import utils.tools as tools
+from utils.token_manager import TokenManager
+
+
+@pytest.fixture
+def logins(monkeypatch):
+    """
+    登录时依次返回 token-1、token-2……，并记录登录次数
+    """
+    counter = itertools.count(1)
+    calls = []
+
+    def get_token(user_data):
+        calls.append(user_data["userName"])
+        return f"token-{next(counter)}"
+
+    monkeypatch.setattr(tools, "get_token", get_token)
+    return calls
+
+
+USER = {"userName": "alice", "password": "x", "sid": 1}
+
+
+def test_imported_token_is_refreshed_before_use(store, logins, tmp_path):
+    json_path = tmp_path / "user_data.json"
+    json_path.write_text(json.dumps([{**USER, "token": "stale"}]), encoding="utf-8")
+    assert store.import_json(str(json_path))
+    assert store.get_token("alice")["obtained_at"] == state_store.UNKNOWN_OBTAINED_AT
+
+    manager = TokenManager()
+    assert manager.get(USER) == "token-1"
+    assert manager.get(USER) == "token-1"
+    assert logins == ["alice"]
+    assert store.get_token("alice")["obtained_at"] > state_store.UNKNOWN_OBTAINED_AT
+
+
+def test_saving_users_keeps_known_token_age(store, logins):
+    manager = TokenManager()
+    token = manager.get(USER)
+    obtained_at = store.get_token("alice")["obtained_at"]
+    # 用户数据写回时带着同一个 token，不应把获取时间改成未知
+    store.save_users([{**USER, "token": token}])
+    assert store.get_token("alice")["obtained_at"] == obtained_at
+    assert TokenManager().get(USER) == token
+    assert logins == ["alice"]
+
+
+def expire_early(manager: TokenManager, user: dict, age: float) -> None:
+    """
+    让用户当前的 token 在获取 age 秒后收到 401，并重新登录
+    """
+    token = manager.get(user)
+    manager._tokens[user["userName"]].obtained_at -= age
+    manager.expired(user["userName"], token)
+    manager.refresh(user, token)
+
+
+def test_single_401_does_not_shrink_lifetime(store, logins):
+    manager = TokenManager()
+    expire_early(manager, USER, 700)
+    # 同一个 token 被多个线程报告也只算一次
+    manager.expired("alice", manager.get(USER))
+    assert manager.lifetime == manager.default_lifetime
+    logins.clear()
+    for _ in range(3):
+        manager.get(USER)
+    assert logins == []
+    assert TokenManager().get(USER) == manager.get(USER)
+    assert logins == []
+
+
+def test_lifetime_shrinks_after_several_401s_and_recovers(store, logins, monkeypatch):
+    manager = TokenManager()
+    for age in (700, 2400, 3000):
+        expire_early(manager, USER, age)
+    assert manager.lifetime == pytest.approx(3000, abs=1)
+
+    # 重启后沿用缩短的有效期，超过 LIFETIME_TTL 后恢复默认值
+    assert TokenManager().expires_at("alice") == store.get_token("alice")["obtained_at"] + manager.lifetime
+    monkeypatch.setattr(token_manager, "LIFETIME_TTL", -1)
+    restarted = TokenManager()
+    assert restarted.expires_at("alice") == store.get_token("alice")["obtained_at"] + restarted.default_lifetime
+
+
+def test_learned_lifetime_has_a_floor(store, logins):
+    manager = TokenManager()
+    for age in (60, 120, 180):
+        expire_early(manager, USER, age)
+    assert manager.lifetime == token_manager.MIN_LIFETIME
+    logins.clear()
+    for _ in range(3):
+        manager.get(USER)
+    assert logins == []
+
+
+def test_json_token_without_store_is_refreshed_before_use(logins):
+    # 没有状态数据库时 user_data.json 中的 token 同样不知道获取时间
+    manager = TokenManager()
+    assert manager.get({**USER, "token": "stale"}) == "token-1"
+    assert logins == ["alice"]
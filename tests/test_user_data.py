@@ -0,0 +1,53 @@
+"""
+状态数据库与 user_data.json 保持一致：数据库中的修改写回文件，之后手动修改文件也不会用旧内容覆盖数据库
+"""
+import json
+import os
+
+from utils.user_data_manager import UserDataManager
+
+
+def write_json(path, users) -> None:
+    path.write_text(json.dumps(users, ensure_ascii=False), encoding="utf-8")
+    # 保证修改时间晚于上次导入
+    mtime = os.stat(path).st_mtime + 10
+    os.utime(path, (mtime, mtime))
+
+
+def read_json(path):
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def test_database_changes_survive_editing_the_json(store, tmp_path):
+    json_path = tmp_path / "user_data.json"
+    write_json(json_path, [{"userName": "alice", "password": "x", "sid": 1, "activity_ids": [1]}])
+
+    # 交互式选择活动、添加新用户，写入数据库
+    manager = UserDataManager(str(json_path))
+    manager.user_datas[0]["activity_ids"] = [1, 2]
+    manager.user_datas.append({"userName": "bob", "password": "y", "sid": 1, "activity_ids": [5]})
+    manager.write_user_data()
+    assert [(u["userName"], u["activity_ids"]) for u in read_json(json_path)] == [("alice", [1, 2]), ("bob", [5])]
+
+    # 常驻模式自动发现的活动只写入了数据库
+    store.add_subscription("alice", 3)
+
+    # 手动修改文件：改邮箱、删掉活动 1
+    users = read_json(json_path)
+    users[0]["email"] = "alice@example.com"
+    users[0]["activity_ids"] = [2]
+    write_json(json_path, users)
+
+    reloaded = {u["userName"]: u for u in UserDataManager(str(json_path)).user_datas}
+    assert reloaded["alice"]["activity_ids"] == [2, 3]
+    assert reloaded["alice"]["email"] == "alice@example.com"
+    assert reloaded["bob"]["activity_ids"] == [5]
+
+
+def test_first_import_into_existing_database_only_adds(store, tmp_path):
+    json_path = tmp_path / "user_data.json"
+    store.save_users([{"userName": "alice", "password": "x", "sid": 1, "activity_ids": [1, 3]}])
+    # 数据库中没有上次导入的记录时，不知道文件删掉了什么，只新增
+    write_json(json_path, [{"userName": "alice", "password": "x", "sid": 1, "activity_ids": [1, 2]}])
+    assert store.import_json(str(json_path))
+    assert store.load_users()[0]["activity_ids"] == [1, 3, 2]
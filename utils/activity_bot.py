@@ -3,13 +3,40 @@ import threading
 import requests
 import time
 import json
-from datetime import datetime, timedelta,timezone
-from utils.headers import HEADERS_ACTIVITY, HEADERS_ACTIVITY_INFO
+from datetime import datetime, timedelta
+from utils.headers import HEADERS_ACTIVITY
 from loguru import logger
 from typing import Dict, Optional, Tuple
-from concurrent.futures import ThreadPoolExecutor
-from email.utils import parsedate_to_datetime
-from utils.pu_sign import generate_random_echo, current_timestamp_str, generate_x_sign
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.pu_sign import x_sign_pool
+from utils.http_client import api_url, get_session, warm_up_once
+from utils.activity_cache import activity_info_cache
+from utils.notifier import notifier, SUCCESS, FAIL
+from utils.clock_sync import server_clock
+from utils.timing import fire_advance, server_now, to_epoch, wait_until
+from utils.metrics import metrics, response_code, JOIN_RETRIES_TOTAL, JOIN_HEDGES_TOTAL, FIRE_DELAY
+from utils import burst
+from utils.burst import BurstStrategy, make_strategy
+from utils.cancel import Cancellation
+from utils.state_store import get_state_store
+from utils.token_manager import token_manager
+from utils.governor import get_governor, JOIN_WAIT
+from utils import hedge
+from utils.hedge import join_latency
+
+
+_engine_fallback_warned = False
+
+
+def _warn_engine_fallback(error: ImportError) -> None:
+    """
+    协程报名引擎不可用时只提示一次，之后的报名任务直接改用多线程
+    """
+    global _engine_fallback_warned
+    if not _engine_fallback_warned:
+        _engine_fallback_warned = True
+        logger.warning(f"asyncio 报名引擎不可用（{error}），所有报名改用多线程引擎。"
+                       f"请执行 pip install aiohttp 或 uv sync --extra asyncio")
 
 
 class ActivityBot:
@@ -20,103 +47,69 @@ class ActivityBot:
         """
         self.user_data = userData
         self.cur_token = userData.get("token", "")
-        self.activity_url = "https://apis.pocketuni.net/apis/activity/join"
-        self.info_url = "https://apis.pocketuni.net/apis/activity/info"
+        self.activity_url = api_url("/apis/activity/join")
         self.email = userData.get("email", "")
         self.signup_flags = {}  # 记录每个活动的报名状态
         self.debug = False
         self.debug_time = datetime.now() + timedelta(seconds=15)
         self.server_time_offset = 0.0  # 服务器时间偏差
+        self.session = get_session()  # 进程内共享的连接池
+        self._burst_start = {}  # 每个活动报名开始的时刻（perf_counter）
+        self._fire_at = {}  # 每个活动第一个报名请求预定的发出时刻（服务器时间），发出后删除
+        self._first_response_logged = set()  # 已记录首个响应耗时的活动
+        self._cancellations: Dict[str, Cancellation] = {}  # 每个活动当前报名的取消信号
 
         # 线程锁，避免多线程同时写入
         self._lock = threading.Lock()
 
-        # 初始化 token 和时间同步
-        if not self.cur_token:
-            self._refresh_token()
+        # 初始化 token：仍在有效期内的 token（包括上次运行保存的）直接复用
+        self.ensure_token()
 
 
-    def sync_server_time(self,activity_id: str) -> None:
-        """同步服务器时间，获取时间偏差"""
-        max_retries = 3
-        headers = HEADERS_ACTIVITY.copy()
-        headers["Authorization"] = f"Bearer {self.cur_token}:{self.user_data.get('sid')}"
-        payload = {"id": activity_id}
-
-        for attempt in range(max_retries):
-            try:
-                start_time = time.time()
-                response = requests.post(
-                    url=self.info_url,
-                    timeout=5,
-                    headers=headers,  # 防止被拦截
-                    json=payload
-                )
-                end_time = time.time()
-
-                # 检查响应状态
-                response.raise_for_status()
-
-                server_time_str = response.headers.get('Date')
-                if not server_time_str:
-                    raise ValueError("服务器未返回Date头")
-
-                # 解析服务器时间
-                server_time = parsedate_to_datetime(server_time_str)
-                if server_time.tzinfo is None:
-                    server_time = server_time.replace(tzinfo=timezone.utc)
-
-                # 计算网络延迟和本地时间
-                network_delay = end_time - start_time
-                local_utc_time = datetime.fromtimestamp(
-                    start_time + network_delay / 2,
-                    tz=timezone.utc
-                )
-
-                # 计算时间偏差
-                self.server_time_offset = (server_time - local_utc_time).total_seconds()
-
-                logger.info(
-                    f"用户 {self.user_data['userName']} 时间同步成功 "
-                    f"(尝试 {attempt + 1}/{max_retries}): "
-                    f"偏差={self.server_time_offset:.3f}秒, "
-                    f"延迟={network_delay * 1000:.1f}ms"
-                )
-                return  # 成功后退出
-
-            except requests.RequestException as e:
-                logger.warning(
-                    f"用户 {self.user_data['userName']} 时间同步失败 "
-                    f"(尝试 {attempt + 1}/{max_retries}): {e}"
-                )
-            except Exception as e:
-                logger.error(
-                    f"用户 {self.user_data['userName']} 时间同步异常 "
-                    f"(尝试 {attempt + 1}/{max_retries}): {e}"
-                )
-
-            if attempt < max_retries - 1:
-                time.sleep(1)  # 重试前等待1秒
-
-        # 所有重试都失败
-        logger.error(f"用户 {self.user_data['userName']} 时间同步完全失败，使用默认偏差0")
-        self.server_time_offset = 0.0
+    def sync_server_time(self, activity_id: Optional[str] = None) -> None:
+        """
+        同步服务器时间，获取时间偏差。
+        同步结果在进程内共享，只有第一次调用会真正采样，activity_id 仅为兼容保留
+        """
+        server_clock.ensure_synced()
+        self.server_time_offset = server_clock.offset
+        logger.info(
+            f"用户 {self.user_data['userName']} 使用服务器时间偏差 "
+            f"{self.server_time_offset:.3f}秒 ±{server_clock.error * 1000:.0f}ms"
+        )
 
     def _get_corrected_now(self) -> datetime:
-        """获取校正后的当前时间"""
-        return datetime.now() + timedelta(seconds=self.server_time_offset)
+        """获取校正后的当前时间（服务器时间）"""
+        return server_now()
 
-    def _refresh_token(self) -> bool:
+    def _refresh_token(self, stale_token: Optional[str] = None) -> bool:
         """
-        刷新 token，最多重试 5 次
+        token 收到 401，记录失效并重新登录，最多重试 5 次。
+        其他线程已经刷新过时直接使用新的 token，不会重复登录
+        :param stale_token: 收到 401 的 token，默认为当前 token
         :return: True 表示获取成功，False 表示失败
         """
+        stale = stale_token or self.cur_token or None
+        if stale:
+            token_manager.expired(self.user_data['userName'], stale)
+        return self._acquire_token(lambda: token_manager.refresh(self.user_data, stale_token=stale))
+
+    def ensure_token(self, valid_until: Optional[float] = None) -> bool:
+        """
+        确保 token 到 valid_until 时仍然有效，快过期时才重新登录，最多重试 5 次
+        :param valid_until: token 至少要有效到的时刻（本地 Unix 秒），默认为现在
+        :return: True 表示 token 有效，False 表示获取失败
+        """
+        return self._acquire_token(lambda: token_manager.get(self.user_data, valid_until))
+
+    def _acquire_token(self, acquire) -> bool:
         for attempt in range(5):
             try:
-                from utils.tools import get_token
-                self.cur_token = get_token(self.user_data)
-                if self.cur_token:
-                    logger.info(f"用户 {self.user_data['userName']} Token 刷新成功")
+                token = acquire()
+                if token:
+                    if token != self.cur_token:
+                        logger.info(f"用户 {self.user_data['userName']} Token 刷新成功")
+                    self.cur_token = token
                     return True
                 logger.warning(f"用户 {self.user_data['userName']} 第 {attempt + 1} 次 Token 获取失败")
             except Exception as e:
@@ -144,31 +137,31 @@ class ActivityBot:
         if self.debug:
             return self.debug_time
 
+        from utils.tools import fetch_activity_info
         for retry in range(3):
             try:
-                headers = self._get_headers()
-                payload = {"id": activity_id}
-
                 logger.info(f"用户 {self.user_data['userName']} 获取活动 {activity_id} 开始时间 (尝试 {retry + 1}/3)")
-                response = requests.post(self.info_url, headers=headers, json=payload, timeout=8)
-
-                if response.status_code == 401:
-                    logger.warning(f"用户 {self.user_data['userName']} Token 失效，尝试刷新 (重试 {retry + 1}/3)")
-                    if self._refresh_token():
-                        continue
-                    else:
-                        break
-
-                response.raise_for_status()
-
-                data = response.json()
-                join_start_time_str = data.get("data", {}).get("baseInfo", {}).get("joinStartTime")
+                info = activity_info_cache.get(
+                    activity_id,
+                    lambda: fetch_activity_info(activity_id, self.cur_token, self.user_data.get('sid'), timeout=8),
+                    wait=8)
+                join_start_time_str = info.get("joinStartTime")
 
                 if join_start_time_str:
                     start_time = datetime.strptime(join_start_time_str, '%Y-%m-%d %H:%M:%S')
                     logger.info(f"用户 {self.user_data['userName']} 活动 {activity_id} 开始时间: {start_time}")
                     return start_time
 
+            except requests.exceptions.HTTPError as e:
+                if e.response is not None and e.response.status_code == 401:
+                    logger.warning(f"用户 {self.user_data['userName']} Token 失效，尝试刷新 (重试 {retry + 1}/3)")
+                    if self._refresh_token():
+                        continue
+                    else:
+                        break
+                logger.warning(f"用户 {self.user_data['userName']} 获取活动信息失败 (重试 {retry + 1}/3): {e}")
+                if retry < 2:  # 不是最后一次重试
+                    time.sleep(2 ** retry)  # 指数退避
             except Exception as e:
                 logger.warning(f"用户 {self.user_data['userName']} 获取活动信息失败 (重试 {retry + 1}/3): {e}")
                 if retry < 2:  # 不是最后一次重试
@@ -177,80 +170,55 @@ class ActivityBot:
         logger.error(f"用户 {self.user_data['userName']} 获取活动 {activity_id} 信息最终失败")
         return None
 
-    def _monitor_start_time(self,
-                            activity_id: str,
-                            start_time: Optional[datetime],
-                            min_minutes: int = 15,
-                            max_minutes: int = 60,
-                            buffer_seconds: int = 600) -> Optional[datetime]:
+    def _next_monitor_minutes(self,
+                              activity_id: str,
+                              start_time: datetime,
+                              min_minutes: int = 15,
+                              max_minutes: int = 60,
+                              buffer_seconds: int = 600) -> Optional[int]:
         """
-        定时查询活动开始时间，发现变化则更新
+        计算下一次确认活动开始时间前需要等待的分钟数
         :param activity_id: 活动id
         :param start_time: 开始时间
         :param min_minutes: 最小等待时间
         :param max_minutes: 最大等待时间
-        :param buffer_seconds: 小于该时间就返回
-        :return: 开始时间
+        :param buffer_seconds: 距离开始小于该时间就不再监控
+        :return: 等待分钟数，None 表示已进入最终等待阶段
         """
-        if not start_time:
-            return None
-
-        while True:
-            now = self._get_corrected_now()
-            time_to_start = (start_time - now).total_seconds()
+        now = self._get_corrected_now()
+        time_to_start = (start_time - now).total_seconds()
 
-            # 如果已经很接近开始（<= buffer_seconds），停止低频监控，返回当前 start_time
-            if time_to_start <= float(buffer_seconds):
-                logger.info(f"用户 {self.user_data['userName']} 活动 {activity_id} 进入最终等待阶段")
-                return start_time
-
-            # 计算允许的最大睡眠分钟（留出 buffer_seconds 缓冲）
-            max_allowed_minutes = max(1, int((time_to_start - buffer_seconds) / 60))
-
-            # 决定随机区间
-            lower = min(min_minutes, max_allowed_minutes)
-            upper = min(max_minutes, max_allowed_minutes)
+        # 如果已经很接近开始（<= buffer_seconds），停止低频监控
+        if time_to_start <= float(buffer_seconds):
+            logger.info(f"用户 {self.user_data['userName']} 活动 {activity_id} 进入最终等待阶段")
+            return None
 
-            if upper < 1:
-                return start_time
+        # 计算允许的最大睡眠分钟（留出 buffer_seconds 缓冲）
+        max_allowed_minutes = max(1, int((time_to_start - buffer_seconds) / 60))
 
-            sleep_minutes = random.randint(max(1, lower), upper)
+        # 决定随机区间
+        lower = min(min_minutes, max_allowed_minutes)
+        upper = min(max_minutes, max_allowed_minutes)
 
-            logger.info(
-                f"用户 {self.user_data['userName']} 等待 {sleep_minutes} 分钟后再次确认开始时间 "
-                f"(距离开始 {time_to_start / 60:.1f} 分钟)")
+        if upper < 1:
+            return None
 
-            time.sleep(sleep_minutes * 60)
+        sleep_minutes = random.randint(max(1, lower), upper)
 
-            # 重新获取活动时间
-            new_start = self.get_join_start_time(activity_id)
-            if new_start and new_start != start_time:
-                logger.warning(
-                    f"用户 {self.user_data['userName']} 活动 {activity_id} 开始时间变更: {start_time} -> {new_start}")
-                start_time = new_start
+        logger.info(
+            f"用户 {self.user_data['userName']} 等待 {sleep_minutes} 分钟后再次确认开始时间 "
+            f"(距离开始 {time_to_start / 60:.1f} 分钟)")
+        return sleep_minutes
 
-    def _precise_wait_until(self, target_time: datetime, advance_ms: int = 50):
+    def _precise_wait_until(self, target_time: datetime, advance_ms: Optional[float] = None) -> float:
         """
         精确等待到目标时间前advance_ms毫秒
-        :param target_time: 目标时间
-        :param advance_ms: 提前毫秒数
-        """
-        while True:
-            current_time = self._get_corrected_now()
-            remaining = (target_time - current_time).total_seconds()
-
-            if remaining <= advance_ms / 1000.0:
-                break
-
-            # 如果剩余时间>1秒，粗略等待
-            if remaining > 1:
-                time.sleep(remaining - 0.5)
-            elif remaining > 0.1:
-                # 中等精度等待
-                time.sleep(0.05)
-            else:
-                # 高精度等待
-                time.sleep(0.001)
+        :param target_time: 目标时间（服务器时间）
+        :param advance_ms: 提前毫秒数，默认按测得的单程网络延迟计算
+        :return: 实际唤醒时刻与预定时刻的误差（秒）
+        """
+        advance = fire_advance() if advance_ms is None else advance_ms / 1000.0
+        return wait_until(to_epoch(target_time) - advance)
 
     def _parse_signup_response(self, response_text: str) -> Tuple[bool, str]:
         """
@@ -280,218 +248,413 @@ class ActivityBot:
             else:
                 return False, f"未知响应: {response_text[:100]}"
 
-    def _send_signup_request(self, activity_id: str) -> bool:
+    def _send_signup_request(self, activity_id: str, phase=None, renewed: bool = False) -> str:
         """
-        发送报名请求（改进版本）
+        发送报名请求（改进版本）。token 失效（401）时重新登录并重发一次
         :param activity_id: 活动 ID
-        :return: True 表示报名成功/已报名，False 表示失败
+        :param phase: 所在的报名阶段，用于统计
+        :param renewed: 是否是重新登录后的重发，重发仍然 401 时不再登录
+        :return: 报名结果分类，见 utils.burst，burst.SUCCESS 表示报名成功/已报名
         """
         if self.signup_flags.get(activity_id):
-            return True
+            return burst.SUCCESS
 
+        if not get_governor().acquire("join", timeout=JOIN_WAIT):
+            return burst.THROTTLED
         try:
             data = {"activityId": activity_id}
-            headers = self._get_headers()
-            echo = generate_random_echo()
-            timestamp = current_timestamp_str()
-            xSign=generate_x_sign(echo=echo, timestamp=timestamp, client='web')
-            headers["X-Sign"] = xSign
-
-            # 使用更短的超时时间提高响应速度
-            response = requests.post(self.activity_url, headers=headers, json=data, timeout=5)
+            token = self.cur_token
 
-            print(response.text)
+            self._mark_first_send(activity_id)
+            response = self._post_signup(data, phase)
+            self._log_first_response(activity_id)
+            logger.debug(f"用户 {self.user_data['userName']} 报名响应: {response.text}")
 
             if response.status_code != 200:
                 logger.warning(f"用户 {self.user_data['userName']} 报名请求失败: HTTP {response.status_code}")
-                return False
-
-            # 使用改进的响应解析
-            success, status_msg = self._parse_signup_response(response.text)
-
-            if success:
-                with self._lock:
-                    if not self.signup_flags.get(activity_id):  # 双重检查
-                        self.signup_flags[activity_id] = True
-                        logger.success(f"用户 {self.user_data['userName']} 活动 {activity_id} {status_msg}！")
-
-                        if "报名成功" in status_msg:
-                            self._send_email_notification(activity_id)
-                return True
-            else:
-                logger.debug(f"用户 {self.user_data['userName']} 报名响应: {status_msg}")
-                return False
+            elif self._handle_signup_response(activity_id, response.text):
+                return burst.SUCCESS
+            outcome = burst.classify(response.status_code, response.text)
+            if outcome == burst.THROTTLED:
+                get_governor().backoff()
+            elif outcome == burst.UNAUTHORIZED and not renewed and self._refresh_token(token):
+                return self._send_signup_request(activity_id, phase, renewed=True)
+            return outcome
 
         except requests.exceptions.Timeout:
             logger.warning(f"用户 {self.user_data['userName']} 报名请求超时")
-            return False
+            return burst.TIMEOUT
         except Exception as e:
             logger.error(f"用户 {self.user_data['userName']} 报名请求异常: {str(e)}")
-            return False
+            return burst.ERROR
 
-    def _send_email_notification(self, activity_id: str):
+    def _post_signup(self, data: Dict, phase=None) -> requests.Response:
         """
-        报名成功后发送邮件通知
-        :param activity_id: 活动 ID
+        发送报名请求，超过最近报名耗时的 p90 仍未返回时用另一条连接再发一个对冲请求，取先返回的响应
+        :param data: 请求体
+        :param phase: 所在的报名阶段，用于统计
+        :return: 响应
+        :raise requests.RequestException: 所有请求都失败时抛出主请求的异常
         """
+        timeout = join_latency.timeout()
+        delay = join_latency.hedge_delay()
+        reserved = hedge.reserve(2) if delay is not None else 0
+        if reserved < 2:
+            for _ in range(reserved):
+                hedge.release()
+            return self._post_join(data, phase, timeout)
+
+        def post(tag: str) -> Tuple[str, requests.Response]:
+            try:
+                return tag, self._post_join(data, phase, timeout)
+            finally:
+                hedge.release()
+
+        primary = hedge.executor().submit(post, "primary")
+        pending = {primary}
+        done, _ = wait(pending, timeout=delay)
+        if done or not get_governor().acquire("join", timeout=0):
+            hedge.release()
+            return primary.result()[1]
+        pending.add(hedge.executor().submit(post, "hedge"))
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    tag, response = future.result()
+                    metrics.inc(JOIN_HEDGES_TOTAL, winner=tag)
+                    return response
+                if future is primary:
+                    error = future.exception()
+        raise error
+
+    def _post_join(self, data: Dict, phase, timeout: float) -> requests.Response:
+        """
+        发送一个报名请求，统计耗时和结果
+        :param timeout: 请求超时（秒）
+        """
+        record = None
+        start = time.perf_counter()
         try:
-            from config import ENABLE_EMAIL_NOTIFICATION
-            if not (ENABLE_EMAIL_NOTIFICATION and self.email and self.email.strip()):
-                return
+            with metrics.request("join", phase=phase) as record:
+                response = self.session.post(self.activity_url, headers=self._get_signup_headers(), json=data,
+                                             timeout=timeout)
+                record.status = response.status_code
+                record.code = response_code(response.text)
+            return response
+        finally:
+            if record is not None:
+                get_governor().feedback(record.status)
+                if record.status != "error":
+                    join_latency.observe(time.perf_counter() - start)
+
+    def _get_signup_headers(self) -> Dict:
+        """
+        构造带 X-Sign 的报名请求头
+        :return: dict 格式的请求头
+        """
+        headers = self._get_headers()
+        headers["X-Sign"] = x_sign_pool.get()
+        return headers
 
-            from utils.tools import make_success_email, send_email
+    def _handle_signup_response(self, activity_id: str, response_text: str) -> bool:
+        """
+        解析报名响应并在成功时更新报名状态
+        :param activity_id: 活动 ID
+        :param response_text: 响应文本
+        :return: True 表示报名成功/已报名，False 表示失败
+        """
+        success, status_msg = self._parse_signup_response(response_text)
+
+        if success:
+            with self._lock:
+                if not self.signup_flags.get(activity_id):  # 双重检查
+                    self.signup_flags[activity_id] = True
+                    # 立即停止该活动的其余报名请求
+                    self.cancel_signup(activity_id)
+                    logger.success(f"用户 {self.user_data['userName']} 活动 {activity_id} {status_msg}！")
+
+                    if "报名成功" in status_msg:
+                        self._send_email_notification(activity_id)
+            return True
 
-            logger.info(f"用户 {self.user_data['userName']} 发送报名成功邮件通知...")
-            email_content = make_success_email(activity_id, self.user_data)
+        logger.debug(f"用户 {self.user_data['userName']} 报名响应: {status_msg}")
+        return False
 
-            if email_content and send_email(email_content, self.email):
-                logger.success(f"用户 {self.user_data['userName']} 邮件发送成功！")
-            else:
-                logger.error(f"用户 {self.user_data['userName']} 邮件发送失败")
+    def cancel_signup(self, activity_id: str) -> None:
+        """
+        停止某个活动正在进行的报名：唤醒所有等待中的报名线程，丢弃排队的任务，不再等待在途的请求
+        :param activity_id: 活动 ID
+        """
+        cancellation = self._cancellations.get(activity_id)
+        if cancellation is not None:
+            cancellation.cancel()
 
-        except Exception as e:
-            logger.error(f"用户 {self.user_data['userName']} 邮件发送异常: {str(e)}")
+    def _mark_first_send(self, activity_id: str):
+        """
+        记录第一个报名请求实际发出时比预定时刻晚了多少，用户多时可以看出进程是否忙不过来
+        :param activity_id: 活动 ID
+        """
+        fire_at = self._fire_at.pop(activity_id, None)
+        if fire_at is not None:
+            metrics.observe(FIRE_DELAY, server_clock.now() - fire_at)
 
-    def _send_fail_email_notification(self, activity_id: str):
+    def _log_first_response(self, activity_id: str):
         """
-        报名失败后发送邮件通知
+        记录从报名开始到收到首个响应的耗时，用于对比连接预热的效果
         :param activity_id: 活动 ID
         """
-        try:
-            from config import ENABLE_EMAIL_NOTIFICATION
-            if not (ENABLE_EMAIL_NOTIFICATION and self.email and self.email.strip()):
+        start = self._burst_start.get(activity_id)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            if activity_id in self._first_response_logged:
                 return
+            self._first_response_logged.add(activity_id)
+        from config import ENABLE_CONNECTION_PREWARM
+        logger.info(
+            f"用户 {self.user_data['userName']} 活动 {activity_id} 首个报名响应耗时 {elapsed * 1000:.1f}ms "
+            f"(连接预热: {'开启' if ENABLE_CONNECTION_PREWARM else '关闭'})")
 
-            from utils.tools import make_fail_email, send_email
-
-            logger.info(f"用户 {self.user_data['userName']} 发送报名失败邮件通知...")
-            email_content = make_fail_email(activity_id, self.user_data)
-
-            if email_content and send_email(email_content, self.email):
-                logger.success(f"用户 {self.user_data['userName']} 报名失败邮件发送成功！")
-            else:
-                logger.error(f"用户 {self.user_data['userName']} 报名失败邮件发送失败")
-
-        except Exception as e:
-            logger.error(f"用户 {self.user_data['userName']} 报名失败邮件异常: {str(e)}")
-
-    def signup(self, activity_id: str):
+    def _send_email_notification(self, activity_id: str):
         """
-        报名活动入口，自动轮询获取报名时间
-        :param activity_id: 活动id
+        报名成功后发送邮件通知（交给后台通知线程，不阻塞报名）
+        :param activity_id: 活动 ID
         """
-        logger.info(f"用户 {self.user_data['userName']} 开始报名活动 {activity_id}")
+        self._enqueue_email(SUCCESS, activity_id)
 
-        # 确保 token 有效
-        if not self.cur_token and not self._refresh_token():
-            logger.error(f"用户 {self.user_data['userName']} 无法获取有效 Token，报名中止")
-            return
-
-        # 初次获取活动开始时间
-        start_time = self.get_join_start_time(activity_id)
-        if not start_time:
-            logger.error(f"用户 {self.user_data['userName']} 无法获取活动 {activity_id} 开始时间")
-            return
+    def _send_fail_email_notification(self, activity_id: str):
+        """
+        报名失败后发送邮件通知（交给后台通知线程）
+        :param activity_id: 活动 ID
+        """
+        self._enqueue_email(FAIL, activity_id)
 
-        # 启动定时监控，确保时间更新
-        monitored_start_time = self._monitor_start_time(activity_id, start_time)
-        if not monitored_start_time:
-            logger.error(f"用户 {self.user_data['userName']} 监控活动时间失败，报名中止")
+    def _enqueue_email(self, kind: str, activity_id: str):
+        """
+        把报名结果放入邮件通知队列
+        :param kind: SUCCESS 或 FAIL
+        :param activity_id: 活动 ID
+        """
+        from config import ENABLE_EMAIL_NOTIFICATION
+        if not (ENABLE_EMAIL_NOTIFICATION and self.email and self.email.strip()):
             return
+        logger.info(f"用户 {self.user_data['userName']} 活动 {activity_id} 邮件通知已加入发送队列")
+        notifier.notify(kind, activity_id, {**self.user_data, "token": self.cur_token})
 
-        # 计算距离开始的秒数
-        current_time = self._get_corrected_now()
-        time_to_start = (monitored_start_time - current_time).total_seconds()
-        logger.info(f"用户 {self.user_data['userName']} 活动 {activity_id} 距离开始: {time_to_start:.1f} 秒")
-
-        # 等待到活动开始前 60 秒
-        if time_to_start > 60:
-            sleep_time = time_to_start - 60
-            logger.info(f"用户 {self.user_data['userName']} 等待 {sleep_time:.1f} 秒到活动开始前 60 秒")
-            time.sleep(max(0.0, sleep_time))
-
-            # 在靠近报名时刷新 token
-            logger.info(f"用户 {self.user_data['userName']} 刷新 Token 准备报名")
-            self._refresh_token()
-
-        # 精确等待到报名开始时间
-        logger.info(f"用户 {self.user_data['userName']} 进入精确等待阶段")
-        self._precise_wait_until(monitored_start_time, advance_ms=30)
+    def fire(self, activity_id: str, start_time: datetime):
+        """
+        报名开始前几秒调用：预热连接，精确等待到开始时间并发起报名
+        :param activity_id: 活动id
+        :param start_time: 报名开始时间（服务器时间）
+        """
+        # 报名开始前的等待期间也可以用 cancel_signup 取消
+        cancellation = self._cancellations[activity_id] = Cancellation()
+        try:
+            # 提前生成报名开始前后的 X-Sign，报名时直接取用
+            x_sign_pool.prepare(int(to_epoch(start_time) - server_clock.offset))
+
+            # 报名开始前预热连接，让第一轮请求直接使用已建立的连接
+            from config import ENABLE_CONNECTION_PREWARM, PREWARM_LEAD_SECONDS
+            if ENABLE_CONNECTION_PREWARM:
+                self._precise_wait_until(start_time - timedelta(seconds=PREWARM_LEAD_SECONDS), advance_ms=0)
+                logger.info(f"用户 {self.user_data['userName']} 预热报名连接")
+                self._warm_up(start_time)
+
+            # 精确等待到报名开始时间
+            logger.info(f"用户 {self.user_data['userName']} 进入精确等待阶段")
+            self._fire_at[activity_id] = to_epoch(start_time) - fire_advance()
+            fire_error = self._precise_wait_until(start_time)
+            logger.info(f"用户 {self.user_data['userName']} 活动 {activity_id} 触发误差 {fire_error * 1000:.2f}ms "
+                        f"(提前量 {fire_advance() * 1000:.1f}ms)")
+
+            if cancellation.cancelled:
+                logger.info(f"用户 {self.user_data['userName']} 活动 {activity_id} 报名已取消")
+                return
 
-        # 开始多线程抢报名
-        self._start_signup_threads(activity_id)
+            # 开始抢报名
+            self._start_signup(activity_id)
+        finally:
+            self._end_burst(activity_id, cancellation)
 
-    def _start_signup_threads(self, activity_id: str):
+    def _end_burst(self, activity_id: str, cancellation: Cancellation):
         """
-        启动多线程报名（优化版本）
+        清理一次报名的状态，常驻模式下这些按活动记录的状态不会无限增长，下次报名也不会用到已经取消的取消信号
         :param activity_id: 活动 ID
+        :param cancellation: 本次报名的取消信号
         """
-        logger.info(f"用户 {self.user_data['userName']} 开始多线程报名活动 {activity_id}")
-
-        # 使用更多初始线程，提高成功率
-        max_workers = 8
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-
-            # 第一轮：立即发起5个快速请求
-            logger.info("启动第一轮快速报名...")
-            futures.extend([executor.submit(self._signup_worker, activity_id) for _ in range(5)])
-
-            # 第二轮：每0.5秒一次，持续15次
-            logger.info("启动第二轮密集报名...")
-            for i in range(15):
-                if self.signup_flags.get(activity_id):
-                    logger.success("报名成功，停止后续请求")
-                    break
-                futures.append(executor.submit(self._signup_worker, activity_id))
-                time.sleep(0.4)
-
-            # 第三轮：每秒一次，持续45次
-            logger.info("启动第三轮持续报名...")
-            for i in range(45):
-                if self.signup_flags.get(activity_id):
-                    logger.success("报名成功，停止后续请求")
-                    break
-                futures.append(executor.submit(self._signup_worker, activity_id))
-                time.sleep(0.8)
-
-            # 等待所有任务完成
-            completed_count = 0
-            for future in futures:
-                try:
-                    result = future.result(timeout=2)
-                    if result:
-                        completed_count += 1
-                except Exception as e:
-                    logger.debug(f"报名线程异常: {e}")
-
-            # 最终状态检查
-            if self.signup_flags.get(activity_id, False):
-                logger.success(f"用户 {self.user_data['userName']} 活动 {activity_id} 报名成功！")
+        with self._lock:
+            self._burst_start.pop(activity_id, None)
+            self._fire_at.pop(activity_id, None)
+            self._first_response_logged.discard(activity_id)
+            if self._cancellations.get(activity_id) is cancellation:
+                del self._cancellations[activity_id]
+
+    def _warm_up(self, start_time: datetime):
+        """
+        预热报名引擎使用的连接池：协程引擎使用自己的 aiohttp 连接池，多线程引擎使用共享的 requests 连接池。
+        同一个报名时刻在进程内只预热一次
+        :param start_time: 报名开始时间（服务器时间）
+        """
+        from config import PREWARM_CONNECTIONS, SIGNUP_ENGINE
+        key = to_epoch(start_time)
+        if SIGNUP_ENGINE == "asyncio":
+            try:
+                from utils.async_engine import warm_up
+            except ImportError as e:
+                _warn_engine_fallback(e)
             else:
-                logger.error(f"用户 {self.user_data['userName']} 活动 {activity_id} 报名失败，发送失败邮件通知")
-                self._send_fail_email_notification(activity_id)
+                warm_up_once(("asyncio", key), PREWARM_CONNECTIONS, warm=warm_up)
+                return
+        warm_up_once(key, PREWARM_CONNECTIONS)
 
-    def _signup_worker(self, activity_id: str) -> bool:
+    def _start_signup(self, activity_id: str):
         """
-        报名工作线程（优化版本）
+        按配置选择报名引擎发起报名，结束后检查最终状态
         :param activity_id: 活动 ID
-        :return: True 表示报名成功，False 表示失败
         """
-        max_attempts = 5  # 每个线程最多尝试 5 次
+        from config import SIGNUP_ENGINE
+        strategy = make_strategy(activity_id)
+        cancellation = self._cancellations.get(activity_id)
+        if cancellation is None:
+            cancellation = self._cancellations[activity_id] = Cancellation()
+        self._burst_start[activity_id] = time.perf_counter()
+        started_at = time.time()
+
+        if SIGNUP_ENGINE == "asyncio":
+            try:
+                from utils.async_engine import run_signup_burst
+            except ImportError as e:
+                _warn_engine_fallback(e)
+                self._start_signup_threads(activity_id, strategy, cancellation)
+            else:
+                run_signup_burst(self, activity_id, strategy, cancellation)
+        else:
+            self._start_signup_threads(activity_id, strategy, cancellation)
+
+        if cancellation.cancelled_at is not None:
+            logger.info(f"用户 {self.user_data['userName']} 活动 {activity_id} 停止报名后 "
+                        f"{(time.perf_counter() - cancellation.cancelled_at) * 1000:.1f}ms 结束")
+
+        # 最终状态检查
+        logger.info(f"用户 {self.user_data['userName']} 活动 {activity_id} 报名结束，"
+                    f"策略 {strategy.name}，请求结果统计: {strategy.outcomes}")
+        if self.signup_flags.get(activity_id, False):
+            logger.success(f"用户 {self.user_data['userName']} 活动 {activity_id} 报名成功！")
+        else:
+            reason = {burst.FULL: "名额已满", burst.CLOSED: "报名已关闭"}.get(strategy.stopped, "报名失败")
+            logger.error(f"用户 {self.user_data['userName']} 活动 {activity_id} {reason}，发送失败邮件通知")
+            self._send_fail_email_notification(activity_id)
+
+        store = get_state_store()
+        if store is not None:
+            store.record_attempt(self.user_data['userName'], activity_id,
+                                 success=self.signup_flags.get(activity_id, False),
+                                 outcome=strategy.stopped,
+                                 requests=sum(strategy.outcomes.values()),
+                                 duration=time.perf_counter() - self._burst_start[activity_id],
+                                 started_at=started_at)
+
+    def _start_signup_threads(self,
+                              activity_id: str,
+                              strategy: Optional[BurstStrategy] = None,
+                              cancellation: Optional[Cancellation] = None):
+        """
+        启动多线程报名，按策略决定何时启动报名线程、何时停止
+        :param activity_id: 活动 ID
+        :param strategy: 报名节奏策略，默认按配置创建
+        :param cancellation: 取消信号，报名成功或策略停止时发出
+        """
+        strategy = strategy or make_strategy(activity_id)
+        cancellation = cancellation or Cancellation()
+        logger.info(f"用户 {self.user_data['userName']} 开始多线程报名活动 {activity_id}（策略: {strategy.name}）")
+
+        # 有新的请求结果、有线程结束或被取消时唤醒调度循环
+        wake = threading.Event()
+        cancellation.add_callback(wake.set)
+        started = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix=f"join-{activity_id}")
+        futures = []
+        current_phase = None
+        try:
+            while not cancellation.cancelled:
+                elapsed = time.perf_counter() - started
+                launch_at = strategy.next_launch(elapsed)
+                if launch_at is None:
+                    break
+                if launch_at > elapsed:
+                    wake.wait(launch_at - elapsed)
+                    wake.clear()
+                    continue
+
+                phase = strategy.launched(elapsed)
+                if phase != current_phase:
+                    logger.info(f"启动报名阶段 {phase}...")
+                    current_phase = phase
+                future = executor.submit(self._signup_worker, activity_id, strategy, phase, wake, cancellation)
+                future.add_done_callback(lambda _: wake.set())
+                futures.append(future)
 
-        for attempt in range(max_attempts):
             if self.signup_flags.get(activity_id):
-                return True
-
-            try:
-                if self._send_signup_request(activity_id):
+                logger.success("报名成功，停止后续请求")
+            elif strategy.stopped is not None:
+                logger.warning(f"用户 {self.user_data['userName']} 活动 {activity_id} 停止报名: {strategy.stopped}")
+                cancellation.cancel()
+
+            # 策略发完后等待在途的请求，取消后不再等待
+            pending = [f for f in futures if not f.done()]
+            while pending and not cancellation.cancelled:
+                wake.wait()
+                wake.clear()
+                pending = [f for f in pending if not f.done()]
+        finally:
+            # 丢弃排队中的任务；在途的请求不再等待，返回后其结果会被忽略
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _signup_worker(self,
+                       activity_id: str,
+                       strategy: BurstStrategy,
+                       phase=None,
+                       wake: Optional[threading.Event] = None,
+                       cancellation: Optional[Cancellation] = None) -> bool:
+        """
+        报名工作线程，最多尝试 strategy.attempts 次，每次的结果交给策略
+        :param activity_id: 活动 ID
+        :param strategy: 报名节奏策略
+        :param phase: 所在的报名阶段，用于统计
+        :param wake: 有新结果时通知调度循环
+        :param cancellation: 取消信号，取消后不再发送请求，重试间隔的等待也立即结束
+        :return: True 表示报名成功，False 表示失败
+        """
+        cancellation = cancellation or Cancellation()
+        try:
+            for attempt in range(strategy.attempts):
+                if self.signup_flags.get(activity_id):
                     return True
+                if strategy.stopped or cancellation.cancelled:
+                    return False
+                if attempt:
+                    metrics.inc(JOIN_RETRIES_TOTAL, phase=phase)
 
-                time.sleep(0.01)
-
-            except Exception as e:
-                logger.error(f"用户 {self.user_data['userName']} 报名线程异常: {str(e)}")
-                time.sleep(0.1)
+                try:
+                    outcome = self._send_signup_request(activity_id, phase)
+                except Exception as e:
+                    logger.error(f"用户 {self.user_data['userName']} 报名线程异常: {str(e)}")
+                    outcome = burst.ERROR
+                strategy.record(outcome)
+                if wake is not None:
+                    wake.set()
+                if outcome == burst.SUCCESS:
+                    return True
+                if strategy.stopped:
+                    return False
+                if cancellation.wait(strategy.retry_interval if outcome != burst.ERROR else 0.1):
+                    return False
 
-        return False
+            return False
+        finally:
+            strategy.released()
+            if wake is not None:
+                wake.set()
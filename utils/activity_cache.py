@@ -0,0 +1,122 @@
+"""
+进程内共享的活动信息缓存
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict
+
+from config import ACTIVITY_INFO_CACHE_TTL, ACTIVITY_INFO_CACHE_SIZE
+
+# 默认最多等待其他调用方在途请求的秒数，应与活动信息请求的超时相当
+DEFAULT_WAIT = 10
+
+
+def _is_auth_error(error: BaseException) -> bool:
+    # 401/403 只说明发起请求的用户的 token 有问题，不能让其他用户也认为请求失败
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) in (401, 403)
+
+
+class _InFlight:
+    """
+    正在进行中的一次请求，其他等待同一活动的调用方共享它的结果
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Dict = {}
+        self.error: BaseException | None = None
+
+
+class ActivityInfoCache:
+    """
+    以活动 id 为键的活动信息缓存：
+    - 超过 ttl 秒的条目视为过期
+    - 超过 max_size 时淘汰最久未使用的条目
+    - 同一活动同时只会有一个请求在途，并发调用方等待并共享这一次的结果；
+      在途请求因 token 失效（401/403）失败或迟迟没有返回时，等待的调用方改用自己的 fetch 重新请求
+    """
+
+    def __init__(self, ttl: float = ACTIVITY_INFO_CACHE_TTL, max_size: int = ACTIVITY_INFO_CACHE_SIZE):
+        """
+        :param ttl: 缓存有效期（秒）
+        :param max_size: 最多缓存的活动数
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # 等待并复用了其他调用方在途请求的次数
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # 活动id -> (写入时间, 信息)
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+
+    def get(self, activity_id, fetch: Callable[[], Dict], wait: float = DEFAULT_WAIT) -> Dict:
+        """
+        获取活动信息，缓存未命中时调用 fetch 获取
+        :param activity_id: 活动 id
+        :param fetch: 实际请求活动信息的函数（使用调用方自己的 token），除 401/403 外抛出的异常会传递给所有等待的调用方
+        :param wait: 最多等待其他调用方在途请求的秒数，一般取请求超时，超过后自己请求
+        :return: 活动信息
+        """
+        key = str(activity_id)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                self.misses += 1
+                call = self._in_flight[key] = _InFlight()
+            else:
+                self.shared += 1
+
+        if not leader:
+            if not call.event.wait(wait) or (call.error is not None and _is_auth_error(call.error)):
+                return self._store(key, fetch())
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._store(key, fetch())
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            call.event.set()
+
+    def _store(self, key: str, info: Dict) -> Dict:
+        if info:  # 请求失败返回的空信息不缓存
+            with self._lock:
+                self._data[key] = (time.monotonic(), info)
+                self._data.move_to_end(key)
+                while len(self._data) > self.max_size:
+                    self._data.popitem(last=False)
+        return info
+
+    def invalidate(self, activity_id) -> None:
+        """
+        删除某个活动的缓存
+        :param activity_id: 活动 id
+        """
+        with self._lock:
+            self._data.pop(str(activity_id), None)
+
+    def stats(self) -> Dict:
+        """
+        :return: 命中、未命中、共享在途请求的次数和当前缓存条目数
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "shared": self.shared, "size": len(self._data)}
+
+
+# 进程内共享的活动信息缓存
+activity_info_cache = ActivityInfoCache()
@@ -0,0 +1,176 @@
+"""
+持久化的已见活动索引
+
+记录每个在活动列表中出现过的活动：列表条目的指纹、最近一次获取的详细信息、按院系判定的是否满足报名条件，
+以及已经自动加入过哪些用户的报名列表。增量发现时列表照常翻页，但只有新出现的、列表条目有变化的
+或详细信息过旧的活动才会重新请求详细信息，定期发现的开销只和变化的活动数有关。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from config import ACTIVITY_INDEX_FILE, ACTIVITY_INDEX_REFRESH, ACTIVITY_INDEX_RETENTION_DAYS
+
+
+def fingerprint(item: Dict) -> str:
+    """
+    :param item: 活动列表中的一个条目
+    :return: 条目内容的指纹，内容不变指纹就不变
+    """
+    text = json.dumps(item, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ActivityIndex:
+    """
+    以活动 id 为键的索引，多线程共享，save 时整体写入文件
+    """
+
+    def __init__(self,
+                 path: str = ACTIVITY_INDEX_FILE,
+                 refresh: float = ACTIVITY_INDEX_REFRESH,
+                 retention_days: float = ACTIVITY_INDEX_RETENTION_DAYS):
+        """
+        :param path: 索引文件路径，为空则只保存在内存中
+        :param refresh: 详细信息超过多少秒后即使列表条目没变也重新获取
+        :param retention_days: 多少天没有在列表中出现的活动从索引中删除
+        """
+        self.path = path
+        self.refresh = refresh
+        self.retention = retention_days * 86400
+        self._entries: Optional[Dict[str, Dict]] = None  # 第一次使用时才读取文件
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._entries is None:
+            self._entries = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f).get("activities", {})
+                    logger.info(f"已加载活动索引，共 {len(self._entries)} 个活动")
+                except (OSError, ValueError, AttributeError) as e:
+                    logger.warning(f"活动索引 {self.path} 读取失败，将重新建立: {str(e)}")
+        return self._entries
+
+    def lookup(self, item: Dict) -> Optional[Dict]:
+        """
+        列表中出现了一个活动，记录下来并返回仍然可用的详细信息
+        :param item: 活动列表中的条目
+        :return: 列表条目没变且未过期时返回上次的详细信息，否则返回 None，需要重新获取
+        """
+        key = str(item.get("id"))
+        mark = fingerprint(item)
+        now = time.time()
+        with self._lock:
+            entry = self._load().setdefault(key, {})
+            entry["seen"] = now
+            if (entry.get("fingerprint") == mark and entry.get("info")
+                    and now - entry.get("checked", 0) < self.refresh):
+                return entry["info"]
+            entry["pending"] = mark
+            return None
+
+    def update(self, activity_id, info: Dict) -> None:
+        """
+        保存新获取的详细信息，之前的判定结果作废
+        :param activity_id: 活动 id
+        :param info: 详细信息
+        """
+        with self._lock:
+            entry = self._load().setdefault(str(activity_id), {"seen": time.time()})
+            entry["fingerprint"] = entry.pop("pending", entry.get("fingerprint"))
+            entry["info"] = info
+            entry["checked"] = time.time()
+            entry["valid"] = {}
+
+    def verdict(self, activity_id, college: str) -> Optional[bool]:
+        """
+        :return: 该院系的用户是否满足报名条件，还没判定过时为 None
+        """
+        with self._lock:
+            return self._load().get(str(activity_id), {}).get("valid", {}).get(college or "")
+
+    def set_verdict(self, activity_id, college: str, valid: bool) -> None:
+        with self._lock:
+            entry = self._load().get(str(activity_id))
+            if entry is not None:
+                entry.setdefault("valid", {})[college or ""] = valid
+
+    def queued(self, activity_id, user_name: str) -> bool:
+        """
+        :return: 该活动是否已经自动加入过该用户的报名列表（用户之后手动删掉的不会再次加入）
+        """
+        with self._lock:
+            return user_name in self._load().get(str(activity_id), {}).get("queued", [])
+
+    def mark_queued(self, activity_id, user_name: str) -> None:
+        with self._lock:
+            entry = self._load().setdefault(str(activity_id), {"seen": time.time()})
+            queued = entry.setdefault("queued", [])
+            if user_name not in queued:
+                queued.append(user_name)
+
+    def save(self) -> None:
+        """
+        删除长期未出现的活动，并写入索引文件
+        """
+        if not self.path:
+            return
+        with self._lock:
+            entries = self._load()
+            expired = [k for k, v in entries.items() if time.time() - v.get("seen", 0) > self.retention]
+            for key in expired:
+                del entries[key]
+            data = json.dumps({"activities": entries}, ensure_ascii=False)
+        # 先写临时文件再替换，中途退出也不会留下写了一半的索引
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load())
+
+
+def queue_new_activities(user: Dict, index: Optional["ActivityIndex"] = None,
+                         matches: Optional[List[Dict]] = None) -> List:
+    """
+    增量发现满足用户筛选条件的活动，把还没加入过的活动追加到 user['activity_ids']
+    :param user: 用户信息，需要包含有效的 token
+    :param index: 活动索引，默认使用进程内共享的索引
+    :param matches: 已经筛选好的活动（如 utils.catalog.match_users 的结果），为 None 时单独为该用户获取活动列表
+    :return: 新加入的活动 id
+    """
+    from utils.tools import iter_allowed_activities
+    if index is None:
+        index = activity_index
+    activity_ids = user.setdefault("activity_ids", [])
+    existing = {str(a) for a in activity_ids}
+
+    added = []
+    if matches is None:
+        matches = iter_allowed_activities(user, index=index)
+    for activity in matches:
+        activity_id = activity.get("activity_id")
+        if str(activity_id) in existing or index.queued(activity_id, user.get("userName")):
+            # 已在列表中的也记为加入过，用户之后删掉就不会再被加回来
+            index.mark_queued(activity_id, user.get("userName"))
+            continue
+        activity_ids.append(activity_id)
+        existing.add(str(activity_id))
+        index.mark_queued(activity_id, user.get("userName"))
+        added.append(activity_id)
+        logger.info(f"用户 {user.get('userName')} 自动加入活动 {activity_id}: {activity.get('活动名称')}")
+    index.save()
+    return added
+
+
+# 进程内共享的活动索引
+activity_index = ActivityIndex()
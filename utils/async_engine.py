@@ -0,0 +1,314 @@
+"""
+基于 asyncio 的报名引擎
+
+与多线程引擎使用相同的报名节奏策略（见 utils.burst），但所有请求都以协程的形式运行在进程内唯一的事件循环上，
+节奏由事件循环定时器控制，报名成功或策略停止后立即取消所有未完成的请求。
+需要安装 aiohttp。
+"""
+import asyncio
+import threading
+import time
+from typing import Optional, Tuple, TYPE_CHECKING
+
+import aiohttp
+from loguru import logger
+
+from config import HTTP_POOL_SIZE
+from utils.http_client import api_url
+from utils.metrics import metrics, response_code, JOIN_RETRIES_TOTAL, JOIN_HEDGES_TOTAL
+from utils import burst
+from utils.burst import BurstStrategy
+from utils.cancel import Cancellation
+from utils.governor import get_governor, JOIN_WAIT
+from utils.hedge import join_latency
+
+if TYPE_CHECKING:
+    from utils.activity_bot import ActivityBot
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_client: Optional[aiohttp.ClientSession] = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """
+    获取进程内共享的事件循环，首次调用时在后台线程中启动
+    :return: 事件循环
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="signup-event-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def _get_client() -> aiohttp.ClientSession:
+    """
+    获取共享的 aiohttp 会话，只能在事件循环线程内调用
+    :return: aiohttp.ClientSession
+    """
+    global _client
+    if _client is None or _client.closed:
+        _client = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE),
+            timeout=aiohttp.ClientTimeout(total=5),
+        )
+    return _client
+
+
+async def _open_connection(url: str, timeout: float) -> Optional[float]:
+    """
+    发送一次轻量请求以建立（或复用）一条 aiohttp 连接
+    :return: 耗时（秒），失败返回 None
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        async with _get_client().head(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            await response.read()
+    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+        logger.debug(f"连接预热失败: {e}")
+        return None
+    return loop.time() - start
+
+
+def warm_up(count: int, url: Optional[str] = None, timeout: float = 3) -> int:
+    """
+    在事件循环上并发打开 count 条连接放入 aiohttp 连接池，协程引擎的报名请求发出时无需再做 TCP+TLS 握手
+    （与 http_client.warm_up 相同，只是预热的是协程引擎自己的连接池）
+    :param count: 需要预热的连接数，超过连接池大小时取连接池大小
+    :param url: 预热地址，默认为 PU 接口根地址
+    :param timeout: 单次请求超时
+    :return: 成功预热的连接数
+    """
+    url = url or api_url("/")
+    count = max(1, min(count, HTTP_POOL_SIZE))
+
+    async def open_all():
+        # 必须并发请求，串行请求只会反复复用同一条连接
+        return await asyncio.gather(*(_open_connection(url, timeout) for _ in range(count)))
+
+    results = asyncio.run_coroutine_threadsafe(open_all(), _get_loop()).result()
+    ok = [r for r in results if r is not None]
+    if ok:
+        logger.info(f"协程引擎连接预热完成: {len(ok)}/{count} 条, 最慢 {max(ok) * 1000:.1f}ms")
+    else:
+        logger.warning("协程引擎连接预热失败，报名请求将使用新连接")
+    return len(ok)
+
+
+async def _send_signup_request(bot: "ActivityBot", activity_id: str, phase=None, renewed: bool = False) -> str:
+    """
+    发送一次报名请求，token 失效（401）时重新登录并重发一次（与 ActivityBot._send_signup_request 相同）
+    :param phase: 所在的报名阶段，用于统计
+    :param renewed: 是否是重新登录后的重发
+    :return: 报名结果分类，见 utils.burst
+    """
+    if bot.signup_flags.get(activity_id):
+        return burst.SUCCESS
+
+    # 协程不能阻塞在限速器上，令牌不够时让出事件循环等待
+    governor = get_governor()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + JOIN_WAIT
+    while (delay := governor.try_acquire("join")) > 0:
+        if loop.time() + delay > deadline:
+            return burst.THROTTLED
+        await asyncio.sleep(delay)
+
+    token = bot.cur_token
+    bot._mark_first_send(activity_id)
+    try:
+        status, text = await _post_signup(bot, {"activityId": activity_id}, phase)
+        bot._log_first_response(activity_id)
+        logger.debug(f"用户 {bot.user_data['userName']} 报名响应: {text}")
+
+        if status != 200:
+            logger.warning(f"用户 {bot.user_data['userName']} 报名请求失败: HTTP {status}")
+        else:
+            success, status_msg = bot._parse_signup_response(text)
+            if success:
+                # 成功处理中可能有阻塞操作，不能占用事件循环
+                await loop.run_in_executor(None, bot._handle_signup_response, activity_id, text)
+                return burst.SUCCESS
+            logger.debug(f"用户 {bot.user_data['userName']} 报名响应: {status_msg}")
+        outcome = burst.classify(status, text)
+        if outcome == burst.THROTTLED:
+            governor.backoff()
+        elif outcome == burst.UNAUTHORIZED and not renewed:
+            # 登录是阻塞的，同一用户的多个协程同时发现时只有一个登录，其他等待它的结果
+            if await loop.run_in_executor(None, bot._refresh_token, token):
+                return await _send_signup_request(bot, activity_id, phase, renewed=True)
+        return outcome
+
+    except asyncio.TimeoutError:
+        logger.warning(f"用户 {bot.user_data['userName']} 报名请求超时")
+        return burst.TIMEOUT
+    except Exception as e:
+        logger.error(f"用户 {bot.user_data['userName']} 报名请求异常: {str(e)}")
+        return burst.ERROR
+
+
+async def _post_signup(bot: "ActivityBot", data: dict, phase=None) -> Tuple[int, str]:
+    """
+    发送报名请求，超过最近报名耗时的 p90 仍未返回时再发一个对冲请求，取先返回的响应（与 ActivityBot._post_signup 相同）
+    :return: (HTTP 状态码, 响应文本)
+    :raise asyncio.TimeoutError | aiohttp.ClientError: 所有请求都失败时抛出主请求的异常
+    """
+    timeout = join_latency.timeout()
+    delay = join_latency.hedge_delay()
+    primary = asyncio.ensure_future(_post_join(bot, data, phase, timeout))
+    if delay is None:
+        return await primary
+    tasks = {primary: "primary"}
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or get_governor().try_acquire("join") > 0:
+            return await primary
+
+        tasks[asyncio.ensure_future(_post_join(bot, data, phase, timeout))] = "hedge"
+        for task in tasks:
+            # 没被采用的请求出错时不再输出 "Task exception was never retrieved"
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    metrics.inc(JOIN_HEDGES_TOTAL, winner=tasks[task])
+                    return task.result()
+        return primary.result()
+    except asyncio.CancelledError:
+        # 报名成功或策略停止时连同对冲请求一起取消
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def _post_join(bot: "ActivityBot", data: dict, phase, timeout: float) -> Tuple[int, str]:
+    """
+    发送一个报名请求，统计耗时和结果
+    :param timeout: 请求超时（秒）
+    :return: (HTTP 状态码, 响应文本)
+    """
+    record = None
+    start = time.perf_counter()
+    try:
+        with metrics.request("join", phase=phase) as record:
+            async with _get_client().post(bot.activity_url, headers=bot._get_signup_headers(), json=data,
+                                          timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                text = await response.text()
+            record.status = response.status
+            record.code = response_code(text)
+        return response.status, text
+    finally:
+        if record is not None:
+            get_governor().feedback(record.status)
+            if record.status not in ("error", "cancelled"):
+                join_latency.observe(time.perf_counter() - start)
+
+
+async def _signup_worker(bot: "ActivityBot", activity_id: str, strategy: BurstStrategy, phase,
+                         done: asyncio.Event, changed: asyncio.Event):
+    """
+    报名协程，最多尝试 strategy.attempts 次，每次的结果交给策略
+    """
+    try:
+        for attempt in range(strategy.attempts):
+            if done.is_set() or bot.signup_flags.get(activity_id):
+                break
+            if attempt:
+                metrics.inc(JOIN_RETRIES_TOTAL, phase=phase)
+            outcome = await _send_signup_request(bot, activity_id, phase)
+            strategy.record(outcome)
+            changed.set()
+            if outcome == burst.SUCCESS or strategy.stopped:
+                done.set()
+                break
+            try:
+                await asyncio.wait_for(done.wait(), timeout=strategy.retry_interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        strategy.released()
+        changed.set()
+
+
+async def _burst(bot: "ActivityBot", activity_id: str, strategy: BurstStrategy, cancellation: Cancellation):
+    """
+    按策略启动报名协程，报名成功、策略停止或收到取消信号后取消所有未完成的协程
+    """
+    loop = asyncio.get_running_loop()
+    done = asyncio.Event()  # 报名成功、策略停止或被取消
+    changed = asyncio.Event()  # 有新的请求结果，策略可能调整了节奏
+
+    def stop():
+        done.set()
+        changed.set()
+
+    # 其他线程发出的取消（如报名成功的处理、用户取消）转到事件循环中
+    cancellation.add_callback(lambda: loop.call_soon_threadsafe(stop))
+    tasks = []
+    current_phase = None
+    # 以绝对时间安排每次启动，避免 sleep 误差累积
+    started = loop.time()
+
+    while not (done.is_set() or bot.signup_flags.get(activity_id)):
+        elapsed = loop.time() - started
+        launch_at = strategy.next_launch(elapsed)
+        if launch_at is None:
+            break
+        if launch_at > elapsed:
+            changed.clear()
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=launch_at - elapsed)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        phase = strategy.launched(elapsed)
+        if phase != current_phase:
+            logger.info(f"启动报名阶段 {phase}...")
+            current_phase = phase
+        tasks.append(asyncio.create_task(_signup_worker(bot, activity_id, strategy, phase, done, changed)))
+
+    if bot.signup_flags.get(activity_id):
+        logger.success("报名成功，停止后续请求")
+    elif strategy.stopped is not None:
+        logger.warning(f"用户 {bot.user_data['userName']} 活动 {activity_id} 停止报名: {strategy.stopped}")
+    if done.is_set():
+        cancellation.cancel()
+
+    # 等待剩余协程，一旦成功或停止立即取消仍在进行中的请求
+    pending = {t for t in tasks if not t.done()}
+    while pending:
+        waiter = asyncio.create_task(done.wait())
+        finished, pending = await asyncio.wait(pending | {waiter}, return_when=asyncio.FIRST_COMPLETED)
+        pending.discard(waiter)
+        if done.is_set():
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            break
+        waiter.cancel()
+
+
+def run_signup_burst(bot: "ActivityBot", activity_id: str, strategy: BurstStrategy,
+                     cancellation: Optional[Cancellation] = None) -> None:
+    """
+    在共享事件循环上执行一次报名，阻塞直到结束
+    :param bot: 报名机器人
+    :param activity_id: 活动 ID
+    :param strategy: 报名节奏策略
+    :param cancellation: 取消信号
+    """
+    logger.info(f"用户 {bot.user_data['userName']} 开始协程报名活动 {activity_id}（策略: {strategy.name}）")
+    future = asyncio.run_coroutine_threadsafe(_burst(bot, activity_id, strategy, cancellation or Cancellation()),
+                                              _get_loop())
+    try:
+        future.result()
+    except Exception as e:
+        logger.error(f"用户 {bot.user_data['userName']} 协程报名异常: {str(e)}")
@@ -0,0 +1,241 @@
+"""
+报名请求的节奏策略
+
+每个报名请求的结果先被归类（成功、未开始、已满、已结束、被限流、服务器错误、超时……），
+再交给策略决定下一次什么时候发、还发不发：
+- fixed：原来的三段式固定节奏，不看响应内容，直到成功或全部发完
+- adaptive：根据响应调整节奏，报名未开始时加密请求，已满或已结束立即停止，被限流或服务器出错时退避
+新策略继承 BurstStrategy 并加入 STRATEGIES 即可在 config 中按名称选用。
+"""
+import json
+import threading
+from typing import Dict, List, Optional, Tuple, Type
+
+from loguru import logger
+
+# 报名结果分类
+SUCCESS = "success"  # 报名成功或已报名
+NOT_OPEN = "not_open"  # 报名尚未开始
+FULL = "full"  # 名额已满
+CLOSED = "closed"  # 报名已结束、活动取消或不符合报名条件
+THROTTLED = "throttled"  # 请求过于频繁被限流
+UNAUTHORIZED = "unauthorized"  # token 失效（401），重新登录后仍然失效
+SERVER_ERROR = "server_error"  # 服务器 5xx 错误
+TIMEOUT = "timeout"  # 请求超时
+ERROR = "error"  # 网络异常等请求未完成的错误
+FAILED = "failed"  # 其他失败
+
+# 出现这些结果说明再请求也没有意义
+TERMINAL = (SUCCESS, FULL, CLOSED, UNAUTHORIZED)
+
+NOT_OPEN_KEYWORDS = ("报名未开始", "报名尚未开始", "报名还未开始", "未到报名时间", "报名时间未到")
+FULL_KEYWORDS = ("人数已满", "名额已满", "报名已满", "名额不足")
+CLOSED_KEYWORDS = ("报名已结束", "报名已截止", "活动已结束", "活动已取消", "不符合报名条件", "不在报名范围")
+THROTTLED_KEYWORDS = ("频繁", "请稍后", "太快")
+
+
+def classify(status: int, text: str) -> str:
+    """
+    对失败的报名响应进行分类（成功的响应由 ActivityBot._parse_signup_response 判断）
+    :param status: HTTP 状态码
+    :param text: 响应文本
+    :return: 结果分类
+    """
+    if status == 401:
+        return UNAUTHORIZED
+    if status == 429:
+        return THROTTLED
+    if status >= 500:
+        return SERVER_ERROR
+    if status != 200:
+        return FAILED
+
+    try:
+        data = json.loads(text)
+        message = str(data.get("message", "")) if isinstance(data, dict) else text
+    except ValueError:
+        message = text
+    for keywords, outcome in ((NOT_OPEN_KEYWORDS, NOT_OPEN), (FULL_KEYWORDS, FULL),
+                              (CLOSED_KEYWORDS, CLOSED), (THROTTLED_KEYWORDS, THROTTLED)):
+        if any(k in message for k in keywords):
+            return outcome
+    return FAILED
+
+
+class BurstStrategy:
+    """
+    报名节奏策略的基类，多线程共享，方法都需要线程安全。
+    驱动方（多线程引擎或协程引擎）的循环为：
+        at = next_launch(elapsed)  -> None 表示停止；大于 elapsed 则等到 at（或有新结果时）再问一次
+        phase = launched(elapsed)  -> 启动一个报名线程，最多尝试 attempts 次，每次结果交给 record
+        released()                 -> 报名线程结束
+    """
+    name = ""
+    attempts = 1  # 每个报名线程最多尝试次数
+    retry_interval = 0.01  # 同一线程两次尝试之间的间隔（秒）
+
+    def __init__(self):
+        self.stopped: Optional[str] = None  # 停止的原因（结果分类），None 表示仍在进行
+        self.in_flight = 0
+        self.outcomes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def next_launch(self, elapsed: float) -> Optional[float]:
+        """
+        :param elapsed: 报名开始以来的秒数
+        :return: 下一个报名线程应在报名开始后第几秒启动，None 表示不再启动
+        """
+        raise NotImplementedError
+
+    def launched(self, elapsed: float):
+        """
+        记录启动了一个报名线程
+        :return: 该线程所在的阶段，用于日志和统计
+        """
+        with self._lock:
+            self.in_flight += 1
+            return self._launched(elapsed)
+
+    def _launched(self, elapsed: float):
+        raise NotImplementedError
+
+    def released(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def record(self, outcome: str) -> None:
+        """
+        记录一次报名请求的结果
+        :param outcome: 结果分类
+        """
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if self.stopped is None:
+                self._record(outcome)
+
+    def _record(self, outcome: str) -> None:
+        if outcome == SUCCESS:
+            self.stopped = SUCCESS
+
+
+class FixedBurst(BurstStrategy):
+    """
+    三段式固定节奏：第一轮立即启动 5 个线程，第二轮每 0.4 秒启动一个共 15 个，第三轮每 0.8 秒启动一个共 45 个，
+    每个线程最多尝试 5 次。只有报名成功才会提前停止
+    """
+    name = "fixed"
+    attempts = 5
+    # (阶段, 线程数, 启动间隔秒)
+    PHASES = ((1, 5, 0.0), (2, 15, 0.4), (3, 45, 0.8))
+
+    def __init__(self):
+        super().__init__()
+        self._schedule: List[Tuple[float, int]] = []  # (启动时刻, 阶段)
+        at = 0.0
+        for phase, count, interval in self.PHASES:
+            for _ in range(count):
+                self._schedule.append((at, phase))
+                at += interval
+        self._index = 0
+
+    def next_launch(self, elapsed: float) -> Optional[float]:
+        with self._lock:
+            if self.stopped or self._index >= len(self._schedule):
+                return None
+            return self._schedule[self._index][0]
+
+    def _launched(self, elapsed: float):
+        phase = self._schedule[self._index][1]
+        self._index += 1
+        return phase
+
+
+class AdaptiveBurst(BurstStrategy):
+    """
+    根据响应调整节奏：
+    - 报名未开始：请求间隔减半（不低于 min_interval），尽快赶上开放时刻
+    - 已满、已结束、重新登录后 token 仍然失效：立即停止
+    - 被限流：间隔加倍；服务器错误、超时：间隔乘 1.5（都不超过 max_interval）
+    - 同时在途的请求不超过 max_in_flight，超过 deadline 秒后停止
+    """
+    name = "adaptive"
+
+    def __init__(self,
+                 initial: int = 3,
+                 interval: float = 0.1,
+                 min_interval: float = 0.02,
+                 max_interval: float = 2.0,
+                 max_in_flight: int = 8,
+                 deadline: float = 45.0):
+        """
+        :param initial: 报名开始时立即发出的请求数
+        :param interval: 初始请求间隔（秒）
+        :param min_interval: 最小请求间隔（秒）
+        :param max_interval: 最大请求间隔（秒）
+        :param max_in_flight: 同时在途的最大请求数
+        :param deadline: 报名开始后多少秒停止
+        """
+        super().__init__()
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_in_flight = max_in_flight
+        self.deadline = deadline
+        self.mode = "initial"
+        self._initial_left = initial
+        self._last_launch = 0.0
+
+    def next_launch(self, elapsed: float) -> Optional[float]:
+        with self._lock:
+            if self.stopped or elapsed >= self.deadline:
+                return None
+            if self.in_flight >= self.max_in_flight:
+                # 等有请求返回后再决定
+                return elapsed + self.interval
+            if self._initial_left > 0:
+                return elapsed
+            return self._last_launch + self.interval
+
+    def _launched(self, elapsed: float):
+        self._last_launch = elapsed
+        if self._initial_left > 0:
+            self._initial_left -= 1
+            return "initial"
+        return self.mode
+
+    def _record(self, outcome: str) -> None:
+        if outcome in TERMINAL:
+            self.stopped = outcome
+        elif outcome == NOT_OPEN:
+            self.mode = "ramp"
+            self.interval = max(self.min_interval, self.interval / 2)
+        elif outcome == THROTTLED:
+            self.mode = "backoff"
+            self.interval = min(self.max_interval, self.interval * 2)
+        elif outcome in (SERVER_ERROR, TIMEOUT, ERROR):
+            self.mode = "backoff"
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        else:
+            self.mode = "steady"
+
+
+# 可选的策略，名称 -> 策略类
+STRATEGIES: Dict[str, Type[BurstStrategy]] = {
+    FixedBurst.name: FixedBurst,
+    AdaptiveBurst.name: AdaptiveBurst,
+}
+
+
+def make_strategy(activity_id) -> BurstStrategy:
+    """
+    按 config.ACTIVITY_BURST_STRATEGIES（按活动指定）或 config.BURST_STRATEGY（默认）创建策略
+    :param activity_id: 活动 ID
+    :return: 新的策略实例，每次报名一个
+    """
+    from config import BURST_STRATEGY, ACTIVITY_BURST_STRATEGIES
+    name = ACTIVITY_BURST_STRATEGIES.get(str(activity_id), BURST_STRATEGY)
+    strategy = STRATEGIES.get(name)
+    if strategy is None:
+        logger.warning(f"未知的报名策略 {name}，改用 {AdaptiveBurst.name}")
+        strategy = AdaptiveBurst
+    return strategy()
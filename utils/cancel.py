@@ -0,0 +1,54 @@
+"""
+报名的取消信号
+"""
+import threading
+import time
+from typing import Callable, List
+
+
+class Cancellation:
+    """
+    一次报名的取消信号，多线程共享：
+    - 报名线程用 wait(秒数) 代替 time.sleep，取消时立即醒来
+    - 事件循环通过 add_callback 注册回调，取消时在取消方的线程中调用（回调里应使用 call_soon_threadsafe）
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.cancelled_at: float | None = None  # 取消的时刻（perf_counter）
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        """
+        发出取消信号，重复调用无副作用
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.cancelled_at = time.perf_counter()
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        等待 timeout 秒或直到被取消
+        :return: True 表示已被取消
+        """
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """
+        注册取消时的回调，已取消则立即调用
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
@@ -0,0 +1,112 @@
+"""
+学校级的活动目录
+
+同一学校（sid）、筛选条件（categorys、allowYears、oids）相同的用户看到的是同一份活动列表，各自获取会让每个用户都重新
+下载列表和详细信息。这里按 (学校, 筛选条件) 分组，每组只获取一次活动列表：筛选条件仍然交给活动列表接口在服务器端处理，
+本地只按院系（allowCollege）建立索引，再为组内每个用户判断是否满足报名条件。
+不同组都出现的活动，详细信息由活动索引和活动信息缓存共享，只请求一次。
+"""
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+from loguru import logger
+
+# 在服务器端筛选的条件
+FILTER_KEYS = ("categorys", "allowYears", "oids")
+
+
+def filter_key(user: Dict) -> Tuple:
+    """
+    :param user: 用户信息
+    :return: 用户在服务器端筛选的条件，相同的用户可以共用一份活动列表
+    """
+    return tuple(tuple(sorted(str(v) for v in user.get(key) or [])) for key in FILTER_KEYS)
+
+
+class ActivityCatalog:
+    """
+    一个学校在某组筛选条件下全部未开始活动的详细信息及其按院系的索引
+    """
+
+    def __init__(self, sid, infos: Dict[str, Dict]):
+        """
+        :param sid: 学校 id
+        :param infos: 活动id -> 详细信息
+        """
+        self.sid = sid
+        self.infos = infos
+        self.by_college: Dict[str, Set[str]] = defaultdict(set)
+        self.any_college: Set[str] = set()  # 不限院系的活动
+        for activity_id, info in infos.items():
+            colleges = [c.get("name") for c in info.get("allowCollege") or []]
+            for college in colleges:
+                self.by_college[college].add(activity_id)
+            if not colleges:
+                self.any_college.add(activity_id)
+
+    def __len__(self) -> int:
+        return len(self.infos)
+
+    def candidates(self, user: Dict) -> Set[str]:
+        """
+        按用户所在院系从索引中取出候选活动
+        :param user: 用户信息
+        :return: 候选活动 id
+        """
+        return self.any_college | self.by_college.get(user.get("college"), set())
+
+    def match(self, user: Dict, index=None) -> List[Dict]:
+        """
+        :param user: 用户信息
+        :param index: 活动索引，用来缓存判定结果
+        :return: 满足用户筛选条件的活动信息（与 iter_allowed_activities 返回的格式相同），按活动 id 排序
+        """
+        from utils.tools import is_valid_activity, get_single_activity
+        college = user.get("college")
+        matches = []
+        for activity_id in sorted(self.candidates(user), key=lambda a: int(a) if a.isdigit() else 0):
+            info = self.infos[activity_id]
+            valid = index.verdict(activity_id, college) if index is not None else None
+            if valid is None:
+                valid = is_valid_activity(info, college)
+                if index is not None:
+                    index.set_verdict(activity_id, college, valid)
+            if valid:
+                matches.append(get_single_activity(info.get("id", activity_id), info))
+        return matches
+
+
+def fetch_catalog(user: Dict, index=None) -> ActivityCatalog:
+    """
+    按用户的筛选条件获取其所在学校全部未开始的活动
+    :param user: 该学校、该组筛选条件下任意一个已登录的用户，需要包含 token 和 sid
+    :param index: 活动索引，列表条目没变的活动不再重新请求详细信息
+    :return: 活动目录
+    """
+    from utils.tools import iter_activity_infos
+    probe = {"userName": user.get("userName"), "token": user.get("token"), "sid": user.get("sid"),
+             **{key: user.get(key) for key in FILTER_KEYS if user.get(key)}}
+    infos = {str(activity_id): info for activity_id, info in iter_activity_infos(probe, index=index)}
+    logger.info(f"学校 {user.get('sid')} 的活动目录获取完成，共 {len(infos)} 个未开始的活动")
+    return ActivityCatalog(user.get("sid"), infos)
+
+
+def match_users(users: List[Dict], index=None) -> Dict[str, List[Dict]]:
+    """
+    同一学校、筛选条件相同的用户只获取一次活动目录，再为每个用户筛选满足条件的活动
+    :param users: 已登录的用户（需要包含 token）
+    :param index: 活动索引
+    :return: 用户名 -> 满足条件的活动信息
+    """
+    groups: Dict[Tuple, List[Dict]] = defaultdict(list)
+    for user in users:
+        if user.get("token"):
+            groups[(str(user.get("sid")), filter_key(user))].append(user)
+
+    result: Dict[str, List[Dict]] = {}
+    for members in groups.values():
+        catalog = fetch_catalog(members[0], index)
+        for user in members:
+            result[user["userName"]] = catalog.match(user, index)
+            logger.info(f"用户 {user['userName']} 有 {len(result[user['userName']])} 个满足筛选条件的活动")
+    return result
@@ -0,0 +1,175 @@
+"""
+服务器时钟同步
+
+HTTP Date 头只有秒级精度，单次采样的误差可达 1 秒。这里多次采样，并把采样安排在预计的
+“服务器秒数跳变”时刻附近：
+- 每个采样说明服务器在 [发出时刻, 收到时刻] 之间的某一刻时间处于 [Date, Date + 1) 内，
+  即 偏差 ∈ (Date - 收到时刻, Date + 1 - 发出时刻)
+- 只保留往返时间（RTT）接近最小值的采样，把它们的区间取交集，交集中点即偏差估计，半宽即误差上界
+- 每次都在当前估计的跳变时刻发出下一个采样，交集像二分查找一样迅速收窄到 RTT 量级
+同步结果在进程内共享，所有用户只需同步一次；长时间运行时按 config.CLOCK_RESYNC_HOURS 定期重新同步。
+"""
+import math
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import List, Optional, Tuple
+
+import requests
+from loguru import logger
+
+from utils.http_client import api_url, get_session
+from utils.metrics import metrics, CLOCK_SYNC_DURATION, CLOCK_OFFSET, CLOCK_ERROR, CLOCK_MIN_RTT
+
+# RTT 超过最小 RTT 的该倍数（再加 5ms）的采样不参与计算
+RTT_FILTER_FACTOR = 1.5
+
+
+class ServerClock:
+    def __init__(self):
+        self.offset = 0.0  # 服务器时间 - 本地时间（秒）
+        self.error = 0.5  # 偏差估计的误差上界（秒）
+        self.min_rtt: Optional[float] = None  # 最小往返时间（秒）
+        self.synced = False
+        self._attempted = False
+        self._attempted_at = 0.0  # 上次同步的时刻（monotonic）
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._anchor()
+
+    def _anchor(self) -> None:
+        """
+        记录本地时间与单调时钟的对应关系，此后服务器时间完全由单调时钟推算，不受系统时间跳变影响
+        """
+        self._anchor_server_ns = int((time.time() + self.offset) * 1e9)
+        self._anchor_perf_ns = time.perf_counter_ns()
+
+    def now_ns(self) -> int:
+        """
+        :return: 当前服务器时间（Unix 纳秒）
+        """
+        return self._anchor_server_ns + (time.perf_counter_ns() - self._anchor_perf_ns)
+
+    def now(self) -> float:
+        """
+        :return: 当前服务器时间（Unix 秒）
+        """
+        return self.now_ns() / 1e9
+
+    @staticmethod
+    def _sample(url: str) -> Tuple[float, float, int]:
+        """
+        采样一次服务器时间
+        :return: (发出时刻, 收到时刻, 服务器 Date 秒数)，均为 Unix 时间
+        """
+        with metrics.request("clock") as record:
+            send = time.time()
+            response = get_session().head(url, timeout=3)
+            recv = time.time()
+            record.status = response.status_code
+        date = response.headers.get("Date")
+        if not date:
+            raise ValueError("服务器未返回Date头")
+        return send, recv, int(parsedate_to_datetime(date).timestamp())
+
+    @staticmethod
+    def _estimate(samples: List[Tuple[float, float, int]]) -> Tuple[float, float, float]:
+        """
+        根据采样估计偏差
+        :return: (偏差, 误差上界, 最小 RTT)
+        """
+        min_rtt = min(recv - send for send, recv, _ in samples)
+        good = [s for s in samples if s[1] - s[0] <= min_rtt * RTT_FILTER_FACTOR + 0.005]
+        lower = max(date - recv for send, recv, date in good)
+        upper = min(date + 1 - send for send, recv, date in good)
+        if lower <= upper:
+            return (lower + upper) / 2, (upper - lower) / 2, min_rtt
+
+        # 采样互相矛盾（例如服务器集群时钟不一致），退回到最小 RTT 的单次采样
+        send, recv, date = min(good, key=lambda s: s[1] - s[0])
+        return date + 0.5 - (send + recv) / 2, 0.5 + (recv - send) / 2, min_rtt
+
+    def sync(self, url: Optional[str] = None, max_samples: int = 12, target_error: float = 0.01) -> bool:
+        """
+        多次采样同步服务器时间
+        :param url: 采样地址，默认为 PU 接口根地址
+        :param max_samples: 最多采样次数
+        :param target_error: 误差上界达到该值（秒）后提前结束
+        :return: 是否同步成功
+        """
+        url = url or api_url("/")
+        started = time.perf_counter()
+        samples = []
+        failures = 0
+        while len(samples) < max_samples and failures < 3:
+            if len(samples) >= 2:
+                offset, error, min_rtt = self._estimate(samples)
+                if error <= target_error:
+                    break
+                # 让下一个请求恰好在估计的服务器秒数跳变时刻到达服务器
+                arrive = time.time() + min_rtt / 2 + 0.05
+                edge = math.ceil(arrive + offset)
+                time.sleep(max(0.0, edge - offset - min_rtt / 2 - time.time()))
+            try:
+                samples.append(self._sample(url))
+            except (requests.RequestException, ValueError) as e:
+                failures += 1
+                logger.warning(f"时间同步采样失败 ({failures}/3): {e}")
+
+        if not samples:
+            logger.error("时间同步完全失败，使用默认偏差0")
+            return False
+
+        offset, error, min_rtt = self._estimate(samples)
+        metrics.observe(CLOCK_SYNC_DURATION, time.perf_counter() - started)
+        metrics.set(CLOCK_OFFSET, offset)
+        metrics.set(CLOCK_ERROR, error)
+        metrics.set(CLOCK_MIN_RTT, min_rtt)
+        with self._lock:
+            self.offset, self.error, self.min_rtt = offset, error, min_rtt
+            self.synced = True
+            self._anchor()
+        logger.info(f"时间同步成功: 偏差={offset:.3f}秒 ±{error * 1000:.0f}ms, "
+                    f"最小延迟={min_rtt * 1000:.1f}ms, 采样 {len(samples)} 次")
+        return True
+
+    def restore(self, offset: float, error: float, min_rtt: Optional[float]) -> None:
+        """
+        直接使用已有的同步结果（例如父进程的同步结果），之后 ensure_synced 不再采样
+        :param offset: 服务器时间 - 本地时间（秒）
+        :param error: 误差上界（秒）
+        :param min_rtt: 最小往返时间（秒）
+        """
+        with self._lock:
+            self.offset, self.error, self.min_rtt = offset, error, min_rtt
+            self.synced = True
+            self._attempted = True
+            self._attempted_at = time.monotonic()
+            self._anchor()
+
+    def _fresh(self, max_age: Optional[float]) -> bool:
+        return self._attempted and (max_age is None or time.monotonic() - self._attempted_at < max_age)
+
+    def ensure_synced(self, max_age: Optional[float] = None) -> None:
+        """
+        进程内只同步一次，并发调用时其余调用方等待第一次同步完成
+        :param max_age: 距离上次同步超过该秒数时重新同步（失败时保留原来的结果），None 表示不重新同步
+        """
+        if self._fresh(max_age):
+            return
+        with self._sync_lock:
+            if not self._fresh(max_age):
+                self.sync()
+                self._attempted = True
+                self._attempted_at = time.monotonic()
+
+    def resync_if_stale(self) -> None:
+        """
+        距离上次同步超过 config.CLOCK_RESYNC_HOURS 时重新同步
+        """
+        from config import CLOCK_RESYNC_HOURS
+        self.ensure_synced(CLOCK_RESYNC_HOURS * 3600)
+
+
+# 进程内共享的服务器时钟
+server_clock = ServerClock()
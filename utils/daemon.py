@@ -0,0 +1,219 @@
+"""
+常驻模式
+
+不再逐个询问，所有设置都从 config.py 和 user_data.json 读取。程序启动后一直运行，定时检查 user_data.json，
+新增或删除的用户、活动会自动加入或移出调度器，不需要重启；
+连接池、token 和时间同步结果在整个运行期间一直复用，时间同步结果超过 config.CLOCK_RESYNC_HOURS 后重新同步。
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from utils.activity_bot import ActivityBot
+from utils.clock_sync import server_clock
+from utils.metrics import metrics
+from utils.scheduler import SignupJob, SignupScheduler
+from utils.state_store import get_state_store
+from utils.token_manager import token_manager
+
+
+class SignupDaemon:
+    def __init__(self, user_data_file: str, poll_interval: Optional[float] = None):
+        """
+        :param user_data_file: 用户数据文件
+        :param poll_interval: 检查文件修改的间隔（秒），默认取 config.DAEMON_POLL_SECONDS
+        """
+        from config import DAEMON_POLL_SECONDS, AUTO_DISCOVERY, AUTO_DISCOVERY_INTERVAL_MINUTES
+        self.user_data_file = user_data_file
+        self.poll_interval = poll_interval or DAEMON_POLL_SECONDS
+        self.scheduler = SignupScheduler(keep_alive=True)
+        self._bots: Dict[str, ActivityBot] = {}  # 用户名 -> 报名机器人
+        self._credentials: Dict[str, Tuple] = {}  # 用户名 -> (密码, sid)，变化时重新登录
+        self._jobs: Dict[Tuple[str, str], SignupJob] = {}  # (用户名, 活动id) -> 任务
+        self._mtime: Optional[float] = None
+        self._stop = threading.Event()
+        self.auto_discovery = AUTO_DISCOVERY
+        self.discovery_interval = AUTO_DISCOVERY_INTERVAL_MINUTES * 60
+        self._next_discovery = 0.0
+
+    def _check(self) -> None:
+        """
+        文件修改时间变化时重新加载
+        """
+        try:
+            mtime = os.stat(self.user_data_file).st_mtime
+        except OSError:
+            if self._mtime is not None:
+                logger.warning(f"用户数据文件 {self.user_data_file} 不存在，保留当前的报名任务")
+            self._mtime = None
+            return
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self.reload()
+
+    def _load_users(self) -> Optional[List[Dict]]:
+        """
+        读取用户数据：使用状态数据库时先合并导入 user_data.json 的修改，再从数据库读取
+        :return: 用户列表，读取失败返回 None
+        """
+        store = get_state_store()
+        if store is not None:
+            store.import_json(self.user_data_file)
+            return store.load_users()
+        try:
+            with open(self.user_data_file, "r", encoding="utf-8") as file:
+                return json.load(file) or []
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"用户数据读取失败: {e}")
+            return None
+
+    def reload(self) -> None:
+        """
+        读取用户数据，与当前的报名任务对比，增加新的任务、移除已删除的任务。
+        文件格式错误时保留当前的任务，等待下一次修改
+        """
+        data = self._load_users()
+        if data is None:
+            logger.warning("保留当前的报名任务")
+            return
+        users = {user["userName"]: user for user in data if user.get("userName")}
+
+        added = removed = 0
+        for name in list(self._bots):
+            user = users.get(name)
+            if user is None or self._credentials[name] != (user.get("password"), user.get("sid")):
+                removed += self._remove_user(name)
+
+        # 新用户先并发登录，登录失败的用户这次不创建报名任务
+        new_users = [user for name, user in users.items() if name not in self._bots]
+        tokens = token_manager.login_all(new_users)
+
+        for name, user in users.items():
+            if name not in self._bots and not tokens.get(name):
+                continue
+            bot = self._bots.get(name) or self._add_user(user)
+            if bot is None:
+                continue
+            # 邮箱等信息直接更新，token 沿用已登录的
+            bot.user_data.update({k: v for k, v in user.items() if k != "token"})
+            bot.email = user.get("email", "")
+
+            wanted = {str(activity_id): activity_id for activity_id in user.get("activity_ids") or []}
+            for (job_user, key), job in list(self._jobs.items()):
+                if job_user == name and key not in wanted and not job.finished:
+                    self.scheduler.remove_job(job)
+                    removed += 1
+            for key, activity_id in wanted.items():
+                job = self._jobs.get((name, key))
+                # 已经结束（成功或失败）的任务不再重复添加，被移除后又加回来的任务重新添加
+                if job is None or job.cancelled:
+                    self._jobs[(name, key)] = self.scheduler.add_job(bot, activity_id)
+                    added += 1
+
+        active = sum(1 for job in self._jobs.values() if not job.finished)
+        logger.info(f"用户数据已加载: {len(self._bots)} 个用户，新增 {added} 个任务，移除 {removed} 个任务，"
+                    f"进行中 {active} 个任务")
+
+    def _add_user(self, user: Dict) -> Optional[ActivityBot]:
+        """
+        登录新用户
+        :return: 报名机器人，登录失败返回 None（文件下次修改时重试）
+        """
+        logger.info(f"常驻模式加载新用户 {user['userName']}")
+        bot = ActivityBot(dict(user))
+        if not bot.cur_token:
+            logger.error(f"用户 {user['userName']} 登录失败，暂不创建报名任务")
+            return None
+        self._bots[user["userName"]] = bot
+        self._credentials[user["userName"]] = (user.get("password"), user.get("sid"))
+        return bot
+
+    def _remove_user(self, name: str) -> int:
+        """
+        移除用户及其所有报名任务
+        :return: 移除的进行中任务数
+        """
+        logger.info(f"常驻模式移除用户 {name}")
+        removed = 0
+        for (job_user, key), job in list(self._jobs.items()):
+            if job_user == name:
+                if not job.finished:
+                    self.scheduler.remove_job(job)
+                    removed += 1
+                del self._jobs[(job_user, key)]
+        del self._bots[name]
+        del self._credentials[name]
+        return removed
+
+    def _discover(self) -> None:
+        """
+        按每个用户的筛选条件增量发现新活动，有新活动时写回用户数据（状态数据库和用户数据文件），由下一次检查重新加载。
+        同一学校的用户共用一次获取的活动目录
+        """
+        from utils.activity_index import activity_index, queue_new_activities
+        from utils.catalog import match_users
+        store = get_state_store()
+        data = self._load_users()
+        if data is None:
+            logger.warning("跳过本次活动发现")
+            return
+
+        probes = []
+        for user in data:
+            bot = self._bots.get(user.get("userName"))
+            if bot is not None:
+                probes.append((user, {**user, "token": bot.cur_token,
+                                      "activity_ids": list(user.get("activity_ids") or [])}))
+        matches = match_users([probe for _, probe in probes], activity_index)
+
+        added = 0
+        for user, probe in probes:
+            if probe["userName"] not in matches:
+                continue
+            new_ids = queue_new_activities(probe, matches=matches[probe["userName"]])
+            if new_ids:
+                user["activity_ids"] = probe["activity_ids"]
+                added += len(new_ids)
+                if store is not None:
+                    for activity_id in new_ids:
+                        store.add_subscription(user["userName"], activity_id)
+        logger.info(f"自动发现活动完成，新加入 {added} 个活动")
+        if not added:
+            return
+        from utils.user_data_manager import export_user_file, write_user_file
+        if store is None:
+            write_user_file(self.user_data_file, data)
+        else:
+            export_user_file(self.user_data_file, store)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self) -> None:
+        """
+        运行直到 stop 被调用或收到 Ctrl+C
+        """
+        logger.info(f"进入常驻模式，每 {self.poll_interval} 秒检查一次 {self.user_data_file}")
+        server_clock.ensure_synced()
+        thread = threading.Thread(target=self.scheduler.run, name="signup-scheduler", daemon=True)
+        thread.start()
+        try:
+            while not self._stop.is_set():
+                self._check()
+                server_clock.resync_if_stale()
+                if self.auto_discovery and time.monotonic() >= self._next_discovery:
+                    self._discover()
+                    self._next_discovery = time.monotonic() + self.discovery_interval
+                    self._check()
+                metrics.export()
+                self._stop.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            logger.info("收到退出信号，常驻模式结束")
+        finally:
+            self.scheduler.stop()
+            thread.join()
+            metrics.export()
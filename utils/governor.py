@@ -0,0 +1,200 @@
+"""
+进程内全局请求限速
+
+所有用户、所有接口的请求共享一个全局令牌桶，另外每个接口（join、info、list、login）有自己的令牌桶。
+令牌不够时请求排队，报名请求优先于登录、活动信息和活动列表请求。
+全局速率会跟随服务器的实际承受能力调整：收到 429、5xx 或超时后降低，请求正常返回后逐渐回升到上限，
+避免很多用户同时报名时把请求浪费在超时和被限流上。
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils.metrics import metrics, RequestRecord, GOVERNOR_BACKOFFS, GOVERNOR_RATE
+
+# 数字越小越优先
+PRIORITY = {"join": 0, "login": 1, "info": 2, "list": 3}
+# 出错后降低速率的系数，以及两次降低之间的最小间隔（秒），避免同一批失败让速率一降到底
+BACKOFF_FACTOR = 0.75
+BACKOFF_INTERVAL = 0.5
+# 最低降到上限的多少
+MIN_RATE_RATIO = 0.1
+# 报名请求最多等待令牌的秒数，超过后当作被限流处理，由报名策略决定退避多久
+JOIN_WAIT = 1.0
+
+
+class _Bucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self) -> bool:
+        return self.rate <= 0 or self.tokens >= 1
+
+    def wait_time(self) -> float:
+        return 0.0 if self.ready() else (1 - self.tokens) / self.rate
+
+
+class Governor:
+    def __init__(self, max_rate: float, burst: int, budgets: Dict[str, Tuple[float, int]]):
+        """
+        :param max_rate: 全局每秒最多请求数，小于等于 0 表示不限速
+        :param burst: 全局令牌桶容量
+        :param budgets: 接口名 -> (每秒请求数, 令牌桶容量)，每秒请求数小于等于 0 表示该接口不单独限速
+        """
+        self.max_rate = max_rate
+        self._global = _Bucket(max_rate, burst)
+        self._buckets = {name: _Bucket(rate, size) for name, (rate, size) in budgets.items()}
+        self._waiters: List[Tuple[int, int, str]] = []  # (优先级, 序号, 接口名) 的堆
+        self._seq = itertools.count()
+        self._last_backoff = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def rate(self) -> float:
+        return self._global.rate
+
+    def _bucket(self, endpoint: str) -> Optional[_Bucket]:
+        return self._buckets.get(endpoint)
+
+    def _refill(self, now: float) -> None:
+        self._global.refill(now)
+        for bucket in self._buckets.values():
+            bucket.refill(now)
+
+    def _take(self, endpoint: str) -> None:
+        if self._global.rate > 0:
+            self._global.tokens -= 1
+        bucket = self._bucket(endpoint)
+        if bucket is not None and bucket.rate > 0:
+            bucket.tokens -= 1
+
+    def _endpoint_ready(self, endpoint: str) -> bool:
+        bucket = self._bucket(endpoint)
+        return bucket is None or bucket.ready()
+
+    def try_acquire(self, endpoint: str) -> float:
+        """
+        不排队地尝试获取一个令牌，供协程使用
+        :return: 0 表示已获取；否则为建议等待的秒数
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            ahead = [w for w in self._waiters if w[0] < PRIORITY.get(endpoint, 9) and self._endpoint_ready(w[2])]
+            if not ahead and self._global.ready() and self._endpoint_ready(endpoint):
+                self._take(endpoint)
+                return 0.0
+            bucket = self._bucket(endpoint)
+            return max(0.001, self._global.wait_time(), bucket.wait_time() if bucket else 0.0)
+
+    def acquire(self, endpoint: str, timeout: Optional[float] = None) -> bool:
+        """
+        获取一个令牌，必要时排队等待。优先级更高、且自己的接口还有令牌的请求先获得全局令牌
+        :param endpoint: 接口名
+        :param timeout: 最多等待的秒数，None 表示一直等待
+        :return: True 表示已获取，False 表示超时
+        """
+        if self.max_rate <= 0 and self._bucket(endpoint) is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = (PRIORITY.get(endpoint, 9), next(self._seq), endpoint)
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    ahead = any(w < ticket and self._endpoint_ready(w[2]) for w in self._waiters)
+                    if not ahead and self._global.ready() and self._endpoint_ready(endpoint):
+                        self._take(endpoint)
+                        return True
+                    bucket = self._bucket(endpoint)
+                    wait = max(0.001, self._global.wait_time(), bucket.wait_time() if bucket else 0.0)
+                    if deadline is not None:
+                        if now >= deadline:
+                            return False
+                        wait = min(wait, deadline - now)
+                    self._cond.wait(wait)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def feedback(self, status) -> None:
+        """
+        根据请求结果调整全局速率：429、5xx、超时降低速率，其他正常响应逐渐回升
+        :param status: HTTP 状态码，或 timeout / error / cancelled
+        """
+        if self.max_rate <= 0:
+            return
+        if status == 429 or status == "timeout" or (isinstance(status, int) and status >= 500):
+            self.backoff()
+        elif isinstance(status, int) and status < 400:
+            with self._cond:
+                # 每个正常响应回升上限的 2%
+                self._global.rate = min(self.max_rate, self._global.rate + self.max_rate * 0.02)
+
+    def backoff(self) -> None:
+        """
+        服务器表示请求过多（限流、出错或超时）时降低全局速率
+        """
+        if self.max_rate <= 0:
+            return
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_backoff < BACKOFF_INTERVAL:
+                return
+            self._last_backoff = now
+            self._refill(now)
+            self._global.rate = max(self.max_rate * MIN_RATE_RATIO, self._global.rate * BACKOFF_FACTOR)
+        metrics.inc(GOVERNOR_BACKOFFS)
+        metrics.set(GOVERNOR_RATE, self._global.rate)
+
+
+@contextmanager
+def governed(endpoint: str, **labels) -> Iterator[RequestRecord]:
+    """
+    经过全局限速的接口请求，同时统计耗时和结果（见 Metrics.request）：
+        with governed("info") as record:
+            response = session.post(...)
+            record.status = response.status_code
+    :param endpoint: 接口名
+    :param labels: 统计标签
+    """
+    governor = get_governor()
+    governor.acquire(endpoint)
+    record = None
+    try:
+        with metrics.request(endpoint, **labels) as record:
+            yield record
+    finally:
+        if record is not None:
+            governor.feedback(record.status)
+
+
+_governor: Optional[Governor] = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> Governor:
+    """
+    获取进程内共享的限速器，按 config.GOVERNOR_MAX_RATE、GOVERNOR_BURST、GOVERNOR_BUDGETS 创建
+    """
+    global _governor
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                from config import GOVERNOR_MAX_RATE, GOVERNOR_BURST, GOVERNOR_BUDGETS
+                _governor = Governor(GOVERNOR_MAX_RATE, GOVERNOR_BURST, GOVERNOR_BUDGETS)
+    return _governor
@@ -0,0 +1,115 @@
+"""
+报名请求对冲与自适应超时
+
+记录最近报名请求的耗时分布。一个报名请求超过当前 p90（JOIN_HEDGE_PERCENTILE）仍未返回时，再用连接池中的另一条连接
+发送一个相同的请求（对冲请求），取先返回的结果，个别慢响应不再占住报名线程几秒钟。
+报名请求的超时也按耗时分布计算（p99 的若干倍，限制在上下限之间），样本不足时使用上限。
+"""
+import bisect
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from utils.metrics import nearest_rank
+from config import (JOIN_HEDGE_PERCENTILE, JOIN_TIMEOUT_FACTOR, JOIN_TIMEOUT_MIN, JOIN_TIMEOUT_MAX,
+                    HTTP_POOL_SIZE)
+
+# 至少有多少个样本才开始对冲和调整超时
+MIN_SAMPLES = 20
+# 只按最近多少个样本计算，服务器变慢后能很快反映出来
+WINDOW = 256
+
+
+class LatencyTracker:
+    def __init__(self, hedge_percentile: float, timeout_factor: float, min_timeout: float, max_timeout: float):
+        """
+        :param hedge_percentile: 超过该百分位数的耗时仍未返回时发出对冲请求，小于等于 0 表示不对冲
+        :param timeout_factor: 超时取 p99 的多少倍
+        :param min_timeout: 超时下限（秒）
+        :param max_timeout: 超时上限（秒），样本不足时使用
+        """
+        self.hedge_percentile = hedge_percentile
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._recent: deque = deque(maxlen=WINDOW)
+        self._sorted = []
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        """
+        记录一次报名请求的耗时，超时的请求记为超时时间
+        """
+        with self._lock:
+            if len(self._recent) == self._recent.maxlen:
+                oldest = self._recent[0]
+                del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+            self._recent.append(seconds)
+            bisect.insort(self._sorted, seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        :return: 最近样本的最近秩百分位数（与 utils.metrics 相同），样本不足时为 None
+        """
+        with self._lock:
+            if len(self._sorted) < MIN_SAMPLES:
+                return None
+            return nearest_rank(self._sorted, p)
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        :return: 请求发出多久后仍未返回就发出对冲请求（秒），不对冲时为 None
+        """
+        if self.hedge_percentile <= 0:
+            return None
+        delay = self.percentile(self.hedge_percentile)
+        if delay is None or delay >= self.timeout():
+            return None
+        return delay
+
+    def timeout(self) -> float:
+        """
+        :return: 报名请求的超时（秒）
+        """
+        p99 = self.percentile(99)
+        if p99 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_factor))
+
+
+# 进程内共享的报名耗时分布
+join_latency = LatencyTracker(JOIN_HEDGE_PERCENTILE, JOIN_TIMEOUT_FACTOR, JOIN_TIMEOUT_MIN, JOIN_TIMEOUT_MAX)
+
+# 对冲时主请求和对冲请求都在这个线程池中发送；线程池没有空闲时直接在报名线程中发送，不做对冲，避免请求排队
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HTTP_POOL_SIZE)
+
+
+def executor() -> ThreadPoolExecutor:
+    """
+    :return: 对冲用的线程池，第一次对冲时才创建，只导入模块不会启动线程
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE, thread_name_prefix="join-hedge")
+    return _executor
+
+
+def reserve(count: int) -> int:
+    """
+    预留线程池中的空闲线程
+    :param count: 需要的线程数
+    :return: 实际预留到的线程数，用完后需要调用 release
+    """
+    reserved = 0
+    while reserved < count and _slots.acquire(blocking=False):
+        reserved += 1
+    return reserved
+
+
+def release() -> None:
+    _slots.release()
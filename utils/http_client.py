@@ -0,0 +1,113 @@
+"""
+进程级共享的 HTTP 会话与连接池
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from loguru import logger
+
+from config import HTTP_POOL_SIZE, API_BASE_URL as _CONFIG_API_BASE_URL
+
+# PU 接口地址，可用环境变量 PU_API_BASE_URL 覆盖（例如指向本地模拟服务器）
+API_BASE_URL = os.getenv("PU_API_BASE_URL") or _CONFIG_API_BASE_URL
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+# 已经（或正在）预热过的报名时刻 -> 预热完成事件
+_warmed: Dict[Hashable, threading.Event] = {}
+_warmed_lock = threading.Lock()
+
+
+def api_url(path: str) -> str:
+    """
+    拼接 PU 接口地址
+    :param path: 接口路径，如 /apis/activity/info
+    :return: 完整地址
+    """
+    return API_BASE_URL.rstrip("/") + path
+
+
+def get_session() -> requests.Session:
+    """
+    获取进程内共享的 Session，所有请求复用同一个连接池，避免每次请求都重新握手
+    :return: requests.Session
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, pool_block=False)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _open_connection(session: requests.Session, url: str, timeout: float) -> Optional[float]:
+    """
+    发送一次轻量请求以建立（或复用）一条连接
+    :return: 耗时（秒），失败返回 None
+    """
+    start = time.perf_counter()
+    try:
+        session.head(url, timeout=timeout)
+    except requests.RequestException as e:
+        logger.debug(f"连接预热失败: {e}")
+        return None
+    return time.perf_counter() - start
+
+
+def warm_up(count: int, url: Optional[str] = None, timeout: float = 3) -> int:
+    """
+    并发打开 count 条连接放入连接池，使报名请求发出时无需再做 TCP+TLS 握手
+    :param count: 需要预热的连接数，超过连接池大小时取连接池大小
+    :param url: 预热地址，默认为 PU 接口根地址
+    :param timeout: 单次请求超时
+    :return: 成功预热的连接数
+    """
+    url = url or api_url("/")
+    count = max(1, min(count, HTTP_POOL_SIZE))
+    session = get_session()
+    # 必须并发请求，串行请求只会反复复用同一条连接
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        results = list(executor.map(lambda _: _open_connection(session, url, timeout), range(count)))
+
+    ok = [r for r in results if r is not None]
+    if ok:
+        logger.info(f"连接预热完成: {len(ok)}/{count} 条, 最慢 {max(ok) * 1000:.1f}ms")
+    else:
+        logger.warning("连接预热失败，报名请求将使用新连接")
+    return len(ok)
+
+
+def warm_up_once(key: Hashable, count: int, timeout: float = 3,
+                 warm: Callable[..., int] = warm_up) -> None:
+    """
+    同一个报名时刻在进程内只预热一次连接池：第一个调用方预热，同时报名的其他任务等它完成后直接使用这些连接，
+    避免每个任务都向同一台服务器并发发送预热请求
+    :param key: 报名时刻，如报名开始时间
+    :param count: 需要预热的连接数
+    :param timeout: 单次请求超时
+    :param warm: 预热函数，默认预热共享的 requests 连接池，协程引擎传入 async_engine.warm_up
+    """
+    with _warmed_lock:
+        done = _warmed.get(key)
+        leader = done is None
+        if leader:
+            done = _warmed[key] = threading.Event()
+            # 只保留最近的报名时刻
+            while len(_warmed) > 64:
+                _warmed.pop(next(iter(_warmed)))
+    if not leader:
+        done.wait(timeout)
+        return
+    try:
+        warm(count, timeout=timeout)
+    finally:
+        done.set()
@@ -0,0 +1,342 @@
+"""
+请求耗时与结果统计
+
+记录登录、活动信息、活动列表、报名等接口的耗时直方图，HTTP 状态码与返回 code 的计数，报名重试次数和所在的报名轮次，
+以及时间同步的结果。统计可以导出为 Prometheus 文本格式（可由 node_exporter 的 textfile collector 采集）
+和单次运行的 JSON 汇总，用来查看高负载下时间都花在了哪里。
+"""
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 每个直方图保留最近多少个样本用于计算百分位数
+RECENT_SAMPLES = 2048
+
+# 指标名称
+REQUEST_DURATION = "pu_request_duration_seconds"
+REQUESTS_TOTAL = "pu_requests_total"
+JOIN_RETRIES_TOTAL = "pu_join_retries_total"
+JOIN_HEDGES_TOTAL = "pu_join_hedges_total"
+FIRE_DELAY = "pu_fire_delay_seconds"
+CLOCK_SYNC_DURATION = "pu_clock_sync_duration_seconds"
+CLOCK_OFFSET = "pu_clock_offset_seconds"
+CLOCK_ERROR = "pu_clock_error_seconds"
+CLOCK_MIN_RTT = "pu_clock_min_rtt_seconds"
+GOVERNOR_BACKOFFS = "pu_governor_backoffs_total"
+GOVERNOR_RATE = "pu_governor_rate"
+
+_HELP = {
+    REQUEST_DURATION: "接口请求耗时",
+    REQUESTS_TOTAL: "接口请求数，按 HTTP 状态码和返回 code 区分",
+    JOIN_RETRIES_TOTAL: "报名线程的重试次数",
+    JOIN_HEDGES_TOTAL: "发出对冲请求的报名请求数，按先返回的是主请求还是对冲请求区分",
+    FIRE_DELAY: "从预定发出时刻到第一个报名请求实际发出的延迟",
+    CLOCK_SYNC_DURATION: "时间同步耗时",
+    CLOCK_OFFSET: "服务器时间 - 本地时间",
+    CLOCK_ERROR: "时间偏差估计的误差上界",
+    CLOCK_MIN_RTT: "时间同步测得的最小往返时间",
+    GOVERNOR_BACKOFFS: "全局限速因服务器限流、出错或超时而降低速率的次数",
+    GOVERNOR_RATE: "全局限速当前允许的每秒请求数",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def response_code(text: str) -> str:
+    """
+    取出 PU 接口返回的 code 字段
+    :param text: 响应文本
+    :return: code，无法解析时为空字符串
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return ""
+    return str(data.get("code", "")) if isinstance(data, dict) else ""
+
+
+def nearest_rank(values: Sequence[float], p: float) -> Optional[float]:
+    """
+    最近秩百分位数：不小于 p% 样本的最小样本值
+    :param values: 按从小到大排好序的样本
+    :param p: 百分位（0-100）
+    :return: 百分位数，没有样本时为 None
+    """
+    if not values:
+        return None
+    return values[max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))]
+
+
+class Histogram:
+    """
+    固定分桶的直方图，另外保留最近 RECENT_SAMPLES 个样本用于计算百分位数
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        :param p: 百分位（0-100）
+        :return: 最近样本的最近秩百分位数，没有样本时为 None
+        """
+        return nearest_rank(sorted(self.recent), p)
+
+    def merge(self, other: "Histogram") -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        self.recent.extend(other.recent)
+
+    def summary(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class RequestRecord:
+    """
+    一次请求的结果，由调用方在 Metrics.request 块中填写
+    """
+
+    def __init__(self):
+        self.status: Optional[str] = None  # HTTP 状态码，或 timeout / cancelled / error
+        self.code: str = ""  # 接口返回的 code
+
+
+def _error_status(error: BaseException) -> str:
+    # requests 的 Timeout 不是 TimeoutError 的子类；协程引擎在报名成功后会取消进行中的请求
+    if isinstance(error, TimeoutError) or "Timeout" in type(error).__name__:
+        return "timeout"
+    if type(error).__name__ == "CancelledError":
+        return "cancelled"
+    return "error"
+
+
+class Metrics:
+    """
+    进程内的指标注册表，多线程共享
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        计数器加 value
+        """
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """
+        设置仪表盘的当前值
+        """
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """
+        向直方图加入一个样本
+        """
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def percentile(self, name: str, p: float, **labels) -> Optional[float]:
+        """
+        :return: 某个直方图最近样本的百分位数，没有样本时为 None
+        """
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(_labels(labels))
+            return histogram.percentile(p) if histogram else None
+
+    @contextmanager
+    def request(self, endpoint: str, **labels) -> Iterator[RequestRecord]:
+        """
+        统计一次接口请求的耗时和结果：
+            with metrics.request("join", phase=1) as record:
+                response = session.post(...)
+                record.status = response.status_code
+        块内抛出异常时状态记为 timeout、cancelled 或 error，异常照常向外抛出
+        :param endpoint: 接口名，如 login、info、list、join
+        :param labels: 其他标签，值为 None 的标签会被忽略
+        """
+        record = RequestRecord()
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.status = _error_status(e)
+            raise
+        finally:
+            self.observe(REQUEST_DURATION, time.perf_counter() - start, endpoint=endpoint, **labels)
+            self.inc(REQUESTS_TOTAL, endpoint=endpoint, status=record.status or "error", code=record.code,
+                     **labels)
+
+    def snapshot(self) -> Dict:
+        """
+        :return: 全部原始数据的副本，可以 pickle 后传给其他进程
+        """
+        with self._lock:
+            histograms = {}
+            for name, series in self._histograms.items():
+                histograms[name] = {}
+                for key, h in series.items():
+                    copy = histograms[name][key] = Histogram(h.buckets)
+                    copy.merge(h)
+            return {"counters": {name: dict(series) for name, series in self._counters.items()},
+                    "gauges": {name: dict(series) for name, series in self._gauges.items()},
+                    "histograms": histograms}
+
+    def merge(self, snapshot: Dict) -> None:
+        """
+        合并其他进程的 snapshot：计数器与直方图累加，仪表盘取后合并的值
+        :param snapshot: Metrics.snapshot() 的返回值
+        """
+        with self._lock:
+            for name, series in snapshot["counters"].items():
+                target = self._counters.setdefault(name, {})
+                for key, value in series.items():
+                    target[key] = target.get(key, 0) + value
+            for name, series in snapshot["gauges"].items():
+                self._gauges.setdefault(name, {}).update(series)
+            for name, series in snapshot["histograms"].items():
+                target = self._histograms.setdefault(name, {})
+                for key, h in series.items():
+                    if key not in target:
+                        target[key] = Histogram(h.buckets)
+                    target[key].merge(h)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+    def to_prometheus(self) -> str:
+        """
+        :return: Prometheus 文本格式的全部指标
+        """
+        lines: List[str] = []
+
+        def fmt(labels: Labels, extra: Labels = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        def header(name: str, kind: str) -> None:
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                header(name, "counter")
+                lines.extend(f"{name}{fmt(k)} {v}" for k, v in sorted(series.items()))
+            for name, series in sorted(self._gauges.items()):
+                header(name, "gauge")
+                lines.extend(f"{name}{fmt(k)} {v}" for k, v in sorted(series.items()))
+            for name, series in sorted(self._histograms.items()):
+                header(name, "histogram")
+                for k, h in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(h.buckets + (math.inf,), h.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else repr(bound)
+                        lines.append(f"{name}_bucket{fmt(k, (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{fmt(k)} {h.sum}")
+                    lines.append(f"{name}_count{fmt(k)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict:
+        """
+        :return: 单次运行的汇总，耗时单位为秒
+        """
+        with self._lock:
+            return {
+                "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                "duration": time.time() - self.started,
+                "counters": {name: [{"labels": dict(k), "value": v} for k, v in sorted(series.items())]
+                             for name, series in sorted(self._counters.items())},
+                "gauges": {name: [{"labels": dict(k), "value": v} for k, v in sorted(series.items())]
+                           for name, series in sorted(self._gauges.items())},
+                "histograms": {name: [{"labels": dict(k), **h.summary()} for k, h in sorted(series.items())]
+                               for name, series in sorted(self._histograms.items())},
+            }
+
+    def export(self, directory: Optional[str] = None) -> List[str]:
+        """
+        导出 Prometheus 文本文件（每次覆盖）和本次运行的 JSON 汇总
+        :param directory: 导出目录，默认取 config.METRICS_DIR，为空则不导出
+        :return: 写入的文件路径
+        """
+        from config import METRICS_DIR
+        directory = METRICS_DIR if directory is None else directory
+        if not directory:
+            return []
+        os.makedirs(directory, exist_ok=True)
+
+        prom_path = os.path.join(directory, "pu_signup.prom")
+        # 先写临时文件再替换，避免采集方读到写了一半的文件
+        tmp_path = prom_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, prom_path)
+
+        json_path = os.path.join(directory, f"run-{datetime.fromtimestamp(self.started):%Y%m%d-%H%M%S}.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        return [prom_path, json_path]
+
+
+# 进程内共享的指标
+metrics = Metrics()
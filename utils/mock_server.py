@@ -0,0 +1,302 @@
+"""
+本地 PU 接口模拟服务器，用于离线测试和基准测试
+
+实现了 /uc/user/login、/apis/activity/list、/apis/activity/info、/apis/activity/join 和 /apis/mapping/data，
+支持设定报名开放时间、名额、网络延迟与抖动、随机错误、服务器时钟偏差，以及让已发放的 token 失效。
+
+用法（在项目根目录下）：
+    python -m utils.mock_server --port 8000 --activities 3 --open-in 60 --seats 5 --latency 20 --jitter 10
+然后设置环境变量 PU_API_BASE_URL=http://127.0.0.1:8000 再运行 main.py。
+"""
+import argparse
+import email.utils
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set
+
+from utils.timing import PU_TIMEZONE
+
+# 报名接口的返回码
+CODE_OK = 0
+CODE_NOT_OPEN = 6001
+CODE_FULL = 6002
+CODE_ALREADY_JOINED = 9405
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认的监听队列只有 5，大量并发连接（如同时登录上百个用户）会被重置
+    request_queue_size = 256
+
+
+@dataclass
+class MockActivity:
+    id: int
+    join_start: float  # 报名开放时刻（服务器时间，Unix 秒，应为整秒）
+    seats: int = 10
+    name: str = ""
+    category: int = 1
+    oid: int = 1
+    allow_years: List[int] = field(default_factory=list)
+    allow_college: List[str] = field(default_factory=list)
+    joined: Set[str] = field(default_factory=set)
+
+    def base_info(self) -> Dict:
+        fmt = lambda ts: datetime.fromtimestamp(ts, PU_TIMEZONE).strftime(TIME_FORMAT)
+        return {
+            "id": self.id,
+            "name": self.name or f"模拟活动{self.id}",
+            "credit": 1,
+            "category": self.category,
+            "categoryName": "模拟分类",
+            "oid": self.oid,
+            "creatorName": "模拟组织",
+            "address": "模拟地址",
+            "joinStartTime": fmt(self.join_start),
+            "startTime": fmt(self.join_start + 86400),
+            "endTime": fmt(self.join_start + 90000),
+            "allowUserCount": self.seats,
+            "joinUserCount": len(self.joined),
+            "statusName": "未开始",
+            "allowTribe": [],
+            "allowYear": [{"id": y} for y in self.allow_years],
+            "allowCollege": [{"name": c} for c in self.allow_college],
+        }
+
+
+@dataclass
+class JoinRecord:
+    activity_id: int
+    user: str
+    arrival: float  # 到达时刻（服务器时间，Unix 秒）
+    code: int
+    status: int = 200
+
+
+class MockPUServer:
+    def __init__(self,
+                 activities: List[MockActivity],
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 latency_ms: float = 0,
+                 jitter_ms: float = 0,
+                 error_rate: float = 0,
+                 error_status: int = 500,
+                 clock_offset: float = 0,
+                 slow_rate: float = 0,
+                 slow_ms: float = 0):
+        """
+        :param activities: 模拟的活动
+        :param port: 端口，0 表示自动分配
+        :param latency_ms: 每个请求的固定处理延迟（毫秒）
+        :param jitter_ms: 延迟的随机抖动（毫秒）
+        :param error_rate: 报名请求随机返回错误状态码的概率
+        :param error_status: 随机错误返回的 HTTP 状态码，如 500、429
+        :param clock_offset: 服务器时钟比本机快多少秒
+        :param slow_rate: 请求随机变慢的概率，用来模拟长尾延迟
+        :param slow_ms: 变慢的请求额外的延迟（毫秒）
+        """
+        self.activities = {a.id: a for a in activities}
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.clock_offset = clock_offset
+        self.slow_rate = slow_rate
+        self.slow = slow_ms / 1000.0
+        self.joins: List[JoinRecord] = []
+        self.request_counts: Dict[str, int] = {}
+        self.token_generation = 0  # 早于该代的 token 返回 401
+        self._lock = threading.Lock()
+        self._httpd = _HTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def now(self) -> float:
+        return time.time() + self.clock_offset
+
+    def start(self) -> "MockPUServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-pu-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def expire_tokens(self) -> None:
+        """
+        让已发放的所有 token 失效，之后的请求返回 401，重新登录得到新的 token
+        """
+        with self._lock:
+            self.token_generation += 1
+
+    def _issue_token(self, user: str) -> str:
+        # 第一代 token 为 mock-用户名，之后的为 mock-用户名#代数
+        with self._lock:
+            generation = self.token_generation
+        return f"mock-{user}" + (f"#{generation}" if generation else "")
+
+    def _delay(self) -> None:
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if self.slow_rate and random.random() < self.slow_rate:
+            delay += self.slow
+        if delay > 0:
+            time.sleep(delay)
+
+    def _join(self, activity_id: int, user: str) -> Dict:
+        arrival = self.now()
+        activity = self.activities.get(activity_id)
+        with self._lock:
+            if activity is None:
+                code, message = 404, "活动不存在"
+            elif arrival < activity.join_start:
+                code, message = CODE_NOT_OPEN, "活动报名未开始"
+            elif user in activity.joined:
+                code, message = CODE_ALREADY_JOINED, "您已报名该活动"
+            elif len(activity.joined) >= activity.seats:
+                code, message = CODE_FULL, "报名人数已满"
+            else:
+                activity.joined.add(user)
+                code, message = CODE_OK, "报名成功"
+            self.joins.append(JoinRecord(activity_id, user, arrival, code))
+        return {"code": code, "message": message, "data": {}}
+
+    def _list(self, payload: Dict) -> Dict:
+        page = int(payload.get("page", 1))
+        limit = int(payload.get("limit", 20))
+        items = sorted(self.activities.values(), key=lambda a: a.id)
+        if payload.get("categorys"):
+            items = [a for a in items if a.category in payload["categorys"]]
+        if payload.get("oids"):
+            items = [a for a in items if a.oid in payload["oids"]]
+        chunk = items[(page - 1) * limit: page * limit]
+        return {"code": 0, "data": {"pageInfo": {"total": len(items)},
+                                    "list": [{"id": a.id, "name": a.base_info()["name"]} for a in chunk]}}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def date_time_string(self, timestamp=None):
+                return email.utils.formatdate(server.now() if timestamp is None else timestamp, usegmt=True)
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: Optional[Dict] = None) -> None:
+                data = json.dumps(body or {}, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(data)
+
+            def _user(self) -> Optional[str]:
+                """
+                :return: 请求的 token 去掉代数后的部分，未登录或 token 已失效时为 None
+                """
+                auth = self.headers.get("Authorization", "")
+                if not auth.startswith("Bearer "):
+                    return None
+                user, _, generation = auth[len("Bearer "):].split(":")[0].partition("#")
+                return user if int(generation or 0) >= server.token_generation else None
+
+            def do_HEAD(self):
+                self._send(200)
+
+            def do_GET(self):
+                if self.path == "/__stats":
+                    with server._lock:
+                        self._send(200, {"requests": server.request_counts,
+                                         "joins": [r.__dict__ for r in server.joins]})
+                else:
+                    self._send(404, {"code": 404, "message": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    payload = {}
+                with server._lock:
+                    server.request_counts[self.path] = server.request_counts.get(self.path, 0) + 1
+                server._delay()
+
+                if self.path == "/uc/user/login":
+                    self._send(200, {"code": 0, "data": {"token": server._issue_token(payload.get('userName'))}})
+                    return
+                user = self._user()
+                if user is None:
+                    self._send(401, {"code": 401, "message": "未登录"})
+                elif self.path == "/apis/activity/join":
+                    if server.error_rate and random.random() < server.error_rate:
+                        with server._lock:
+                            server.joins.append(JoinRecord(int(payload.get("activityId", 0)), user, server.now(),
+                                                           -1, server.error_status))
+                        self._send(server.error_status, {"code": server.error_status, "message": "服务器繁忙"})
+                    else:
+                        self._send(200, server._join(int(payload.get("activityId", 0)), user))
+                elif self.path == "/apis/activity/info":
+                    activity = server.activities.get(int(payload.get("id", 0)))
+                    if activity is None:
+                        self._send(200, {"code": 404, "message": "活动不存在", "data": {}})
+                    else:
+                        self._send(200, {"code": 0, "data": {"baseInfo": activity.base_info()}})
+                elif self.path == "/apis/activity/list":
+                    self._send(200, server._list(payload))
+                elif self.path == "/apis/mapping/data":
+                    self._send(200, {"code": 0, "data": {"list": []}})
+                else:
+                    self._send(404, {"code": 404, "message": "not found"})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 PU 接口模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--activities", type=int, default=1, help="活动数量，id 从 1 开始")
+    parser.add_argument("--open-in", type=float, default=60, help="多少秒后开放报名")
+    parser.add_argument("--seats", type=int, default=10, help="每个活动的名额")
+    parser.add_argument("--latency", type=float, default=0, help="处理延迟（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0, help="延迟抖动（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0, help="报名请求随机出错的概率")
+    parser.add_argument("--error-status", type=int, default=500, help="随机出错时的 HTTP 状态码")
+    parser.add_argument("--clock-offset", type=float, default=0, help="服务器时钟比本机快多少秒")
+    parser.add_argument("--slow-rate", type=float, default=0, help="请求随机变慢的概率")
+    parser.add_argument("--slow", type=float, default=0, help="变慢的请求额外的延迟（毫秒）")
+    args = parser.parse_args()
+
+    # joinStartTime 只精确到秒，开放时刻取整秒
+    open_at = math.ceil(time.time() + args.clock_offset + args.open_in)
+    server = MockPUServer([MockActivity(id=i, join_start=open_at, seats=args.seats)
+                           for i in range(1, args.activities + 1)],
+                          host=args.host, port=args.port, latency_ms=args.latency, jitter_ms=args.jitter,
+                          error_rate=args.error_rate, error_status=args.error_status,
+                          clock_offset=args.clock_offset, slow_rate=args.slow_rate, slow_ms=args.slow)
+    print(f"模拟服务器已启动: {server.base_url}，报名将在 {args.open_in:.0f} 秒后开放")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+后台邮件通知
+
+报名线程只把报名结果放入队列，由后台线程查询活动信息、生成邮件并发送，
+同一批积压的邮件复用一个SMTP连接。
+"""
+import atexit
+import queue
+import threading
+import time
+from typing import Dict
+
+from loguru import logger
+
+SUCCESS = "success"
+FAIL = "fail"
+
+
+class EmailNotifier:
+    def __init__(self):
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="email-notifier", daemon=True)
+                self._thread.start()
+
+    def notify(self, kind: str, activity_id: str, user: Dict) -> None:
+        """
+        提交一条报名结果通知，立即返回
+        :param kind: SUCCESS 或 FAIL
+        :param activity_id: 活动 ID
+        :param user: 用户信息，需要包含 userName、email、token、sid
+        """
+        self._ensure_started()
+        self._queue.put((kind, activity_id, dict(user)))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        等待队列中的通知全部发送完毕。不会创建新线程，可以在解释器退出时（atexit）调用：
+        后台线程还在运行时在当前线程中等待它发完，后台线程已经结束时直接在当前线程中发送
+        :param timeout: 最长等待秒数，None 表示一直等待
+        :return: 是否全部发送完毕
+        """
+        if self._thread is None:
+            return True
+        if not self._thread.is_alive():
+            while self._drain(block=False):
+                pass
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            self._drain(block=True)
+
+    def _drain(self, block: bool) -> bool:
+        """
+        取出当前积压的所有通知，一起发送
+        :param block: 队列为空时是否等待
+        :return: 是否发送了通知
+        """
+        try:
+            batch = [self._queue.get(block=block)]
+        except queue.Empty:
+            return False
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            self._send_batch(batch)
+        except Exception as e:
+            logger.error(f"邮件通知发送异常: {str(e)}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+        return True
+
+    @staticmethod
+    def _send_batch(batch) -> None:
+        from utils.tools import (make_success_email, make_fail_email, send_emails,
+                                 SUCCESS_EMAIL_SUBJECT, FAIL_EMAIL_SUBJECT)
+
+        emails = []
+        users = []
+        for kind, activity_id, user in batch:
+            try:
+                if kind == SUCCESS:
+                    emails.append((make_success_email(activity_id, user), user.get("email"), SUCCESS_EMAIL_SUBJECT))
+                else:
+                    emails.append((make_fail_email(activity_id, user), user.get("email"), FAIL_EMAIL_SUBJECT))
+                users.append(user)
+            except Exception as e:
+                logger.error(f"用户 {user.get('userName')} 邮件制作异常: {str(e)}")
+
+        if not emails:
+            return
+        for user, ok in zip(users, send_emails(emails)):
+            if ok:
+                logger.success(f"用户 {user.get('userName')} 邮件发送成功！")
+            else:
+                logger.error(f"用户 {user.get('userName')} 邮件发送失败")
+
+
+# 进程内共享的邮件通知器
+notifier = EmailNotifier()
+# 退出前尽量把积压的通知发出去
+atexit.register(notifier.flush, 60)
@@ -1,22 +1,27 @@
 import base64
 import json
+import random
+import threading
 import time
-import secrets
 import string
-from typing import Dict, Any
+from collections import deque
+from typing import Callable, Dict, Any, Deque, List
 
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 from Crypto.Random import get_random_bytes
+from loguru import logger
 
 # 固定 16 字节密钥
 PSK = bytes([121, 121, 0, 19, 5, 49, 2, 43, 13, 17, 11, 9, 4, 29, 60, 11])
 
+_ALPHABET = string.ascii_letters + string.digits
+_sysrand = random.SystemRandom()
+
 
 def generate_random_echo(length: int = 16) -> str:
     """生成与 pu.js generateRandomString 等价的 62 字符随机串。"""
-    alphabet = string.ascii_letters + string.digits
-    return ''.join(secrets.choice(alphabet) for _ in range(length))
+    return ''.join(_sysrand.choices(_ALPHABET, k=length))
 
 
 def current_timestamp_str() -> str:
@@ -67,3 +72,107 @@ def generate_x_sign(echo: str | None = None, timestamp: str | None = None, clien
         timestamp = current_timestamp_str()
     payload = {"echo": echo, "timestamp": timestamp, "client": client}
     return encrypt_payload_to_n(payload, iv=iv)
+
+
+class XSignPool:
+    """
+    X-Sign 预计算池。
+    X-Sign 只与秒级时间戳有关，因此可以在等待阶段提前为报名开始前后的每一秒生成一批签名，
+    报名时直接取用，签名计算不再出现在报名请求的关键路径上。
+    - 每一秒的签名放在独立的 deque 中，popleft 是原子操作，取用时无需加锁
+    - 后台线程在准备窗口内持续补充即将到来的几秒的签名，没有窗口时等待下一次 prepare
+    """
+
+    def __init__(self, batch_size: int = 32, lookahead: int = 3, clock: Callable[[], float] = time.time):
+        """
+        :param batch_size: 每一秒预先生成的签名数量
+        :param lookahead: 后台补充时提前准备的秒数
+        :param clock: 取当前时间（Unix 秒）的函数，基准测试可以传入固定的时间
+        """
+        self.batch_size = batch_size
+        self.lookahead = lookahead
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._buckets: Dict[int, Deque[str]] = {}
+        self._windows: List[tuple] = []  # 需要预计算的时间窗口 (开始秒, 结束秒)
+        self._lock = threading.Lock()  # 仅保护窗口列表与线程启动
+        self._wake = threading.Event()  # 有新的窗口
+        self._thread = None
+
+    def _fill(self, ts: int) -> None:
+        bucket = self._buckets.get(ts)
+        if bucket is None:
+            bucket = self._buckets.setdefault(ts, deque())
+        timestamp = str(ts)
+        while len(bucket) < self.batch_size:
+            bucket.append(generate_x_sign(timestamp=timestamp))
+
+    def prepare(self, start_ts: int, before: int = 2, after: int = 60) -> None:
+        """
+        为 [start_ts - before, start_ts + after] 秒预计算签名，并启动后台补充线程
+        :param start_ts: 报名开始时刻（本地 Unix 秒）
+        :param before: 开始前提前准备的秒数
+        :param after: 开始后持续补充的秒数
+        """
+        with self._lock:
+            self._windows.append((start_ts - before, start_ts + after))
+            self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refill_loop, name="x-sign-pool", daemon=True)
+                self._thread.start()
+        for ts in range(start_ts - before, start_ts + min(after, self.lookahead) + 1):
+            self._fill(ts)
+
+    def _refill_loop(self) -> None:
+        while True:
+            try:
+                idle = self._refill()
+            except Exception as e:
+                # 出错也不能让线程退出，否则之后每次报名都要现场签名
+                logger.error(f"X-Sign 预计算异常: {str(e)}")
+                idle = False
+            if idle:
+                self._wake.wait()
+            else:
+                time.sleep(0.2)
+
+    def _refill(self) -> bool:
+        """
+        补充即将到来的几秒的签名，清理已经过去的签名
+        :return: True 表示已经没有需要准备的窗口
+        """
+        now = int(self.clock())
+        with self._lock:
+            self._windows = [w for w in self._windows if w[1] >= now]
+            windows = list(self._windows)
+            if not windows:
+                self._wake.clear()
+        for ts in range(now, now + self.lookahead + 1):
+            if any(begin <= ts <= end for begin, end in windows):
+                self._fill(ts)
+        # prepare 可能同时在其他线程中添加新的秒，遍历副本
+        for ts in [ts for ts in list(self._buckets) if ts < now - 1]:
+            self._buckets.pop(ts, None)
+        return not windows
+
+    def get(self) -> str:
+        """
+        取出当前秒的签名，池中没有时现场生成
+        :return: X-Sign
+        """
+        ts = int(self.clock())
+        bucket = self._buckets.get(ts)
+        if bucket:
+            try:
+                sign = bucket.popleft()
+                self.hits += 1
+                return sign
+            except IndexError:
+                pass
+        self.misses += 1
+        return generate_x_sign(timestamp=str(ts))
+
+
+# 进程内共享的签名池
+x_sign_pool = XSignPool()
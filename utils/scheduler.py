@@ -0,0 +1,274 @@
+"""
+报名任务调度器
+
+所有用户的所有活动都作为轻量的任务记录放在同一个按时间排序的堆中，由一个调度线程统一管理。
+调度线程只在某个任务需要确认开始时间、刷新 token 或开始报名时醒来，并把具体工作交给线程池执行，
+不再为每个用户、每个活动保留一个长时间睡眠的线程。
+报名（FIRE）从开始前几秒一直占用线程到报名结束，不放进线程池，而是每个任务各用一个线程：
+同一时刻开始的任务再多，也不会因为线程池被占满而晚于开始时间才开始报名。
+开始时间的确认按活动去重：无论有多少用户报名同一个活动，每个活动每次只查询一次，结果推送给所有订阅的任务。
+"""
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from loguru import logger
+
+from utils.activity_bot import ActivityBot
+from utils.clock_sync import server_clock
+from utils.timing import to_epoch
+
+# 任务动作
+INIT = "init"  # 首次获取开始时间
+WATCH = "watch"  # 定时确认某个活动的开始时间（所有订阅该活动的任务共享）
+REFRESH = "refresh"  # 报名前检查 token（快过期时提前登录）和时间同步结果（太久没同步时重新同步）
+FIRE = "fire"  # 报名
+
+# 报名开始前多少秒把报名交给线程池（线程池中再精确等待）
+FIRE_DISPATCH_LEAD_SECONDS = 5
+# 报名开始前多少秒检查 token（须小于 MONITOR_BUFFER_SECONDS）
+TOKEN_REFRESH_LEAD_SECONDS = 300
+# token 至少要在报名开始后仍有效多少秒（覆盖整个报名过程）
+TOKEN_VALID_AFTER_START_SECONDS = 60
+# 报名开始前最后多少秒内不再登录
+TOKEN_LAST_LOGIN_SECONDS = 60
+# 距离开始小于该秒数后不再定时确认开始时间
+MONITOR_BUFFER_SECONDS = 600
+
+
+@dataclass
+class SignupJob:
+    """
+    一个用户报名一个活动的任务
+    """
+    bot: ActivityBot
+    activity_id: str
+    start_time: Optional[datetime] = None  # 报名开始时间（服务器时间）
+    token_refreshed: bool = False
+    finished: bool = False
+    success: bool = False
+    cancelled: bool = False  # 被 remove_job 移除
+
+    @property
+    def user_name(self) -> str:
+        return self.bot.user_data['userName']
+
+
+@dataclass(order=True)
+class _Entry:
+    due: float  # 服务器时间（Unix 秒）
+    seq: int
+    job: Optional[SignupJob] = field(compare=False)
+    action: str = field(compare=False)
+    activity_id: Optional[str] = field(default=None, compare=False)
+
+
+class SignupScheduler:
+    def __init__(self, max_workers: Optional[int] = None, keep_alive: bool = False):
+        """
+        :param max_workers: 执行任务的线程数，默认取 config.SCHEDULER_MAX_WORKERS
+        :param keep_alive: 为 True 时所有任务结束后 run 也不返回，继续等待新任务，直到调用 stop
+        """
+        from config import SCHEDULER_MAX_WORKERS
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or SCHEDULER_MAX_WORKERS,
+                                            thread_name_prefix="signup")
+        self._heap: List[_Entry] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._unfinished = 0
+        self._keep_alive = keep_alive
+        self._stopped = False
+        self._watched: Dict[str, List[SignupJob]] = {}  # 活动id -> 等待下一次确认开始时间的任务
+        self._fire_threads: Set[threading.Thread] = set()  # 正在报名的线程
+        self.jobs: List[SignupJob] = []
+
+    def add_job(self, bot: ActivityBot, activity_id: str) -> SignupJob:
+        """
+        添加报名任务，立即开始获取活动开始时间
+        :param bot: 用户的报名机器人
+        :param activity_id: 活动id
+        :return: 任务
+        """
+        job = SignupJob(bot=bot, activity_id=activity_id)
+        with self._cond:
+            self.jobs.append(job)
+            self._unfinished += 1
+        self._schedule(job, INIT, server_clock.now())
+        return job
+
+    def remove_job(self, job: SignupJob) -> None:
+        """
+        移除任务：尚未开始报名的任务不再执行，正在报名的任务立即停止
+        :param job: add_job 返回的任务
+        """
+        with self._cond:
+            if job.finished:
+                return
+            job.cancelled = True
+        self._finish(job, False)
+        job.bot.cancel_signup(job.activity_id)
+        logger.info(f"用户 {job.user_name} 活动 {job.activity_id} 的报名任务已移除")
+
+    def stop(self) -> None:
+        """
+        让 run 尽快返回，未执行的任务不再执行
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _schedule(self, job: Optional[SignupJob], action: str, due: float, activity_id: Optional[str] = None) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, _Entry(due, next(self._seq), job, action, activity_id))
+            self._cond.notify()
+
+    def _watch(self, job: SignupJob, delay: float) -> None:
+        """
+        订阅活动开始时间的确认，同一活动只安排一次查询
+        :param job: 任务
+        :param delay: 首个订阅者希望的下一次确认前的等待秒数
+        """
+        with self._cond:
+            subscribers = self._watched.get(job.activity_id)
+            if subscribers is None:
+                subscribers = self._watched[job.activity_id] = []
+                self._schedule(None, WATCH, server_clock.now() + delay, job.activity_id)
+            subscribers.append(job)
+
+    def _finish(self, job: SignupJob, success: bool) -> None:
+        with self._cond:
+            if job.finished:
+                return
+            job.finished = True
+            job.success = success
+            self._unfinished -= 1
+            self._cond.notify()
+
+    def run(self) -> List[SignupJob]:
+        """
+        运行调度循环，直到所有任务结束
+        :return: 所有任务
+        """
+        try:
+            while True:
+                with self._cond:
+                    entry = None
+                    while entry is None:
+                        if self._stopped or (self._unfinished == 0 and not self._keep_alive):
+                            return self.jobs
+                        if not self._heap:
+                            self._cond.wait()
+                            continue
+                        delay = self._heap[0].due - server_clock.now()
+                        if delay > 0:
+                            self._cond.wait(min(delay, 60))
+                            continue
+                        entry = heapq.heappop(self._heap)
+                if entry.action == WATCH:
+                    self._executor.submit(self._poll_activity, entry.activity_id)
+                elif entry.action == FIRE:
+                    self._start_fire(entry.job)
+                else:
+                    self._executor.submit(self._execute, entry.job, entry.action)
+        finally:
+            self._executor.shutdown(wait=True)
+            with self._cond:
+                fire_threads = list(self._fire_threads)
+            for thread in fire_threads:
+                thread.join()
+
+    def _start_fire(self, job: SignupJob) -> None:
+        """
+        为报名任务单独启动一个线程，从精确等待一直运行到报名结束
+        """
+        def fire() -> None:
+            try:
+                self._execute(job, FIRE)
+            finally:
+                with self._cond:
+                    self._fire_threads.discard(threading.current_thread())
+
+        thread = threading.Thread(target=fire, name=f"fire-{job.user_name}-{job.activity_id}", daemon=True)
+        with self._cond:
+            self._fire_threads.add(thread)
+        thread.start()
+
+    def _execute(self, job: SignupJob, action: str) -> None:
+        if job.finished:
+            return
+        try:
+            if action == INIT:
+                if not job.bot.ensure_token():
+                    logger.error(f"用户 {job.user_name} 无法获取有效 Token，报名中止")
+                    self._finish(job, False)
+                    return
+                job.start_time = job.bot.get_join_start_time(job.activity_id)
+                if not job.start_time:
+                    logger.error(f"用户 {job.user_name} 无法获取活动 {job.activity_id} 开始时间")
+                    self._finish(job, False)
+                    return
+            elif action == REFRESH:
+                logger.info(f"用户 {job.user_name} 检查 Token 准备报名")
+                local_start = to_epoch(job.start_time) - server_clock.offset
+                job.bot.ensure_token(local_start + TOKEN_VALID_AFTER_START_SECONDS)
+                server_clock.resync_if_stale()
+                job.token_refreshed = True
+            elif action == FIRE:
+                job.bot.fire(job.activity_id, job.start_time)
+                self._finish(job, bool(job.bot.signup_flags.get(job.activity_id)))
+                return
+            self._plan(job)
+        except Exception as e:
+            logger.error(f"用户 {job.user_name} 活动 {job.activity_id} 任务 {action} 异常: {str(e)}")
+            self._finish(job, False)
+
+    def _poll_activity(self, activity_id: str) -> None:
+        """
+        确认一次活动开始时间，并把结果推送给所有订阅该活动的任务
+        :param activity_id: 活动id
+        """
+        with self._cond:
+            subscribers = [job for job in self._watched.pop(activity_id, []) if not job.finished]
+        if not subscribers:
+            return
+
+        try:
+            new_start = subscribers[0].bot.get_join_start_time(activity_id)
+        except Exception as e:
+            logger.error(f"活动 {activity_id} 确认开始时间异常: {str(e)}")
+            new_start = None
+        logger.info(f"活动 {activity_id} 开始时间确认完成，共 {len(subscribers)} 个任务订阅")
+
+        for job in subscribers:
+            if job.finished:  # 查询期间被移除
+                continue
+            if new_start and new_start != job.start_time:
+                logger.warning(
+                    f"用户 {job.user_name} 活动 {job.activity_id} 开始时间变更: {job.start_time} -> {new_start}")
+                job.start_time = new_start
+            try:
+                self._plan(job)
+            except Exception as e:
+                logger.error(f"用户 {job.user_name} 活动 {job.activity_id} 安排任务异常: {str(e)}")
+                self._finish(job, False)
+
+    def _plan(self, job: SignupJob) -> None:
+        """
+        根据距离开始的时间安排任务的下一步
+        """
+        start = to_epoch(job.start_time)
+        now = server_clock.now()
+        sleep_minutes = job.bot._next_monitor_minutes(job.activity_id, job.start_time,
+                                                      buffer_seconds=MONITOR_BUFFER_SECONDS)
+        if sleep_minutes is not None:
+            self._watch(job, sleep_minutes * 60)
+        elif not job.token_refreshed and start - now > TOKEN_LAST_LOGIN_SECONDS:
+            self._schedule(job, REFRESH, max(now, start - TOKEN_REFRESH_LEAD_SECONDS))
+        else:
+            from config import PREWARM_LEAD_SECONDS
+            lead = max(FIRE_DISPATCH_LEAD_SECONDS, PREWARM_LEAD_SECONDS + 2)
+            self._schedule(job, FIRE, start - lead)
@@ -0,0 +1,143 @@
+"""
+多进程报名
+
+用户很多时，所有账号的签名、JSON 解析和日志都在同一个进程里争抢同一个 GIL，热门活动开放的那一刻尤其明显。
+这里把用户分成若干份，每份交给一个子进程，子进程各自拥有连接池和调度器，互不干扰；
+父进程只负责同步一次服务器时间、分发用户、收集各子进程的报名结果和请求统计。
+"""
+import multiprocessing
+import os
+import queue
+from typing import Dict, List
+
+from loguru import logger
+
+
+def shard_users(users: List[Dict], shards: int) -> List[List[Dict]]:
+    """
+    按活动数把用户尽量均匀地分成 shards 份，活动多的用户优先分配
+    :param users: 用户列表
+    :param shards: 份数
+    :return: 每份的用户列表，不含空的份
+    """
+    buckets: List[List[Dict]] = [[] for _ in range(max(1, shards))]
+    loads = [0] * len(buckets)
+    for user in sorted(users, key=lambda u: len(u.get("activity_ids") or []), reverse=True):
+        i = loads.index(min(loads))
+        buckets[i].append(user)
+        loads[i] += max(1, len(user.get("activity_ids") or []))
+    return [b for b in buckets if b]
+
+
+def _pin_cpu(index: int) -> None:
+    """
+    把当前进程绑定到一个 CPU 核心上
+    :param index: 子进程序号
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("当前系统不支持设置 CPU 亲和性，已忽略")
+        return
+    cpus = sorted(os.sched_getaffinity(0))
+    cpu = cpus[index % len(cpus)]
+    os.sched_setaffinity(0, {cpu})
+    logger.info(f"报名子进程 {index} 绑定到 CPU {cpu}")
+
+
+def _run_shard(index: int, users: List[Dict], settings: Dict, results: multiprocessing.Queue) -> None:
+    """
+    子进程入口：用自己的调度器报名分到的用户，结束后把结果和请求统计放入 results
+    :param index: 子进程序号
+    :param users: 分到的用户
+    :param settings: 父进程的配置、接口地址和时间同步结果
+    :param results: 结果队列
+    """
+    import config
+    for key, value in settings["config"].items():
+        setattr(config, key, value)
+    import utils.http_client as http_client
+    http_client.API_BASE_URL = settings["api_base_url"]
+    if settings["clock"] is not None:
+        from utils.clock_sync import server_clock
+        server_clock.restore(*settings["clock"])
+    if settings["cpu_affinity"]:
+        _pin_cpu(index)
+
+    from utils.metrics import metrics
+    from utils.scheduler import SignupScheduler
+    from utils.single import single_account
+
+    logger.info(f"报名子进程 {index} 启动，负责 {len(users)} 个用户")
+    jobs = []
+    try:
+        scheduler = SignupScheduler()
+        for user in users:
+            single_account(user, scheduler)
+        jobs = scheduler.run()
+    finally:
+        results.put({
+            "shard": index,
+            "jobs": [{"userName": job.user_name, "activity_id": job.activity_id, "success": job.success}
+                     for job in jobs],
+            "metrics": metrics.snapshot(),
+        })
+
+
+def run_sharded(users: List[Dict], processes: int, cpu_affinity: bool = False) -> List[Dict]:
+    """
+    把用户分到多个子进程中报名，阻塞直到所有子进程结束
+    :param users: 用户列表
+    :param processes: 子进程数
+    :param cpu_affinity: 是否把每个子进程绑定到不同的 CPU 核心
+    :return: 所有任务的结果，每项包含 userName、activity_id、success
+    """
+    import config
+    import utils.http_client as http_client
+    from utils.clock_sync import server_clock
+    from utils.metrics import metrics
+
+    # 父进程同步一次服务器时间，子进程直接使用，不必各自采样
+    server_clock.ensure_synced()
+    settings = {
+        "config": {k: getattr(config, k) for k in dir(config) if k.isupper()},
+        "api_base_url": http_client.API_BASE_URL,
+        "clock": (server_clock.offset, server_clock.error, server_clock.min_rtt) if server_clock.synced else None,
+        "cpu_affinity": cpu_affinity,
+    }
+
+    shards = shard_users(users, processes)
+    logger.info(f"启动 {len(shards)} 个报名子进程，每个进程的用户数: {[len(s) for s in shards]}")
+    # spawn 在各平台行为一致，子进程不会继承父进程的线程和连接
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [context.Process(target=_run_shard, args=(i, shard, settings, results), name=f"signup-shard-{i}")
+               for i, shard in enumerate(shards)]
+    for worker in workers:
+        worker.start()
+
+    jobs: List[Dict] = []
+    received = set()
+    # 先取结果再 join，避免子进程因队列未被读取而无法退出
+    while len(received) < len(workers):
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            if all(not w.is_alive() for w in workers):
+                # 没有结果的子进程已经异常退出
+                try:
+                    result = results.get(timeout=1)
+                except queue.Empty:
+                    break
+            else:
+                continue
+        received.add(result["shard"])
+        jobs.extend(result["jobs"])
+        metrics.merge(result["metrics"])
+
+    for i, worker in enumerate(workers):
+        worker.join()
+        if i not in received:
+            logger.error(f"报名子进程 {i} 异常退出（退出码 {worker.exitcode}），其用户的报名结果未知")
+
+    succeeded = sum(1 for job in jobs if job["success"])
+    logger.info(f"所有报名子进程结束，共 {len(jobs)} 个任务，成功 {succeeded} 个")
+    return jobs
@@ -1,12 +1,19 @@
 """
 对单独账号的查询活动并抢活动
 """
-import threading
+from typing import Optional
+
 from utils.activity_bot import ActivityBot
 from utils.PUExceptions import ActivityIDsEmptyError
+from utils.scheduler import SignupScheduler
 from loguru import logger
 
-def single_account(user_data:dict):
+def single_account(user_data:dict, scheduler: Optional[SignupScheduler] = None):
+    """
+    为单个账号的所有活动创建报名任务
+    :param user_data: 用户数据
+    :param scheduler: 共享的调度器；为 None 时单独创建一个并等待所有任务完成
+    """
     logger.info(f"开始处理用户 {user_data['userName']} 的报名请求")
     bot = ActivityBot(user_data)
     try:
@@ -14,21 +21,21 @@ def single_account(user_data:dict):
         if not activity_ids:
             raise ActivityIDsEmptyError(user_data['userName'])
         logger.info(f"用户 {user_data['userName']} 需要报名的活动ID: {activity_ids}")
-        bot.sync_server_time(activity_ids[0])# 同步服务器时间
-        threads = []
+        bot.sync_server_time()  # 同步服务器时间（进程内只同步一次）
+
+        own_scheduler = scheduler is None
+        if own_scheduler:
+            scheduler = SignupScheduler()
         for activity_id in activity_ids:
-            logger.info(f"用户 {user_data['userName']} 创建活动 {activity_id} 的报名线程")
-            thread = threading.Thread(target=bot.signup, args=(activity_id,))
-            threads.append(thread)
-            thread.start()
+            logger.info(f"用户 {user_data['userName']} 创建活动 {activity_id} 的报名任务")
+            scheduler.add_job(bot, activity_id)
 
-        logger.info(f"用户 {user_data['userName']} 等待所有活动报名线程完成")
-        for thread in threads:
-            thread.join()
-        logger.info(f"用户 {user_data['userName']} 所有活动报名线程已完成")
+        if own_scheduler:
+            logger.info(f"用户 {user_data['userName']} 等待所有活动报名任务完成")
+            scheduler.run()
+            logger.info(f"用户 {user_data['userName']} 所有活动报名任务已完成")
     except ActivityIDsEmptyError as e:
         logger.warning(f"用户 {user_data['userName']} 获取到的活动id为空，可能是因为没有可报名的活动，或者程序出现错误")
         logger.info(f"用户数据: {user_data}")
         return
 
-    
\ No newline at end of file
@@ -0,0 +1,397 @@
+"""
+基于 SQLite 的状态存储
+
+用户、报名订阅（用户要报名的活动）、活动信息、token 和每次报名的结果都保存在同一个 SQLite 数据库中。
+每次写入只改动有变化的行，并在一个事务中完成，写到一半程序退出也不会损坏已有数据；
+启动时直接查询数据库，不必解析整个 JSON 文件。
+第一次使用（或 user_data.json 被手动修改）时会自动从 user_data.json 导入。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from loguru import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_name TEXT PRIMARY KEY,
+    data TEXT NOT NULL,          -- 除 activity_ids、token 之外的用户信息（JSON）
+    position INTEGER NOT NULL,   -- 用户顺序
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user_name TEXT NOT NULL,
+    activity_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    added_at REAL NOT NULL,
+    PRIMARY KEY (user_name, activity_id)
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    user_name TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    sid TEXT,
+    obtained_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS activity_info (
+    activity_id TEXT PRIMARY KEY,
+    info TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_name TEXT NOT NULL,
+    activity_id TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    outcome TEXT,                -- 报名结束的原因（utils.burst 中的结果分类）
+    requests INTEGER,            -- 发送的报名请求数
+    duration REAL,               -- 报名持续的秒数
+    started_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attempts_user_activity ON attempts (user_name, activity_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 单独存放的用户字段
+_SEPARATE_FIELDS = ("activity_ids", "token")
+# 不知道获取时间的 token（如从 user_data.json 导入的）记录的获取时间
+UNKNOWN_OBTAINED_AT = 0.0
+
+
+def _activity_key(activity_id) -> str:
+    return str(activity_id)
+
+
+def _activity_value(key: str):
+    # 与 user_data.json 中的写法保持一致，数字 id 还原为 int
+    return int(key) if key.isdigit() else key
+
+
+class StateStore:
+    """
+    SQLite 状态存储，多线程共享同一个连接，写入串行执行
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: 数据库文件路径，":memory:" 表示只保存在内存中
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock:
+            # WAL 模式下读写互不阻塞，写入中途断电也只会丢失未提交的事务
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # 用户与订阅
+
+    def load_users(self) -> List[Dict]:
+        """
+        :return: 与 user_data.json 格式相同的用户列表，包含 activity_ids 和最近一次的 token
+        """
+        with self._lock:
+            users = [json.loads(row["data"]) for row in
+                     self._conn.execute("SELECT data FROM users ORDER BY position")]
+            subscriptions: Dict[str, List] = {}
+            for row in self._conn.execute("SELECT user_name, activity_id FROM subscriptions ORDER BY position"):
+                subscriptions.setdefault(row["user_name"], []).append(_activity_value(row["activity_id"]))
+            tokens = {row["user_name"]: row["token"] for row in
+                      self._conn.execute("SELECT user_name, token FROM tokens")}
+        for user in users:
+            user["activity_ids"] = subscriptions.get(user["userName"], [])
+            if user["userName"] in tokens:
+                user["token"] = tokens[user["userName"]]
+        return users
+
+    def save_users(self, users: List[Dict], prune: bool = True) -> None:
+        """
+        保存用户列表，只写入有变化的行
+        :param users: 与 user_data.json 格式相同的用户列表
+        :param prune: 是否删除列表中没有的用户及其订阅
+        """
+        with self._transaction() as conn:
+            self._save_users(conn, users, prune)
+
+    def _save_users(self, conn: sqlite3.Connection, users: List[Dict], prune: bool,
+                    imported: Optional[Dict[str, List[str]]] = None) -> None:
+        """
+        :param imported: 合并导入时，上次导入（或写回）文件时每个用户的活动，用来只应用文件中的修改
+        """
+        now = time.time()
+        existing = {row["user_name"]: (row["data"], row["position"]) for row in
+                    conn.execute("SELECT user_name, data, position FROM users")}
+        names = set()
+        for position, user in enumerate(users):
+            name = user["userName"]
+            names.add(name)
+            data = json.dumps({k: v for k, v in user.items() if k not in _SEPARATE_FIELDS},
+                              ensure_ascii=False, sort_keys=True)
+            if not prune:
+                # 合并导入时保留数据库中其他用户的顺序，新用户排在最后
+                position = existing[name][1] if name in existing else len(existing) + position
+            if existing.get(name) != (data, position):
+                conn.execute("INSERT INTO users (user_name, data, position, updated_at) VALUES (?, ?, ?, ?) "
+                             "ON CONFLICT (user_name) DO UPDATE SET data = excluded.data, "
+                             "position = excluded.position, updated_at = excluded.updated_at",
+                             (name, data, position, now))
+            wanted = [_activity_key(a) for a in user.get("activity_ids") or []]
+            if not prune:
+                wanted = self._merge_subscriptions(conn, name, wanted, (imported or {}).get(name))
+            self._save_subscriptions(conn, name, wanted, now)
+            # 合并导入时文件中的 token 可能比数据库中的旧，只导入新用户的。
+            # 用户列表中的 token 不知道获取时间，记为 0，使用前会先重新登录，不会把旧 token 当作刚获取的
+            if user.get("token") and (prune or name not in existing):
+                self._save_token(conn, name, user["token"], user.get("sid"), UNKNOWN_OBTAINED_AT)
+
+        for name in (set(existing) - names if prune else ()):
+            self._delete_user(conn, name)
+
+    @staticmethod
+    def _delete_user(conn: sqlite3.Connection, name: str) -> None:
+        conn.execute("DELETE FROM users WHERE user_name = ?", (name,))
+        conn.execute("DELETE FROM subscriptions WHERE user_name = ?", (name,))
+        conn.execute("DELETE FROM tokens WHERE user_name = ?", (name,))
+
+    @staticmethod
+    def _merge_subscriptions(conn: sqlite3.Connection, user_name: str, wanted: List[str],
+                             base: Optional[List[str]]) -> List[str]:
+        """
+        合并导入文件中的活动：只应用文件相对上次导入的修改（新增、删除），
+        数据库中在此之后的修改（如自动发现加入的活动）保留
+        :param wanted: 文件中的活动
+        :param base: 上次导入或写回文件时的活动，None 表示不知道，此时只新增不删除
+        :return: 合并后的活动
+        """
+        current = [row["activity_id"] for row in
+                   conn.execute("SELECT activity_id FROM subscriptions WHERE user_name = ? ORDER BY position",
+                                (user_name,))]
+        base = set(current) & set(wanted) if base is None else set(base)
+        removed = base - set(wanted)
+        merged = [a for a in current if a not in removed]
+        merged += [a for a in wanted if a not in base and a not in merged]
+        return merged
+
+    @staticmethod
+    def _save_subscriptions(conn: sqlite3.Connection, user_name: str, activity_ids: List, now: float) -> None:
+        wanted = list(dict.fromkeys(_activity_key(a) for a in activity_ids))
+        existing = {row["activity_id"]: row["position"] for row in
+                    conn.execute("SELECT activity_id, position FROM subscriptions WHERE user_name = ?", (user_name,))}
+        for position, activity_id in enumerate(wanted):
+            if activity_id not in existing:
+                conn.execute("INSERT INTO subscriptions (user_name, activity_id, position, added_at) "
+                             "VALUES (?, ?, ?, ?)", (user_name, activity_id, position, now))
+            elif existing[activity_id] != position:
+                conn.execute("UPDATE subscriptions SET position = ? WHERE user_name = ? AND activity_id = ?",
+                             (position, user_name, activity_id))
+        for activity_id in set(existing) - set(wanted):
+            conn.execute("DELETE FROM subscriptions WHERE user_name = ? AND activity_id = ?",
+                         (user_name, activity_id))
+
+    def add_subscription(self, user_name: str, activity_id) -> None:
+        """
+        为用户追加一个要报名的活动
+        """
+        with self._transaction() as conn:
+            position = conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM subscriptions WHERE user_name = ?",
+                                    (user_name,)).fetchone()[0]
+            conn.execute("INSERT OR IGNORE INTO subscriptions (user_name, activity_id, position, added_at) "
+                         "VALUES (?, ?, ?, ?)", (user_name, _activity_key(activity_id), position, time.time()))
+
+    def remove_subscription(self, user_name: str, activity_id) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM subscriptions WHERE user_name = ? AND activity_id = ?",
+                         (user_name, _activity_key(activity_id)))
+
+    # token
+
+    @staticmethod
+    def _save_token(conn: sqlite3.Connection, user_name: str, token: str, sid, now: float) -> None:
+        conn.execute("INSERT INTO tokens (user_name, token, sid, obtained_at) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT (user_name) DO UPDATE SET token = excluded.token, sid = excluded.sid, "
+                     "obtained_at = excluded.obtained_at "
+                     "WHERE tokens.token != excluded.token OR tokens.obtained_at < excluded.obtained_at",
+                     (user_name, token, None if sid is None else str(sid), now))
+
+    def save_token(self, user_name: str, token: str, sid=None) -> None:
+        """
+        保存新获取的 token
+        """
+        with self._transaction() as conn:
+            self._save_token(conn, user_name, token, sid, time.time())
+
+    def get_token(self, user_name: str) -> Optional[Dict]:
+        """
+        :return: {"token", "sid", "obtained_at"}，没有保存过时为 None；不知道获取时间的 token，obtained_at 为 UNKNOWN_OBTAINED_AT
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT token, sid, obtained_at FROM tokens WHERE user_name = ?",
+                                     (user_name,)).fetchone()
+        return dict(row) if row else None
+
+    # 活动信息
+
+    def save_activity_info(self, activity_id, info: Dict) -> None:
+        with self._transaction() as conn:
+            conn.execute("INSERT INTO activity_info (activity_id, info, updated_at) VALUES (?, ?, ?) "
+                         "ON CONFLICT (activity_id) DO UPDATE SET info = excluded.info, "
+                         "updated_at = excluded.updated_at",
+                         (_activity_key(activity_id), json.dumps(info, ensure_ascii=False), time.time()))
+
+    def get_activity_info(self, activity_id) -> Optional[Dict]:
+        """
+        :return: {"info", "updated_at"}，没有保存过时为 None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT info, updated_at FROM activity_info WHERE activity_id = ?",
+                                     (_activity_key(activity_id),)).fetchone()
+        return {"info": json.loads(row["info"]), "updated_at": row["updated_at"]} if row else None
+
+    # 报名结果
+
+    def record_attempt(self,
+                       user_name: str,
+                       activity_id,
+                       success: bool,
+                       outcome: Optional[str] = None,
+                       requests: Optional[int] = None,
+                       duration: Optional[float] = None,
+                       started_at: Optional[float] = None) -> None:
+        """
+        记录一次报名（一轮报名请求）的结果
+        :param outcome: 报名结束的原因
+        :param requests: 发送的报名请求数
+        :param duration: 报名持续的秒数
+        :param started_at: 报名开始的时刻（Unix 秒）
+        """
+        with self._transaction() as conn:
+            conn.execute("INSERT INTO attempts (user_name, activity_id, success, outcome, requests, duration, "
+                         "started_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (user_name, _activity_key(activity_id), int(success), outcome, requests, duration,
+                          time.time() if started_at is None else started_at))
+
+    def attempts(self, user_name: Optional[str] = None) -> List[Dict]:
+        """
+        :return: 报名记录，按时间先后排列
+        """
+        with self._lock:
+            if user_name is None:
+                rows = self._conn.execute("SELECT * FROM attempts ORDER BY id").fetchall()
+            else:
+                rows = self._conn.execute("SELECT * FROM attempts WHERE user_name = ? ORDER BY id",
+                                          (user_name,)).fetchall()
+        return [dict(row) for row in rows]
+
+    # 其他状态
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # JSON 导入
+
+    @staticmethod
+    def _set_json_meta(conn: sqlite3.Connection, mtime: float, users: List[Dict]) -> None:
+        # 记录文件的修改时间、其中的用户和每个用户的活动，作为下次合并导入的基准
+        subscriptions = {user["userName"]: [_activity_key(a) for a in user.get("activity_ids") or []]
+                         for user in users}
+        for key, value in (("json_mtime", str(mtime)),
+                           ("json_users", json.dumps(list(subscriptions), ensure_ascii=False)),
+                           ("json_subscriptions", json.dumps(subscriptions, ensure_ascii=False))):
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def mark_json_synced(self, json_path: str, users: List[Dict]) -> None:
+        """
+        记录 user_data.json 刚由数据库中的用户写回，下次 import_json 不会把写回的内容当作文件的修改再导入
+        :param json_path: 用户数据文件
+        :param users: 写入文件的用户列表
+        """
+        try:
+            mtime = os.stat(json_path).st_mtime
+        except OSError:
+            return
+        with self._transaction() as conn:
+            self._set_json_meta(conn, mtime, users)
+
+    def import_json(self, json_path: str, force: bool = False) -> bool:
+        """
+        从 user_data.json 导入用户，文件自上次导入（或写回）后没有修改时跳过。
+        导入是合并：文件中的用户覆盖数据库中的同名用户，活动只应用文件相对上次导入的新增和删除；
+        上次从文件导入、这次文件中已删除的用户也从数据库删除；不是从文件导入的用户（如程序中新增的用户）保留
+        :param json_path: 用户数据文件
+        :param force: 忽略修改时间，总是导入
+        :return: 是否导入
+        """
+        try:
+            mtime = os.stat(json_path).st_mtime
+        except OSError:
+            return False
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'json_mtime'").fetchone()
+        if not force and row is not None and float(row["value"]) >= mtime:
+            return False
+
+        try:
+            with open(json_path, "r", encoding="utf-8") as file:
+                users = json.load(file) or []
+        except (OSError, ValueError) as e:
+            logger.error(f"从 {json_path} 导入用户数据失败: {str(e)}")
+            return False
+        names = [user["userName"] for user in users]
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'json_subscriptions'").fetchone()
+            self._save_users(conn, users, prune=False, imported=json.loads(row["value"]) if row else None)
+            row = conn.execute("SELECT value FROM meta WHERE key = 'json_users'").fetchone()
+            for name in set(json.loads(row["value"]) if row else []) - set(names):
+                self._delete_user(conn, name)
+            self._set_json_meta(conn, mtime, users)
+        logger.info(f"已从 {json_path} 导入 {len(users)} 个用户到 {self.path}")
+        return True
+
+
+_store: Optional[StateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_state_store() -> Optional[StateStore]:
+    """
+    获取进程内共享的状态存储
+    :return: StateStore，config.STATE_DB_FILE 为空时返回 None
+    """
+    global _store
+    from config import STATE_DB_FILE
+    if not STATE_DB_FILE:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = StateStore(STATE_DB_FILE)
+    return _store
@@ -0,0 +1,68 @@
+"""
+报名时刻的精确等待
+
+所有时间都换算成服务器时间（Unix 秒），由 server_clock 基于单调时钟推算，不受本地系统时间跳变影响。
+等待采用“先睡眠、后自旋”：离目标较远时睡眠，最后 SPIN_SECONDS 内忙等，避免 sleep 的调度抖动。
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+from utils.clock_sync import server_clock
+
+# PU 服务器返回的时间均为北京时间
+PU_TIMEZONE = timezone(timedelta(hours=8))
+
+# 最后多少秒改为忙等
+SPIN_SECONDS = 0.02
+
+# 未测得网络延迟时使用的默认提前量
+DEFAULT_ADVANCE_SECONDS = 0.03
+
+
+def to_epoch(dt: datetime) -> float:
+    """
+    把 PU 返回的时间（不带时区时视为北京时间）转换为 Unix 秒
+    :param dt: 时间
+    :return: Unix 秒
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=PU_TIMEZONE)
+    return dt.timestamp()
+
+
+def server_now() -> datetime:
+    """
+    :return: 当前服务器时间（北京时间，不带时区，可与 PU 返回的时间直接比较）
+    """
+    return datetime.fromtimestamp(server_clock.now(), PU_TIMEZONE).replace(tzinfo=None)
+
+
+def fire_advance() -> float:
+    """
+    计算请求的提前发出量：请求从发出到到达服务器大约需要单程延迟（最小 RTT 的一半）
+    :return: 提前量（秒）
+    """
+    from config import FIRE_EXTRA_ADVANCE_MS
+    if server_clock.min_rtt is None:
+        advance = DEFAULT_ADVANCE_SECONDS
+    else:
+        advance = server_clock.min_rtt / 2
+    return advance + FIRE_EXTRA_ADVANCE_MS / 1000.0
+
+
+def wait_until(target: float) -> float:
+    """
+    精确等待到服务器时间 target
+    :param target: 目标服务器时间（Unix 秒）
+    :return: 实际唤醒时刻与目标的误差（秒，正数表示晚于目标）
+    """
+    target_ns = int(target * 1e9)
+    spin_ns = int(SPIN_SECONDS * 1e9)
+    while True:
+        remaining = target_ns - server_clock.now_ns()
+        if remaining <= 0:
+            break
+        if remaining > spin_ns:
+            # 单次最多睡 60 秒，避免长时间睡眠期间时钟同步结果更新后无法及时响应
+            time.sleep(min(remaining - spin_ns, 60_000_000_000) / 1e9)
+    return (server_clock.now_ns() - target_ns) / 1e9
@@ -0,0 +1,241 @@
+"""
+token 管理
+
+按用户名缓存 token 及其获取时间，并记录观察到的 token 有效期（token 第一次返回 401 时距获取时已过去的时间）。
+只有获取时间确定的 token 才计入观察，连续几个不同的 token 都提前失效才缩短有效期，缩短后的有效期过一段时间恢复默认值。
+token 和有效期保存在状态数据库中，下次启动时仍在有效期内的 token 直接复用，不必重新登录。
+同一用户同时只会有一个登录请求在途：多个线程同时发现 token 失效时，只有一个线程登录，其他线程等待并使用它的结果。
+调度器在报名开始前几分钟检查 token，快过期才在后台提前登录，报名前最后一分钟内不会再发生登录。
+"""
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from config import TOKEN_DEFAULT_LIFETIME_HOURS, TOKEN_REFRESH_MARGIN_SECONDS
+
+# 观察到的有效期不低于该秒数（且不低于提前刷新时间的 3 倍），避免异常的 401 让 token 每次使用前都要重新登录
+MIN_LIFETIME = 1800
+# 至少有几个不同的 token 提前失效才缩短有效期，取其中存活最久的一个
+LIFETIME_OBSERVATIONS = 3
+# 缩短后的有效期保持多少秒，之后恢复默认值重新观察
+LIFETIME_TTL = 24 * 3600
+
+
+@dataclass
+class _Token:
+    token: str
+    obtained_at: float  # 获取时间（Unix 秒）
+    known: bool = True  # 获取时间是否准确，来自 user_data.json 的 token 不知道获取时间
+
+
+class _InFlight:
+    """
+    正在进行中的一次登录，其他等待同一用户的调用方共享它的结果
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.token: Optional[str] = None
+
+
+class TokenManager:
+    def __init__(self,
+                 lifetime: float = TOKEN_DEFAULT_LIFETIME_HOURS * 3600,
+                 margin: float = TOKEN_REFRESH_MARGIN_SECONDS):
+        """
+        :param lifetime: 默认的 token 有效期（秒），观察到 401 后会按实际情况缩短
+        :param margin: 距离过期不足多少秒的 token 视为需要刷新
+        """
+        self.default_lifetime = lifetime
+        self.lifetime = lifetime
+        self.margin = margin
+        self.min_lifetime = max(MIN_LIFETIME, margin * 3)
+        self.logins = 0
+        self._observed: deque = deque(maxlen=LIFETIME_OBSERVATIONS)  # 最近提前失效的 (token, 存活秒数)
+        self._learned_at: Optional[float] = None  # 缩短有效期的时间
+        self._tokens: Dict[str, _Token] = {}
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self) -> None:
+        # 第一次使用时读取数据库中观察到的有效期；缩短后超过 LIFETIME_TTL 的有效期恢复默认值
+        if not self._loaded:
+            self._loaded = True
+            from utils.state_store import get_state_store
+            store = get_state_store()
+            saved = store.get_meta("token_lifetime") if store is not None else None
+            try:
+                saved = json.loads(saved) if saved else None
+                lifetime, learned_at = float(saved["lifetime"]), float(saved["learned_at"])
+            except (ValueError, TypeError, KeyError):
+                # 旧版本只保存了有效期，不知道是什么时候观察到的，不再使用
+                lifetime = learned_at = None
+            if lifetime is not None and lifetime < self.lifetime:
+                self.lifetime = max(self.min_lifetime, lifetime)
+                self._learned_at = learned_at
+        if self._learned_at is not None and time.time() - self._learned_at > LIFETIME_TTL:
+            self.lifetime = self.default_lifetime
+            self._learned_at = None
+
+    def _entry(self, user_name: str) -> Optional[_Token]:
+        entry = self._tokens.get(user_name)
+        if entry is None:
+            from utils.state_store import UNKNOWN_OBTAINED_AT, get_state_store
+            store = get_state_store()
+            saved = store.get_token(user_name) if store is not None else None
+            if saved:
+                # 从 user_data.json 导入的 token 不知道获取时间，获取时间记为 0，第一次使用前会重新登录
+                entry = self._tokens[user_name] = _Token(saved["token"], saved["obtained_at"],
+                                                         known=saved["obtained_at"] > UNKNOWN_OBTAINED_AT)
+        return entry
+
+    def expires_at(self, user_name: str) -> Optional[float]:
+        """
+        :return: 当前 token 预计的过期时间（Unix 秒），没有 token 时为 None
+        """
+        with self._lock:
+            self._load()
+            entry = self._entry(user_name)
+            return entry.obtained_at + self.lifetime if entry else None
+
+    def get(self, user_data: Dict, valid_until: Optional[float] = None) -> Optional[str]:
+        """
+        获取有效的 token：已有的 token 到 valid_until 时仍然有效就直接返回，否则登录
+        :param user_data: 用户信息，需要包含 userName、password、sid，可以包含上次保存的 token
+        :param valid_until: token 至少要有效到的时刻（Unix 秒），默认为现在
+        :return: token，登录失败返回 None
+        """
+        name = user_data["userName"]
+        with self._lock:
+            self._load()
+            entry = self._entry(name)
+            if entry is None and user_data.get("token"):
+                # 来自 user_data.json 的 token 不知道获取时间，和导入数据库的 token 一样获取时间记为 0，使用前重新登录
+                from utils.state_store import UNKNOWN_OBTAINED_AT
+                entry = self._tokens[name] = _Token(user_data["token"], UNKNOWN_OBTAINED_AT, known=False)
+            until = time.time() if valid_until is None else valid_until
+            if entry and entry.obtained_at + self.lifetime - self.margin > until:
+                return entry.token
+            stale = entry.token if entry else None
+        return self.refresh(user_data, stale)
+
+    def refresh(self, user_data: Dict, stale_token: Optional[str] = None) -> Optional[str]:
+        """
+        重新登录。如果当前 token 已经不是 stale_token（其他线程刚刷新过），直接返回当前 token
+        :param user_data: 用户信息
+        :param stale_token: 调用方认为已失效的 token
+        :return: token，登录失败返回 None
+        """
+        name = user_data["userName"]
+        with self._lock:
+            self._load()
+            entry = self._entry(name)
+            if entry and stale_token is not None and entry.token != stale_token:
+                return entry.token
+            call = self._in_flight.get(name)
+            leader = call is None
+            if leader:
+                call = self._in_flight[name] = _InFlight()
+
+        if not leader:
+            call.event.wait()
+            return call.token
+
+        try:
+            from utils.tools import get_token
+            call.token = get_token(user_data)
+            if call.token:
+                now = time.time()
+                with self._lock:
+                    self.logins += 1
+                    self._tokens[name] = _Token(call.token, now)
+                from utils.state_store import get_state_store
+                store = get_state_store()
+                if store is not None:
+                    store.save_token(name, call.token, user_data.get("sid"))
+            return call.token
+        finally:
+            with self._lock:
+                self._in_flight.pop(name, None)
+            call.event.set()
+
+    def login_all(self, users: List[Dict], max_workers: Optional[int] = None) -> Dict[str, Optional[str]]:
+        """
+        并发为所有用户获取有效的 token（仍在有效期内的直接复用），结束后汇总输出登录失败的用户
+        :param users: 用户列表
+        :param max_workers: 同时进行的登录数，默认取 config.STARTUP_LOGIN_WORKERS
+        :return: 用户名 -> token，登录失败为 None
+        """
+        from config import STARTUP_LOGIN_WORKERS
+        if not users:
+            return {}
+        workers = min(max_workers or STARTUP_LOGIN_WORKERS, len(users))
+        logins = self.logins
+        started = time.perf_counter()
+
+        def login(user: Dict) -> Optional[str]:
+            # 网络抖动导致的失败重试一次
+            for attempt in range(2):
+                try:
+                    token = self.get(user)
+                    if token:
+                        return token
+                except Exception as e:
+                    logger.error(f"用户 {user.get('userName')} 登录异常: {str(e)}")
+                if attempt == 0:
+                    time.sleep(1)
+            return None
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="login") as executor:
+            tokens = dict(zip((user["userName"] for user in users), executor.map(login, users)))
+
+        failed = [name for name, token in tokens.items() if not token]
+        logged_in = self.logins - logins
+        logger.info(f"{len(users)} 个用户登录完成，耗时 {time.perf_counter() - started:.2f} 秒：新登录 {logged_in} 个，"
+                    f"复用已有 Token {len(users) - len(failed) - logged_in} 个，失败 {len(failed)} 个")
+        if failed:
+            logger.error(f"以下用户登录失败，请检查用户名密码和网络环境: {', '.join(failed)}")
+        return tokens
+
+    def expired(self, user_name: str, token: str) -> None:
+        """
+        记录 token 收到了 401。获取时间确定的 token 提前失效时记下它实际存活的时间，
+        最近 LIFETIME_OBSERVATIONS 个不同的 token 都提前失效后，按其中存活最久的一个缩短有效期
+        :param user_name: 用户名
+        :param token: 收到 401 的 token
+        """
+        with self._lock:
+            self._load()
+            entry = self._entry(user_name)
+            if entry is None or entry.token != token or not entry.known:
+                return
+            now = time.time()
+            age = now - entry.obtained_at
+            if age >= self.lifetime or any(t == token for t, _ in self._observed):
+                return
+            self._observed.append((token, age))
+            if len(self._observed) < LIFETIME_OBSERVATIONS:
+                return
+            lifetime = max(self.min_lifetime, max(a for _, a in self._observed))
+            self._observed.clear()
+            if lifetime >= self.lifetime:
+                return
+            self.lifetime = lifetime
+            self._learned_at = now
+        logger.warning(f"最近 {LIFETIME_OBSERVATIONS} 个 Token 都在获取后 {lifetime / 60:.0f} 分钟内失效，"
+                       f"之后按该有效期提前刷新 Token")
+        from utils.state_store import get_state_store
+        store = get_state_store()
+        if store is not None:
+            store.set_meta("token_lifetime", json.dumps({"lifetime": lifetime, "learned_at": now}))
+
+
+# 进程内共享的 token 管理器
+token_manager = TokenManager()
@@ -1,10 +1,15 @@
-import random
+import threading
 import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from loguru import logger
-from typing import Dict, List
+from typing import Dict, Iterator, List, Tuple
 
 from utils.headers import HEADERS_GET_SCHOOL, HEADERS_ACTIVITY
+from utils.http_client import api_url, get_session
+from utils.activity_cache import activity_info_cache
+from utils.metrics import response_code
+from utils.governor import governed
 
 
 def get_token(userData: Dict) -> str | None:
@@ -17,14 +22,17 @@ def get_token(userData: Dict) -> str | None:
         logger.info(f"用户 {userData['userName']} 开始登录")
         from utils.headers import HEADERS_LOGIN
 
-        login_url = "https://apis.pocketuni.net/uc/user/login"
+        login_url = api_url("/uc/user/login")
         payload = {
             "userName": userData['userName'],
             "password": userData['password'],
             'sid': int(userData.get("sid")),
             "device": "pc",
         }
-        response = requests.post(login_url, headers=HEADERS_LOGIN, json=payload)
+        with governed("login") as record:
+            response = get_session().post(login_url, headers=HEADERS_LOGIN, json=payload)
+            record.status = response.status_code
+            record.code = response_code(response.text)
         response.raise_for_status()
 
         token = response.json().get("data", {}).get("token")
@@ -109,7 +117,7 @@ def get_activity_type(token: str, sid: str) -> List | None:
     :return: 用户学校的活动类型信息
     """
     logger.info("开始获取本学校的活动类型")
-    type_url = "https://apis.pocketuni.net/apis/mapping/data"
+    type_url = api_url("/apis/mapping/data")
     payload = {
         "key": "eventFilter",
         "puType": 0
@@ -117,7 +125,10 @@ def get_activity_type(token: str, sid: str) -> List | None:
     headers = HEADERS_ACTIVITY.copy()
     headers['Authorization'] = f"Bearer {token}:{sid}"
     try:
-        response = requests.post(type_url, headers=headers, json=payload)
+        with governed("info") as record:
+            response = get_session().post(type_url, headers=headers, json=payload)
+            record.status = response.status_code
+            record.code = response_code(response.text)
         response.raise_for_status()
         res = []
         data = response.json().get("data", {}).get("list", [])
@@ -133,25 +144,41 @@ def get_activity_type(token: str, sid: str) -> List | None:
         return None
 
 
-def get_info(activity_id :  str, token : str, sid : str):
+def fetch_activity_info(activity_id : str, token : str, sid : str, timeout : float | None = None) -> Dict:
     """
-    获得单个活动的详细信息
+    请求单个活动的详细信息，不经过缓存
     :param activity_id: 活动id
+    :param timeout: 请求超时（秒）
     :return: 当前id活动的详细信息
+    :raise requests.exceptions.HTTPError: 响应状态码异常
     """
     headers = HEADERS_ACTIVITY.copy()
     headers['Authorization'] = f"Bearer {token}" + ":" + str(sid)
     payload = {"id": int(activity_id)}
+    with governed("info") as record:
+        response = get_session().post(api_url("/apis/activity/info"), headers=headers, json=payload,
+                                      timeout=timeout)
+        record.status = response.status_code
+        record.code = response_code(response.text)
+    response.raise_for_status()
+    info = response.json().get("data", {}).get("baseInfo", {})
+    from utils.state_store import get_state_store
+    store = get_state_store()
+    if store is not None and info:
+        store.save_activity_info(activity_id, info)
+    return info
+
+def get_info(activity_id :  str, token : str, sid : str):
+    """
+    获得单个活动的详细信息，优先使用进程内的活动信息缓存
+    :param activity_id: 活动id
+    :return: 当前id活动的详细信息
+    """
     try:
-        response = requests.post("https://apis.pocketuni.net/apis/activity/info", headers=headers, json=payload)
-        response.raise_for_status()
-        if response.status_code != 200:
-            logger.error(f"获取活动信息失败，响应: {response.text}")
-            return {}
+        return activity_info_cache.get(activity_id, lambda: fetch_activity_info(activity_id, token, sid))
     except requests.exceptions.HTTPError as e:
         logger.error(f"获取活动信息失败，HTTP错误: {str(e)}")
         return {}
-    return response.json().get("data", {}).get("baseInfo", {})
 
 def get_single_activity(activity_id : str, info : Dict):
     """
@@ -169,19 +196,57 @@ def get_single_activity(activity_id : str, info : Dict):
     logger.info(f"活动{activity_id} 的信息为解析完成")
     return a
 
-def get_allowed_activity_list(user : Dict) -> List:
+def is_valid_activity(info : Dict, college : str) -> bool:
     """
-    获取满足用户筛选需求的活动
+    判断当前活动是否满足用户筛选条件
+    :param info: 当前活动的详细信息
+    :param college: 用户所在院系
+    :return: True | False
+    """
+    if info.get("allowUserCount") - info.get("joinUserCount") <= 0:
+        return False
+    if info.get("allowTribe"): # 如果有allowTribe（活动部落）直接返回，这种是指定班级的，不需要抢
+        return False
+    # 虽然在请求时已经指定了状态为1，但是返回活动任然可能不是未开始，所以需要再次判断
+    if not info.get("statusName") == '未开始':
+        return False
+    if info.get("allowCollege") and not college in [t.get("name") for t in info.get("allowCollege")]:
+        return False
+    return True
 
-    :return: 满足要求的活动id列表
+def count_pages(total : int, page_size : int) -> int:
     """
-    logger.info("开始获取满足用户筛选条件的活动")
-    activity_url = "https://apis.pocketuni.net/apis/activity/list"
+    根据活动总数计算页数
+    :param total: 活动总数
+    :param page_size: 每页活动数
+    :return: 页数
+    """
+    return max(0, (total + page_size - 1) // page_size)
+
+def iter_activity_infos(user : Dict,
+                        max_workers : int | None = None,
+                        page_size : int | None = None,
+                        index = None) -> Iterator[Tuple[str, Dict]]:
+    """
+    并发获取活动列表（按用户的 categorys、allowYears、oids 在服务器端筛选）中每个活动的详细信息，
+    每获取到一个活动就立即返回给调用方，不判断是否满足报名条件。
+    请求速度由全局限速器中 list、info 的预算（config.GOVERNOR_BUDGETS）控制，所有同时进行的获取共用
+    :param user: 用户信息，需要包含 token 和 sid
+    :param max_workers: 最大并发请求数，默认取 config.DISCOVERY_MAX_WORKERS
+    :param page_size: 每页活动数，默认取 config.ACTIVITY_LIST_PAGE_SIZE
+    :param index: 活动索引（utils.activity_index.ActivityIndex），列表条目没变的活动直接使用索引中的详细信息
+    :return: (活动id, 详细信息) 迭代器
+    """
+    from config import DISCOVERY_MAX_WORKERS, ACTIVITY_LIST_PAGE_SIZE
+    max_workers = max_workers or DISCOVERY_MAX_WORKERS
+    page_size = page_size or ACTIVITY_LIST_PAGE_SIZE
+
+    activity_url = api_url("/apis/activity/list")
     headers = HEADERS_ACTIVITY.copy()
     headers['Authorization'] =f"Bearer {user.get('token')}" + ":" + str(user.get("sid"))
     payload = {
         "page": 1,
-        "limit":20,
+        "limit":page_size,
         "sort": 0,
         "puType": 0,
         "status": 1, # 1未开始，2进行中，3已结束
@@ -198,61 +263,147 @@ def get_allowed_activity_list(user : Dict) -> List:
     if oids:
         payload['oids'] = oids
 
-    logger.info(f"正在获取满足用户{user.get('userName')}筛选条件的活动，请求参数: {payload}")
-    try:
-        response = requests.post(activity_url, headers=headers, json=payload)
+    request_count = 0
+    reused = 0  # 直接使用索引中详细信息的活动数
+    count_lock = threading.Lock()
+
+    def count_request() -> None:
+        nonlocal request_count
+        with count_lock:
+            request_count += 1
+
+    def post_list(body : Dict) -> requests.Response:
+        count_request()
+        with governed("list") as record:
+            response = get_session().post(activity_url, headers=headers, json=body)
+            record.status = response.status_code
+            record.code = response_code(response.text)
         response.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        logger.error(f"获取活动列表失败，HTTP错误: {str(e)}")
-        return []
-    except Exception as e:
-        logger.error(f"获取活动列表失败，未知错误: {str(e)}")
-        return []
+        return response
 
-    def is_valid(info : Dict, college : str) -> bool:
-        """
-        判断当前活动是否满足用户筛选条件
-        :param info: 当前活动的详细信息
-        :return: True | False
-        """
-        if info.get("allowUserCount") - info.get("joinUserCount") <= 0:
-            return False
-        if info.get("allowTribe"): # 如果有allowTribe（活动部落）直接返回，这种是指定班级的，不需要抢
-            return False
-        # 虽然在请求时已经指定了状态为1，但是返回活动任然可能不是未开始，所以需要再次判断
-        if not info.get("statusName") == '未开始':
-            return False
-        if info.get("allowCollege") and not college in [t.get("name") for t in info.get("allowCollege")]:
-            return False
-        return True
+    def fetch_page(page : int) -> List[Dict]:
+        response = post_list({**payload, "page": page})
+        return response.json().get("data", {}).get("list", [])
+
+    def fetch_activity(item : Dict) -> Dict | None:
+        nonlocal reused
+        activity_id = item.get("id")
 
+        def fetch() -> Dict:
+            count_request()
+            return fetch_activity_info(activity_id, user.get('token'), user.get('sid'))
+
+        info = index.lookup(item) if index is not None else None
+        if info is not None:
+            with count_lock:
+                reused += 1
+        else:
+            try:
+                info = activity_info_cache.get(activity_id, fetch)
+            except requests.exceptions.HTTPError as e:
+                logger.error(f"获取活动 {activity_id} 信息失败，HTTP错误: {str(e)}")
+                return None
+            if not info:
+                return None
+            if index is not None:
+                index.update(activity_id, info)
+        return activity_id, info
+
+    logger.info(f"正在获取用户{user.get('userName')}的活动列表，请求参数: {payload}")
+    started = time.perf_counter()
     try:
-        pages = int(response.json().get('data').get('pageInfo').get("total",0))
+        data = post_list(payload).json().get('data')
+        # pageInfo.total 是活动总数而不是页数
+        pages = count_pages(int(data.get('pageInfo').get("total",0)), page_size)
+        first_page = data.get("list", [])
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"获取活动列表失败，HTTP错误: {str(e)}")
+        return
     except Exception as e:
         logger.error(f"获取活动列表失败，返回的数据格式错误: {str(e)}")
-        return []
-    activity_list = []
-    try:
-        for page in range(1, pages+1):
-            payload['page'] = page
-            response = requests.post(activity_url, headers=headers, json=payload)
-            response.raise_for_status()
-            for activity in response.json().get("data", {}).get("list", []):
-                info = get_info(activity.get("id"), user.get('token'), user.get('sid'))
-                if not is_valid(info,user.get("college")):
+        return
+
+    found = 0
+    next_page = 2
+    # 首页不满一页说明已经没有更多活动
+    last_page_seen = len(first_page) < page_size
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # future -> ("page", 页码) | ("info", 活动id)
+        pending = {}
+
+        def submit_pages() -> None:
+            # 同时最多只有 max_workers 个列表请求在途，遇到空页后不再继续翻页
+            nonlocal next_page
+            in_flight = sum(1 for kind, _ in pending.values() if kind == "page")
+            while not last_page_seen and next_page <= pages and in_flight < max_workers:
+                pending[executor.submit(fetch_page, next_page)] = ("page", next_page)
+                next_page += 1
+                in_flight += 1
+
+        for activity in first_page:
+            pending[executor.submit(fetch_activity, activity)] = ("info", activity.get("id"))
+        submit_pages()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, key = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if kind == "page":
+                        logger.error(f"获取活动列表第 {key} 页失败: {str(e)}")
+                    else:
+                        logger.error(f"获取活动 {key} 信息失败: {str(e)}")
                     continue
-                activity_list.append(get_single_activity(activity.get("id"), info))
 
-            time.sleep(0.5 + random.random() * (2 - 0.5))
-    except requests.exceptions.HTTPError as e:
-        logger.error(f"获取活动列表失败，HTTP错误: {str(e)}")
-        return []
-    except Exception as e:
-        logger.error(f"获取活动列表失败，未知错误: {str(e)}")
-        return []
+                if kind == "page":
+                    if len(result) < page_size:
+                        last_page_seen = True
+                    for activity in result:
+                        pending[executor.submit(fetch_activity, activity)] = ("info", activity.get("id"))
+                    submit_pages()
+                elif result:
+                    found += 1
+                    yield result
+
+    logger.info(f"获取活动列表成功，共有{found}个活动，"
+                f"耗时 {time.perf_counter() - started:.1f} 秒，共发送 {request_count} 个请求，"
+                f"{reused} 个活动使用了索引中的信息")
+
+def iter_allowed_activities(user : Dict,
+                            max_workers : int | None = None,
+                            page_size : int | None = None,
+                            index = None) -> Iterator[Dict]:
+    """
+    并发获取满足用户筛选需求的活动，每解析出一个满足条件的活动就立即返回给调用方
+    :param user: 用户信息
+    :param max_workers: 最大并发请求数，默认取 config.DISCOVERY_MAX_WORKERS
+    :param page_size: 每页活动数，默认取 config.ACTIVITY_LIST_PAGE_SIZE
+    :param index: 活动索引（utils.activity_index.ActivityIndex），列表条目没变的活动直接使用索引中的详细信息和判定结果
+    :return: 满足要求的活动信息迭代器
+    """
+    logger.info("开始获取满足用户筛选条件的活动")
+    college = user.get("college")
+    found = 0
+    for activity_id, info in iter_activity_infos(user, max_workers, page_size, index):
+        valid = index.verdict(activity_id, college) if index is not None else None
+        if valid is None:
+            valid = is_valid_activity(info, college)
+            if index is not None:
+                index.set_verdict(activity_id, college, valid)
+        if valid:
+            found += 1
+            yield get_single_activity(activity_id, info)
+    logger.info(f"获取满足用户筛选条件的活动成功，共有{found}个活动")
 
-    logger.info(f"获取满足用户筛选条件的活动成功，共有{len(activity_list)}个活动")
-    return activity_list
+def get_allowed_activity_list(user : Dict) -> List:
+    """
+    获取满足用户筛选需求的活动
+
+    :return: 满足要求的活动id列表
+    """
+    return list(iter_allowed_activities(user))
 
 def filter_activity_type(user : Dict) -> None:
     """
@@ -427,13 +578,27 @@ def make_fail_email(activity_id: str, user: dict) -> str:
     return email_content.strip()
 
 
-def send_email(email_info : str, addressee : str) -> bool:
+SUCCESS_EMAIL_SUBJECT = '🎉 PU活动报名成功通知'
+FAIL_EMAIL_SUBJECT = '😔 PU活动报名未成功通知'
+
+
+def send_email(email_info : str, addressee : str, subject : str = SUCCESS_EMAIL_SUBJECT) -> bool:
     """
-    发送报名成功邮件
+    发送报名结果邮件
     :param email_info: 邮件内容（HTML格式）
     :param addressee: 收件人邮箱地址
+    :param subject: 邮件标题
     :return: 发送成功返回True，失败返回False
     """
+    return send_emails([(email_info, addressee, subject)])[0]
+
+
+def send_emails(emails : List[Tuple[str, str, str]]) -> List[bool]:
+    """
+    批量发送邮件，所有邮件复用同一个SMTP连接
+    :param emails: (邮件内容（HTML格式）, 收件人邮箱地址, 邮件标题) 列表
+    :return: 每封邮件是否发送成功
+    """
     from dotenv import load_dotenv
     load_dotenv()
     import smtplib
@@ -441,53 +606,62 @@ def send_email(email_info : str, addressee : str) -> bool:
     from email.mime.text import MIMEText
     from email.mime.multipart import MIMEMultipart
     from email.header import Header
+    from email.utils import formataddr
+
+    results = [False] * len(emails)
     try:
         # 从环境变量获取邮件配置
         smtp_server = os.getenv("INFO_EMAIL_SERVER")  # QQ邮箱SMTP服务器
         smtp_port = int(os.getenv("INFO_EMAIL_PORT", "465"))  # 默认465端口
         sender_email = os.getenv("INFO_EMAIL_HOST", "").strip('"')
         sender_password = os.getenv("INFO_EMAIL_SMTP_PASS", "").strip('"')
-        
+
         # 检查配置是否完整
         if not sender_email or not sender_password:
             logger.warning("邮件配置不完整，请检查 .env 文件中的 INFO_EMAIL_HOST 和 INFO_EMAIL_SMTP_PASS 配置")
-            return False
-        
-        if not addressee or addressee.strip() == "":
-            logger.warning("收件人邮箱地址为空，无法发送邮件")
-            return False
-            
-        # 创建邮件对象
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = Header('🎉 PU活动报名成功通知', 'utf-8')
-        from email.utils import formataddr
-        msg['From'] = formataddr(('PU活动助手 ', sender_email))
-
-        msg['To'] = formataddr(("你", addressee))
-
-
-        # 添加HTML内容
-        html_part = MIMEText(email_info, 'html', 'utf-8')
-        msg.attach(html_part)
-        
-        # 连接SMTP服务器并发送邮件
-        logger.info(f"正在发送邮件到 {addressee}...")
-        
-        with smtplib.SMTP_SSL(smtp_server, smtp_port) as server:
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
-            server.quit()
-            
-        logger.success(f"邮件发送成功！收件人: {addressee}")
-        return True
-        
+            return results
+
+        server = None
+        try:
+            for i, (email_info, addressee, subject) in enumerate(emails):
+                if not addressee or addressee.strip() == "":
+                    logger.warning("收件人邮箱地址为空，无法发送邮件")
+                    continue
+
+                # 创建邮件对象
+                msg = MIMEMultipart('alternative')
+                msg['Subject'] = Header(subject, 'utf-8')
+                msg['From'] = formataddr(('PU活动助手 ', sender_email))
+                msg['To'] = formataddr(("你", addressee))
+
+                # 添加HTML内容
+                html_part = MIMEText(email_info, 'html', 'utf-8')
+                msg.attach(html_part)
+
+                # 第一封需要发送的邮件才建立连接，后续邮件复用
+                if server is None:
+                    server = smtplib.SMTP_SSL(smtp_server, smtp_port)
+                    server.login(sender_email, sender_password)
+
+                logger.info(f"正在发送邮件到 {addressee}...")
+                try:
+                    server.send_message(msg)
+                except smtplib.SMTPRecipientsRefused as e:
+                    logger.error(f"邮件发送失败：收件人 {addressee} 被拒绝 - {str(e)}")
+                    continue
+                results[i] = True
+                logger.success(f"邮件发送成功！收件人: {addressee}")
+        finally:
+            if server is not None:
+                try:
+                    server.quit()
+                except smtplib.SMTPException:
+                    pass
+
     except smtplib.SMTPAuthenticationError as e:
         logger.error(f"邮件发送失败：SMTP认证错误，请检查邮箱账号和授权码是否正确 - {str(e)}")
-        return False
     except smtplib.SMTPException as e:
         logger.error(f"邮件发送失败：SMTP错误 - {str(e)}")
-        return False
     except Exception as e:
         logger.error(f"邮件发送失败：未知错误 - {str(e)}")
-        return False
-
+    return results
@@ -1,12 +1,36 @@
 import json
 import os
-from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
 
+from utils.scheduler import SignupScheduler
 from utils.single import single_account
+from utils.state_store import get_state_store
 from loguru import logger
 
 
+def write_user_file(file_path: str, user_datas) -> None:
+    """
+    写入用户数据文件：先写临时文件再替换，写到一半退出不会损坏原文件
+    :param file_path: 用户数据文件路径
+    :param user_datas: 用户数据
+    """
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(user_datas, file, indent=4)
+    os.replace(tmp_path, file_path)
+
+
+def export_user_file(file_path: str, store) -> None:
+    """
+    把状态数据库中的用户写回用户数据文件，使文件与数据库保持一致；写回的内容之后不会被当作文件的修改重新导入
+    :param file_path: 用户数据文件路径
+    :param store: 状态数据库
+    """
+    users = store.load_users()
+    write_user_file(file_path, users)
+    store.mark_json_synced(file_path, users)
+
+
 class UserDataManager:
     def __init__(self, file_path):
         self.file_path = file_path
@@ -18,6 +42,16 @@ class UserDataManager:
         :return: 用户数据 or None
         """
         logger.info("开始加载用户数据")
+        store = get_state_store()
+        if store is not None:
+            # 数据库为准，user_data.json 有修改时先合并导入
+            store.import_json(self.file_path)
+            data = store.load_users()
+            if not data:
+                logger.warning("用户数据为空")
+                return None
+            return data
+
         if not os.path.exists(self.file_path):
             logger.warning("未找到用户数据文件，请检查文件路径是否正确")
             return None
@@ -38,8 +72,14 @@ class UserDataManager:
         写入用户数据
         :return: None
         """
-        with open(self.file_path, 'w', encoding='utf-8') as file:
-            json.dump(self.user_datas, file, indent=4)
+        store = get_state_store()
+        if store is not None:
+            # 只写入有变化的行，在一个事务中完成；再同步写回 user_data.json，之后手动修改文件时不会用旧内容覆盖数据库
+            store.save_users(self.user_datas)
+            export_user_file(self.file_path, store)
+            return
+
+        write_user_file(self.file_path, self.user_datas)
 
     def add_new_user(self):
         """
@@ -72,10 +112,10 @@ class UserDataManager:
         }
 
         token = ""
-        from utils.tools import get_token
+        from utils.token_manager import token_manager
         for i in range(3):
             logger.info("正在尝试登录...")
-            token = get_token(new_user)
+            token = token_manager.refresh(new_user)
             if token:
                 break
             else:
@@ -95,14 +135,26 @@ class UserDataManager:
         self.user_datas.append(new_user)
         logger.info(f"新用户添加成功: {new_user.get('userName')}")
 
+    def login_all(self) -> None:
+        """
+        启动时并发登录所有用户，登录成功的 token 写入用户数据，之后的处理不必再逐个登录
+        :return: None
+        """
+        from utils.token_manager import token_manager
+        tokens = token_manager.login_all(self.user_datas)
+        for user in self.user_datas:
+            if tokens.get(user['userName']):
+                user['token'] = tokens[user['userName']]
+
     def process_user(self,user : Dict) ->  None:
         """
         处理用户报名信息数据，获取用户预报名信息并获取筛选后的活动列表
         :return: None
         """
         logger.info(f"开始处理用户{user.get('userName')}报名信息数据")
-        from utils.tools import get_token
-        token = get_token(user)
+        from utils.token_manager import token_manager
+        # 上次保存的 token 仍在有效期内时不再登录
+        token = token_manager.get(user)
         if not token:
             logger.error("获取token失败，请检查用户名密码是否正确")
             return
@@ -110,22 +162,25 @@ class UserDataManager:
 
         flag = input(f"是否为用户{user.get('userName')}获取活动列表? [y/n]")
         if flag == 'y':
-            from utils.tools import get_allowed_activity_list, filter_activity_type
+            from utils.tools import iter_allowed_activities, filter_activity_type
+            from utils.activity_index import activity_index
             flag = input(f"是否为用户{user.get('userName')}获取指定类型的活动列表? [y/n]")
             activity_ids = []
             if flag == 'y':
                 filter_activity_type( user)
-                activities = get_allowed_activity_list(user)
-            else:
-                activities = get_allowed_activity_list(user)
 
-            print(f"共找到了{len( activities)}个满足需求的活动，以下是详细信息：")
-            for i, activity in enumerate(activities):
-                print(f"{i+1}: ")
+            # 边获取边展示，不必等待所有活动都解析完毕
+            found = 0
+            # 索引中列表条目没有变化的活动不再重新请求详细信息
+            for activity in iter_allowed_activities(user, index=activity_index):
+                found += 1
+                print(f"{found}: ")
                 for key, value in activity.items():
                     print(f"{key}: {value}")
                 if input("是否添加该活动? [y/n]") == 'y':
                     activity_ids.append(activity.get('activity_id'))
+            print(f"共找到了{found}个满足需求的活动")
+            activity_index.save()
 
             user['activity_ids'] = activity_ids
         logger.info(f"用户{user.get('userName')}处理完毕")
@@ -133,14 +188,17 @@ class UserDataManager:
 
     def sign_up(self):
         """
-        处理用户报名
+        处理用户报名，所有用户的所有活动由同一个调度器统一调度；
+        config.SIGNUP_PROCESSES 大于 1 时把用户分到多个子进程，每个子进程一个调度器
         :return: None
         """
         logger.info("开始处理用户报名任务")
-        with ThreadPoolExecutor() as executor:
-            futures = []
-            for user in self.user_datas:
-
-                futures.append(executor.submit(single_account, user))
-            for future in futures:
-                future.result()  # 等待所有线程完成
\ No newline at end of file
+        from config import SIGNUP_PROCESSES, SIGNUP_CPU_AFFINITY
+        if SIGNUP_PROCESSES > 1 and len(self.user_datas) > 1:
+            from utils.sharding import run_sharded
+            run_sharded(self.user_datas, SIGNUP_PROCESSES, SIGNUP_CPU_AFFINITY)
+            return
+        scheduler = SignupScheduler()
+        for user in self.user_datas:
+            single_account(user, scheduler)
+        scheduler.run()  # 等待所有任务完成
\ No newline at end of file